@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import DailyActivity, ActivityGoal, PlannedActivity, DailyGoal, AdditionalActivity
+from .models import DailyActivity, ActivityGoal, PlannedActivity, DailyGoal, AdditionalActivity, DailyAttendanceRollup
 
 
 class ActivityGoalInline(admin.TabularInline):
@@ -204,3 +204,16 @@ class ActivityGoalAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         })
     )
+
+
+@admin.register(DailyAttendanceRollup)
+class DailyAttendanceRollupAdmin(admin.ModelAdmin):
+    list_display = ('date', 'company', 'total_activities', 'checked_in', 'checked_out', 'attendance_on_time', 'attendance_late', 'attendance_absent', 'updated_at')
+    list_filter = ('company', 'date')
+    ordering = ('-date', 'company')
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,59 @@
+"""
+Coordinate helpers for DailyActivity check-in/check-out locations.
+
+Locations are entered as "lat,long" strings; these helpers turn them into floats and
+geohashes so spatial filters can use indexed columns instead of re-parsing strings.
+"""
+from typing import Optional, Tuple
+
+GEOHASH_PRECISION = 9  # ~5m x 5m cells
+_GEOHASH_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def parse_lat_long(value: str) -> Optional[Tuple[float, float]]:
+    """Parse a "lat,long" string into floats; None when empty, malformed or out of range."""
+    if not value:
+        return None
+    try:
+        lat, lon = value.split(',')
+        lat = float(lat.strip())
+        lon = float(lon.strip())
+    except (ValueError, AttributeError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
+
+
+def encode_geohash(lat: float, lon: float, precision: int = GEOHASH_PRECISION) -> str:
+    """Standard base32 geohash of a point."""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_GEOHASH_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(chars)
+
+
+def location_columns(value: str) -> Tuple[Optional[float], Optional[float], str]:
+    """(latitude, longitude, geohash) for a "lat,long" string; (None, None, '') when unparsable."""
+    coords = parse_lat_long(value)
+    if coords is None:
+        return None, None, ''
+    return coords[0], coords[1], encode_geohash(*coords)
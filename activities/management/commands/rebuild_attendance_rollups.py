@@ -0,0 +1,30 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from activities.models import DailyAttendanceRollup
+
+
+class Command(BaseCommand):
+    help = 'Rebuild per-company daily attendance rollups from DailyActivity rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start-date', help='First date to rebuild (YYYY-MM-DD)')
+        parser.add_argument('--end-date', help='Last date to rebuild (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        start_date = self._parse_date(options['start_date'])
+        end_date = self._parse_date(options['end_date'])
+        if start_date and end_date and start_date > end_date:
+            raise CommandError('--start-date must not be after --end-date')
+
+        count = DailyAttendanceRollup.rebuild(start_date, end_date)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} attendance rollups.'))
+
+    def _parse_date(self, value):
+        if not value:
+            return None
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f'Invalid date: {value} (expected YYYY-MM-DD)')
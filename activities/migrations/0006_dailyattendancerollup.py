@@ -0,0 +1,79 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_attendance_rollups(apps, schema_editor):
+    # Aggregation inlined (as of this migration) so later model changes cannot alter it
+    DailyActivity = apps.get_model('activities', 'DailyActivity')
+    DailyAttendanceRollup = apps.get_model('activities', 'DailyAttendanceRollup')
+    Count, Q = models.Count, models.Q
+    work_duration = models.ExpressionWrapper(
+        models.F('checkout_time') - models.F('checkin_time'), output_field=models.DurationField(),
+    )
+    grouped = (
+        DailyActivity.objects
+        .values('date', company_ref=models.F('user__employee_profile__company_id'))
+        .order_by()
+        .annotate(
+            total_activities=Count('id'),
+            status_pending=Count('id', filter=Q(status='pending')),
+            status_completed=Count('id', filter=Q(status='completed')),
+            status_early_checkout=Count('id', filter=Q(status='early_checkout')),
+            status_absent=Count('id', filter=Q(status='absent')),
+            attendance_on_time=Count('id', filter=Q(attendance_status='on_time')),
+            attendance_late=Count('id', filter=Q(attendance_status='late')),
+            attendance_early_checkout=Count('id', filter=Q(attendance_status='early_checkout')),
+            attendance_absent=Count('id', filter=Q(attendance_status='absent')),
+            checked_in=Count('id', filter=Q(checkin_time__isnull=False)),
+            checked_out=Count('id', filter=Q(checkout_time__isnull=False)),
+            work_duration=models.Sum(work_duration, filter=Q(checkin_time__isnull=False, checkout_time__isnull=False)),
+        )
+    )
+    rollups = []
+    for row in grouped:
+        day = row.pop('date')
+        company_id = row.pop('company_ref')
+        duration = row.pop('work_duration')
+        values = {key: value or 0 for key, value in row.items()}
+        values['work_seconds'] = max(0, int(duration.total_seconds())) if duration else 0
+        rollups.append(DailyAttendanceRollup(company_id=company_id, date=day, **values))
+    DailyAttendanceRollup.objects.bulk_create(rollups, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0005_alter_dailyactivity_checkin_location_and_more'),
+        ('employees', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyAttendanceRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('total_activities', models.PositiveIntegerField(default=0)),
+                ('status_pending', models.PositiveIntegerField(default=0)),
+                ('status_completed', models.PositiveIntegerField(default=0)),
+                ('status_early_checkout', models.PositiveIntegerField(default=0)),
+                ('status_absent', models.PositiveIntegerField(default=0)),
+                ('attendance_on_time', models.PositiveIntegerField(default=0)),
+                ('attendance_late', models.PositiveIntegerField(default=0)),
+                ('attendance_early_checkout', models.PositiveIntegerField(default=0)),
+                ('attendance_absent', models.PositiveIntegerField(default=0)),
+                ('checked_in', models.PositiveIntegerField(default=0)),
+                ('checked_out', models.PositiveIntegerField(default=0)),
+                ('work_seconds', models.PositiveBigIntegerField(default=0, help_text='Summed check-in to check-out time')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('company', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='attendance_rollups', to='employees.company')),
+            ],
+            options={
+                'ordering': ['-date', 'company'],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('company__isnull', False)), fields=('company', 'date'), name='unique_attendance_rollup_company_date'), models.UniqueConstraint(condition=models.Q(('company__isnull', True)), fields=('date',), name='unique_attendance_rollup_no_company_date')],
+            },
+        ),
+        migrations.RunPython(backfill_attendance_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:51
+
+from django.conf import settings
+from django.db import migrations, models
+
+from activities.geo import location_columns
+
+BACKFILL_BATCH_SIZE = 1000
+COORDINATE_FIELDS = [
+    'checkin_latitude', 'checkin_longitude', 'checkin_geohash',
+    'checkout_latitude', 'checkout_longitude', 'checkout_geohash',
+]
+
+
+def backfill_location_columns(apps, schema_editor):
+    DailyActivity = apps.get_model('activities', 'DailyActivity')
+    last_id = 0
+    while True:
+        batch = list(
+            DailyActivity.objects.filter(id__gt=last_id)
+            .order_by('id')
+            .only('id', 'checkin_location', 'checkout_location')[:BACKFILL_BATCH_SIZE]
+        )
+        if not batch:
+            break
+        for activity in batch:
+            (
+                activity.checkin_latitude, activity.checkin_longitude, activity.checkin_geohash,
+            ) = location_columns(activity.checkin_location)
+            (
+                activity.checkout_latitude, activity.checkout_longitude, activity.checkout_geohash,
+            ) = location_columns(activity.checkout_location)
+        DailyActivity.objects.bulk_update(batch, COORDINATE_FIELDS)
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0006_dailyattendancerollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailyactivity',
+            name='checkin_geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12),
+        ),
+        migrations.AddField(
+            model_name='dailyactivity',
+            name='checkin_latitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='dailyactivity',
+            name='checkin_longitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='dailyactivity',
+            name='checkout_geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12),
+        ),
+        migrations.AddField(
+            model_name='dailyactivity',
+            name='checkout_latitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='dailyactivity',
+            name='checkout_longitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='dailyactivity',
+            index=models.Index(fields=['checkin_latitude', 'checkin_longitude'], name='activity_checkin_latlon_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dailyactivity',
+            index=models.Index(fields=['checkout_latitude', 'checkout_longitude'], name='activity_checkout_latlon_idx'),
+        ),
+        migrations.RunPython(backfill_location_columns, migrations.RunPython.noop),
+    ]
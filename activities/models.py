@@ -1,8 +1,11 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Q, Sum
 from django.utils import timezone
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
 
+from .geo import location_columns
+
 User = get_user_model()
 
 def validate_lat_long(value):
@@ -14,6 +17,28 @@ def validate_lat_long(value):
                 raise ValidationError("Invalid latitude or longitude values")
         except Exception:
             raise ValidationError("Location must be in 'lat,long' format")
+
+
+# Derived coordinate columns kept in sync with each "lat,long" location field
+LOCATION_COLUMNS = {
+    'checkin_location': ('checkin_latitude', 'checkin_longitude', 'checkin_geohash'),
+    'checkout_location': ('checkout_latitude', 'checkout_longitude', 'checkout_geohash'),
+}
+
+
+class DailyActivityQuerySet(models.QuerySet):
+    """Spatial filters over the indexed coordinate columns"""
+    
+    def within_bbox(self, west, south, east, north, kind='checkin'):
+        """Activities whose check-in (or check-out) point lies inside the box"""
+        return self.filter(**{
+            f'{kind}_latitude__gte': south,
+            f'{kind}_latitude__lte': north,
+            f'{kind}_longitude__gte': west,
+            f'{kind}_longitude__lte': east,
+        })
+
+
 class DailyActivity(models.Model):
     """Daily activity tracking model"""
     
@@ -47,6 +72,9 @@ class DailyActivity(models.Model):
         validators=[validate_lat_long],
         help_text="Format: lat,long"
     )
+    checkin_latitude = models.FloatField(null=True, blank=True, editable=False)
+    checkin_longitude = models.FloatField(null=True, blank=True, editable=False)
+    checkin_geohash = models.CharField(max_length=12, blank=True, db_index=True, editable=False)
     
     # Morning Problems (keeping as text field)
     morning_problems = models.TextField(
@@ -62,6 +90,9 @@ class DailyActivity(models.Model):
         validators=[validate_lat_long],
         help_text="Format: lat,long"
     )
+    checkout_latitude = models.FloatField(null=True, blank=True, editable=False)
+    checkout_longitude = models.FloatField(null=True, blank=True, editable=False)
+    checkout_geohash = models.CharField(max_length=12, blank=True, db_index=True, editable=False)
     
     # Afternoon Problems (keeping as text field)
     afternoon_problems = models.TextField(
@@ -79,13 +110,36 @@ class DailyActivity(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = DailyActivityQuerySet.as_manager()
+    
     class Meta:
         unique_together = ['user', 'date']
         ordering = ['-date', 'user__email']
+        indexes = [
+            models.Index(fields=['checkin_latitude', 'checkin_longitude'], name='activity_checkin_latlon_idx'),
+            models.Index(fields=['checkout_latitude', 'checkout_longitude'], name='activity_checkout_latlon_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.full_name} - {self.date}"
     
+    def sync_location_columns(self):
+        """Refresh latitude/longitude/geohash columns from the "lat,long" location strings"""
+        for location_field, columns in LOCATION_COLUMNS.items():
+            for column, value in zip(columns, location_columns(getattr(self, location_field))):
+                setattr(self, column, value)
+    
+    def save(self, *args, **kwargs):
+        self.sync_location_columns()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            for location_field, columns in LOCATION_COLUMNS.items():
+                if location_field in update_fields:
+                    update_fields.update(columns)
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
+    
     @property
     def is_checked_in(self):
         """Check if user has checked in"""
@@ -357,3 +411,227 @@ class ActivityGoal(models.Model):
     
     def __str__(self):
         return f"{self.title} - {self.daily_activity.user.full_name}"
+
+
+def attendance_rollup_aggregates():
+    """Aggregate expressions over DailyActivity rows that feed DailyAttendanceRollup"""
+    work_duration = ExpressionWrapper(F('checkout_time') - F('checkin_time'), output_field=DurationField())
+    return {
+        'total_activities': Count('id'),
+        'status_pending': Count('id', filter=Q(status='pending')),
+        'status_completed': Count('id', filter=Q(status='completed')),
+        'status_early_checkout': Count('id', filter=Q(status='early_checkout')),
+        'status_absent': Count('id', filter=Q(status='absent')),
+        'attendance_on_time': Count('id', filter=Q(attendance_status='on_time')),
+        'attendance_late': Count('id', filter=Q(attendance_status='late')),
+        'attendance_early_checkout': Count('id', filter=Q(attendance_status='early_checkout')),
+        'attendance_absent': Count('id', filter=Q(attendance_status='absent')),
+        'checked_in': Count('id', filter=Q(checkin_time__isnull=False)),
+        'checked_out': Count('id', filter=Q(checkout_time__isnull=False)),
+        'work_duration': Sum(
+            work_duration,
+            filter=Q(checkin_time__isnull=False, checkout_time__isnull=False),
+        ),
+    }
+
+
+# DailyActivity fields a rollup bucket is computed from
+ROLLUP_SOURCE_FIELDS = ('user_id', 'date', 'status', 'attendance_status', 'checkin_time', 'checkout_time')
+
+
+def attendance_rollup_state(activity):
+    """ROLLUP_SOURCE_FIELDS of a DailyActivity instance, as .values() would return them"""
+    return {field: getattr(activity, field) for field in ROLLUP_SOURCE_FIELDS}
+
+
+def attendance_rollup_contribution(state):
+    """DailyAttendanceRollup field -> amount one activity in state (ROLLUP_SOURCE_FIELDS) adds to its bucket"""
+    contribution = {'total_activities': 1}
+    if state['status'] in ('pending', 'completed', 'early_checkout', 'absent'):
+        contribution[f"status_{state['status']}"] = 1
+    if state['attendance_status'] in ('on_time', 'late', 'early_checkout', 'absent'):
+        contribution[f"attendance_{state['attendance_status']}"] = 1
+    if state['checkin_time']:
+        contribution['checked_in'] = 1
+    if state['checkout_time']:
+        contribution['checked_out'] = 1
+    if state['checkin_time'] and state['checkout_time']:
+        # Whole seconds per activity; rebuild() sums the exact durations, so the two can
+        # differ by under a second per activity
+        contribution['work_seconds'] = int((state['checkout_time'] - state['checkin_time']).total_seconds())
+    return contribution
+
+
+def attendance_rollup_values(totals):
+    """Convert an attendance_rollup_aggregates() result into DailyAttendanceRollup field values"""
+    values = {key: value or 0 for key, value in totals.items() if key != 'work_duration'}
+    work_duration = totals.get('work_duration')
+    values['work_seconds'] = max(0, int(work_duration.total_seconds())) if work_duration else 0
+    return values
+
+
+class DailyAttendanceRollup(models.Model):
+    """
+    Per-company, per-day attendance counters, kept in step by activities.signals.
+
+    A DailyActivity save or delete moves that activity's contribution between buckets with
+    UPDATE ... SET field = field + delta (apply_change), so a check-in costs the same however
+    many the company already had. Full recomputes (refresh, rebuild) are the repair path:
+    for a bucket that does not exist yet or would go negative, for an Employee changing
+    company, and for writes that skip signals (queryset.update(), bulk_create()), which the
+    nightly rebuild_attendance_rollups command catches up with.
+    """
+    
+    # Activities of users without an employee profile are rolled up with company=None
+    company = models.ForeignKey(
+        'employees.Company',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='attendance_rollups'
+    )
+    date = models.DateField()
+    
+    # Counts by DailyActivity.status
+    total_activities = models.PositiveIntegerField(default=0)
+    status_pending = models.PositiveIntegerField(default=0)
+    status_completed = models.PositiveIntegerField(default=0)
+    status_early_checkout = models.PositiveIntegerField(default=0)
+    status_absent = models.PositiveIntegerField(default=0)
+    
+    # Counts by DailyActivity.attendance_status
+    attendance_on_time = models.PositiveIntegerField(default=0)
+    attendance_late = models.PositiveIntegerField(default=0)
+    attendance_early_checkout = models.PositiveIntegerField(default=0)
+    attendance_absent = models.PositiveIntegerField(default=0)
+    
+    # Check-in/check-out totals
+    checked_in = models.PositiveIntegerField(default=0)
+    checked_out = models.PositiveIntegerField(default=0)
+    work_seconds = models.PositiveBigIntegerField(default=0, help_text="Summed check-in to check-out time")
+    
+    # Timestamps
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-date', 'company']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['company', 'date'],
+                condition=Q(company__isnull=False),
+                name='unique_attendance_rollup_company_date',
+            ),
+            models.UniqueConstraint(
+                fields=['date'],
+                condition=Q(company__isnull=True),
+                name='unique_attendance_rollup_no_company_date',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.company or 'No company'} - {self.date}"
+    
+    @staticmethod
+    def activities_for(company_id, day):
+        """DailyActivity rows that roll up into the (company, day) bucket"""
+        activities = DailyActivity.objects.filter(date=day)
+        if company_id is None:
+            return activities.filter(user__employee_profile__isnull=True)
+        return activities.filter(user__employee_profile__company_id=company_id)
+    
+    @classmethod
+    def refresh(cls, company_id, day):
+        """
+        Recompute one (company, day) bucket from its DailyActivity rows.
+
+        The rollup row is locked before aggregating, so concurrent writers to the bucket
+        serialize here and the last one sees every committed row.
+        """
+        with transaction.atomic():
+            rollup, _ = cls.objects.select_for_update().get_or_create(company_id=company_id, date=day)
+            totals = cls.activities_for(company_id, day).aggregate(**attendance_rollup_aggregates())
+            for field, value in attendance_rollup_values(totals).items():
+                setattr(rollup, field, value)
+            rollup.save()
+        return rollup
+    
+    @classmethod
+    def add_to_bucket(cls, company_id, day, delta):
+        """Add delta (field -> amount) to one bucket; recomputes it when missing or it would go negative"""
+        changes = {field: F(field) + amount for field, amount in delta.items() if amount}
+        if not changes:
+            return
+        try:
+            with transaction.atomic():
+                updated = cls.objects.filter(company_id=company_id, date=day).update(
+                    updated_at=timezone.now(), **changes,
+                )
+        except IntegrityError:
+            # A counter below zero: the bucket missed a write that skipped signals
+            updated = 0
+        if not updated:
+            cls.refresh(company_id, day)
+    
+    @classmethod
+    def apply_change(cls, old_state, new_state):
+        """
+        Move one DailyActivity's contribution from old_state to new_state (dicts of
+        ROLLUP_SOURCE_FIELDS; None for a created or deleted activity). Call inside the
+        transaction that wrote the activity.
+        """
+        from employees.models import Employee
+        if old_state == new_state:
+            return
+        companies = {}
+        deltas = {}
+        for state, sign in ((old_state, -1), (new_state, 1)):
+            if state is None:
+                continue
+            user_id = state['user_id']
+            if user_id not in companies:
+                # Looked up, so it also works while the activity is being deleted
+                companies[user_id] = (
+                    Employee.objects.filter(user_id=user_id).values_list('company_id', flat=True).first()
+                )
+            delta = deltas.setdefault((companies[user_id], state['date']), {})
+            for field, amount in attendance_rollup_contribution(state).items():
+                delta[field] = delta.get(field, 0) + sign * amount
+        for (company_id, day), delta in deltas.items():
+            cls.add_to_bucket(company_id, day, delta)
+    
+    @classmethod
+    def refresh_for_user(cls, user_id, company_ids):
+        """Recompute the buckets of every day user_id has activities, for each of company_ids"""
+        days = DailyActivity.objects.filter(user_id=user_id).values_list('date', flat=True).distinct()
+        for day in days:
+            for company_id in company_ids:
+                cls.refresh(company_id, day)
+    
+    @classmethod
+    def rebuild(cls, start_date=None, end_date=None):
+        """Rebuild all buckets (optionally within a date range) with one grouped query"""
+        activities = DailyActivity.objects.all()
+        rollups = cls.objects.all()
+        if start_date:
+            activities = activities.filter(date__gte=start_date)
+            rollups = rollups.filter(date__gte=start_date)
+        if end_date:
+            activities = activities.filter(date__lte=end_date)
+            rollups = rollups.filter(date__lte=end_date)
+        
+        grouped = (
+            activities
+            .values('date', company_ref=F('user__employee_profile__company_id'))
+            .order_by()
+            .annotate(**attendance_rollup_aggregates())
+        )
+        new_rollups = []
+        for row in grouped:
+            day = row.pop('date')
+            company_id = row.pop('company_ref')
+            new_rollups.append(cls(company_id=company_id, date=day, **attendance_rollup_values(row)))
+        
+        with transaction.atomic():
+            rollups.delete()
+            cls.objects.bulk_create(new_rollups, batch_size=500)
+        return len(new_rollups)
@@ -0,0 +1,57 @@
+"""
+Keyset (cursor) pagination for a user's DailyActivity history.
+
+Pages are ordered by (date, id) descending and continue strictly after the last row of
+the previous page, so the cost of a page does not depend on how far back it is.
+"""
+import base64
+from datetime import date
+
+from django.conf import settings
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(activity):
+    raw = f'{activity.date.isoformat()}|{activity.id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(value):
+    """(date, id) from an opaque cursor; None for an empty cursor."""
+    if not value:
+        return None
+    try:
+        padded = value + '=' * (-len(value) % 4)
+        raw_date, raw_id = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        return date.fromisoformat(raw_date), int(raw_id)
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidCursor(f'Invalid cursor: {value!r}')
+
+
+def page_size_from(request):
+    """?page_size=N clamped to [1, ACTIVITY_LIST_MAX_PAGE_SIZE]; default ACTIVITY_LIST_PAGE_SIZE."""
+    try:
+        size = int(request.GET.get('page_size', settings.ACTIVITY_LIST_PAGE_SIZE))
+    except ValueError:
+        size = settings.ACTIVITY_LIST_PAGE_SIZE
+    return max(1, min(size, settings.ACTIVITY_LIST_MAX_PAGE_SIZE))
+
+
+def keyset_page(queryset, cursor, page_size):
+    """
+    One page of queryset after cursor. Returns (items, next_cursor); next_cursor is
+    None on the last page.
+    """
+    queryset = queryset.order_by('-date', '-id')
+    if cursor is not None:
+        after_date, after_id = cursor
+        queryset = queryset.filter(Q(date__lt=after_date) | Q(date=after_date, id__lt=after_id))
+    items = list(queryset[:page_size + 1])
+    if len(items) > page_size:
+        items = items[:page_size]
+        return items, encode_cursor(items[-1])
+    return items, None
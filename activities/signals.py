@@ -0,0 +1,62 @@
+"""
+Keep DailyAttendanceRollup buckets in step with the rows they are computed from.
+
+Activity writes apply deltas inside the writing transaction (see
+DailyAttendanceRollup.apply_change); employee company changes recompute the user's
+buckets. Admin edits and bulk deletes go through save() and queryset.delete(), which send
+these signals for every row.
+"""
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from employees.models import Employee
+
+from .models import ROLLUP_SOURCE_FIELDS, DailyActivity, DailyAttendanceRollup, attendance_rollup_state
+
+
+@receiver(pre_save, sender=DailyActivity)
+def remember_rollup_state(sender, instance, raw=False, **kwargs):
+    """Keep the stored state an existing activity is being changed from"""
+    if instance.pk and not raw:
+        instance._rollup_previous_state = (
+            DailyActivity.objects.filter(pk=instance.pk).values(*ROLLUP_SOURCE_FIELDS).first()
+        )
+
+
+@receiver(post_save, sender=DailyActivity)
+def update_activity_rollup(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = None if created else getattr(instance, '_rollup_previous_state', None)
+    DailyAttendanceRollup.apply_change(previous, attendance_rollup_state(instance))
+
+
+@receiver(post_delete, sender=DailyActivity)
+def remove_activity_from_rollup(sender, instance, **kwargs):
+    DailyAttendanceRollup.apply_change(attendance_rollup_state(instance), None)
+
+
+@receiver(pre_save, sender=Employee)
+def remember_rollup_company(sender, instance, raw=False, **kwargs):
+    """Keep the company an existing employee is moving away from"""
+    if instance.pk and not raw:
+        instance._rollup_previous_company_id = (
+            Employee.objects.filter(pk=instance.pk).values_list('company_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Employee)
+def move_employee_rollups(sender, instance, created, raw=False, **kwargs):
+    """A new profile or a company change moves the user's activities between buckets"""
+    if raw:
+        return
+    # Without a profile the activities were rolled up with company=None
+    previous = None if created else getattr(instance, '_rollup_previous_company_id', instance.company_id)
+    if previous != instance.company_id:
+        DailyAttendanceRollup.refresh_for_user(instance.user_id, {previous, instance.company_id})
+
+
+@receiver(post_delete, sender=Employee)
+def release_employee_rollups(sender, instance, **kwargs):
+    """The user's activities fall back to the company=None buckets"""
+    DailyAttendanceRollup.refresh_for_user(instance.user_id, {instance.company_id, None})
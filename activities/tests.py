@@ -1,3 +1,289 @@
-from django.test import TestCase
+from datetime import date, datetime, time, timedelta
+from importlib import import_module
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from employees.models import Company, Employee
+
+from .geo import encode_geohash, location_columns, parse_lat_long
+from .models import DailyActivity, DailyAttendanceRollup
+from .pagination import InvalidCursor, decode_cursor, encode_cursor, keyset_page
+
+User = get_user_model()
+
+
+class AttendanceRollupTests(TestCase):
+    """DailyAttendanceRollup buckets follow activity, employee and admin writes"""
+
+    def setUp(self):
+        self.day = date(2025, 3, 3)
+        self.company = Company.objects.create(name='Arnatech', code='ARN')
+        self.other = Company.objects.create(name='Other', code='OTH')
+        self.user = User.objects.create(sso_id='emp1', email='emp1@example.com')
+        self.employee = Employee.objects.create(
+            user=self.user, employee_id='E1', full_name='Emp1', company=self.company,
+            position='Engineer', hire_date=self.day,
+        )
+
+    def _activity(self, user=None, day=None, checked_out=False, **fields):
+        day = day or self.day
+        return DailyActivity.objects.create(
+            user=user or self.user,
+            date=day,
+            checkin_time=timezone.make_aware(datetime.combine(day, time(8, 0))),
+            checkout_time=timezone.make_aware(datetime.combine(day, time(17, 0))) if checked_out else None,
+            checkin_location='-6.2,106.8',
+            **fields,
+        )
+
+    def _rollup(self, company):
+        return DailyAttendanceRollup.objects.filter(company=company, date=self.day).first()
+
+    def test_activity_writes_refresh_the_bucket(self):
+        activity = self._activity(attendance_status='late')
+        rollup = self._rollup(self.company)
+        self.assertEqual((rollup.total_activities, rollup.checked_in, rollup.attendance_late), (1, 1, 1))
+
+        activity.checkout_time = timezone.make_aware(datetime.combine(self.day, time(16, 0)))
+        activity.save()
+        rollup.refresh_from_db()
+        self.assertEqual((rollup.checked_out, rollup.work_seconds), (1, 8 * 3600))
+
+        activity.delete()
+        rollup.refresh_from_db()
+        self.assertEqual(rollup.total_activities, 0)
+
+    def test_employee_changing_company_moves_the_buckets(self):
+        self._activity()
+
+        self.employee.company = self.other
+        self.employee.save()
+
+        self.assertEqual(self._rollup(self.company).total_activities, 0)
+        self.assertEqual(self._rollup(self.other).total_activities, 1)
+
+    def test_deleted_employee_falls_back_to_no_company(self):
+        self._activity()
+
+        self.employee.delete()
+
+        self.assertEqual(self._rollup(self.company).total_activities, 0)
+        self.assertEqual(self._rollup(None).total_activities, 1)
+
+    def test_admin_bulk_delete_refreshes(self):
+        second = User.objects.create(sso_id='emp2', email='emp2@example.com')
+        Employee.objects.create(
+            user=second, employee_id='E2', full_name='Emp2', company=self.company,
+            position='Engineer', hire_date=self.day,
+        )
+        self._activity()
+        self._activity(user=second)
+        self.assertEqual(self._rollup(self.company).total_activities, 2)
+
+        model_admin = admin.site._registry[DailyActivity]
+        model_admin.delete_queryset(RequestFactory().post('/'), DailyActivity.objects.all())
+
+        self.assertEqual(self._rollup(self.company).total_activities, 0)
+
+    def test_check_ins_add_deltas_without_recomputing(self):
+        self._activity()
+        others = []
+        for n in range(2, 5):
+            user = User.objects.create(sso_id=f'emp{n}', email=f'emp{n}@example.com')
+            Employee.objects.create(
+                user=user, employee_id=f'E{n}', full_name=f'Emp{n}', company=self.company,
+                position='Engineer', hire_date=self.day,
+            )
+            others.append(user)
+
+        # The bucket exists now: later writes are single UPDATEs, never a re-aggregation
+        with mock.patch.object(DailyAttendanceRollup, 'refresh') as refresh:
+            activities = [self._activity(user=user, attendance_status='late') for user in others]
+            activities[0].checkout_time = timezone.make_aware(datetime.combine(self.day, time(12, 0)))
+            activities[0].status = 'early_checkout'
+            activities[0].save()
+            activities[1].delete()
+        refresh.assert_not_called()
+
+        rollup = self._rollup(self.company)
+        self.assertEqual(
+            (rollup.total_activities, rollup.attendance_late, rollup.checked_out, rollup.status_early_checkout),
+            (3, 2, 1, 1),
+        )
+        self.assertEqual(rollup.work_seconds, 4 * 3600)
+
+    def test_moving_an_activity_to_another_day_moves_its_counts(self):
+        activity = self._activity()
+        activity.date = date(2025, 3, 4)
+        activity.save()
+
+        self.assertEqual(self._rollup(self.company).total_activities, 0)
+        self.assertEqual(
+            DailyAttendanceRollup.objects.get(company=self.company, date=date(2025, 3, 4)).total_activities, 1,
+        )
+
+    def test_drifted_bucket_is_recomputed_instead_of_going_negative(self):
+        activity = self._activity(attendance_status='late')
+        # A write that skipped signals left the bucket without this activity
+        DailyAttendanceRollup.objects.update(attendance_late=0)
+
+        activity.attendance_status = 'on_time'
+        activity.save()
+
+        rollup = self._rollup(self.company)
+        self.assertEqual((rollup.attendance_late, rollup.attendance_on_time), (0, 1))
+
+    def test_rebuild_matches_refresh(self):
+        self._activity(checked_out=True, status='completed', attendance_status='on_time')
+        self._activity(day=date(2025, 3, 4))
+        # Writes that skip signals leave the buckets stale until a rebuild
+        DailyActivity.objects.filter(date=self.day).update(attendance_status='late')
+        refreshed_late = self._rollup(self.company).attendance_late
+
+        self.assertEqual(DailyAttendanceRollup.rebuild(), 2)
+
+        rollup = self._rollup(self.company)
+        self.assertEqual(refreshed_late, 0)
+        self.assertEqual((rollup.total_activities, rollup.status_completed, rollup.attendance_late), (1, 1, 1))
+        self.assertEqual(rollup.work_seconds, 9 * 3600)
+
+    def test_rebuild_of_a_date_range_keeps_other_days(self):
+        self._activity()
+        self._activity(day=date(2025, 3, 4))
+
+        self.assertEqual(DailyAttendanceRollup.rebuild(start_date=date(2025, 3, 4)), 1)
+
+        self.assertEqual(DailyAttendanceRollup.objects.count(), 2)
+
+
+class GeohashTests(SimpleTestCase):
+    """Coordinate parsing and geohash encoding of "lat,long" strings"""
+
+    def test_known_geohashes(self):
+        self.assertEqual(encode_geohash(57.64911, 10.40744, precision=11), 'u4pruydqqvj')
+        self.assertEqual(encode_geohash(42.6, -5.6, precision=5), 'ezs42')
+        self.assertEqual(len(encode_geohash(-6.2, 106.8)), 9)
+
+    def test_unparsable_locations_have_no_columns(self):
+        self.assertEqual(parse_lat_long(' -6.2 , 106.8 '), (-6.2, 106.8))
+        for value in ('', None, 'nowhere', '1,2,3', '91,0', '0,181'):
+            self.assertIsNone(parse_lat_long(value), value)
+        self.assertEqual(location_columns('91,0'), (None, None, ''))
+
+
+class LocationColumnTests(TestCase):
+    """DailyActivity keeps latitude/longitude/geohash columns in step with its location strings"""
+
+    def setUp(self):
+        self.user = User.objects.create(sso_id='emp1', email='emp1@example.com')
+
+    def _columns(self, activity):
+        return DailyActivity.objects.values_list(
+            'checkin_latitude', 'checkin_longitude', 'checkin_geohash', 'checkout_geohash',
+        ).get(pk=activity.pk)
+
+    def test_save_fills_the_columns(self):
+        activity = DailyActivity.objects.create(user=self.user, date=date(2025, 3, 3), checkin_location='-6.2,106.8')
+
+        self.assertEqual(self._columns(activity), (-6.2, 106.8, encode_geohash(-6.2, 106.8), ''))
+        self.assertEqual(
+            list(DailyActivity.objects.within_bbox(106.7, -6.3, 106.9, -6.1)), [activity],
+        )
+
+    def test_update_fields_save_includes_the_derived_columns(self):
+        activity = DailyActivity.objects.create(user=self.user, date=date(2025, 3, 3), checkin_location='-6.2,106.8')
+
+        activity.checkin_location = '-8.65,115.2'
+        activity.checkout_location = 'bad'
+        activity.save(update_fields=['checkin_location', 'checkout_location'])
+
+        self.assertEqual(self._columns(activity), (-8.65, 115.2, encode_geohash(-8.65, 115.2), ''))
+
+    def test_backfill_migration_walks_in_batches(self):
+        migration = import_module('activities.migrations.0007_dailyactivity_location_coordinates')
+        for day in range(1, 6):
+            DailyActivity.objects.create(
+                user=self.user, date=date(2025, 3, day),
+                checkin_location=f'-6.{day},106.8', checkout_location='-6.2,106.9',
+            )
+        # Rows as they were before the columns existed
+        DailyActivity.objects.update(
+            checkin_latitude=None, checkin_longitude=None, checkin_geohash='',
+            checkout_latitude=None, checkout_longitude=None, checkout_geohash='',
+        )
+
+        with mock.patch.object(migration, 'BACKFILL_BATCH_SIZE', 2), \
+                mock.patch.object(DailyActivity.objects, 'bulk_update', wraps=DailyActivity.objects.bulk_update) as bulk_update:
+            migration.backfill_location_columns(apps, None)
+
+        self.assertEqual([len(call.args[0]) for call in bulk_update.call_args_list], [2, 2, 1])
+
+        for activity in DailyActivity.objects.all():
+            self.assertEqual(activity.checkin_latitude, float(activity.checkin_location.split(',')[0]))
+            self.assertEqual(activity.checkout_geohash, encode_geohash(-6.2, 106.9))
+
+
+@override_settings(ACTIVITY_LIST_PAGE_SIZE=2, ACTIVITY_LIST_MAX_PAGE_SIZE=3)
+class ActivityListPaginationTests(TestCase):
+    """Keyset pages of the activity list: (date, id) cursor, ties and page-size clamp"""
+
+    def setUp(self):
+        self.user = User.objects.create(sso_id='emp1', email='emp1@example.com')
+        self.client.force_login(self.user)
+        start = date(2025, 3, 1)
+        self.activities = [
+            DailyActivity.objects.create(user=self.user, date=start + timedelta(days=n)) for n in range(5)
+        ]
+
+    def _page(self, **params):
+        return self.client.get(reverse('activities:activity_list_api'), params)
+
+    def test_pages_follow_the_cursor_without_gaps_or_repeats(self):
+        seen = []
+        params = {}
+        while True:
+            data = self._page(**params).json()
+            seen.extend(item['id'] for item in data['results'])
+            if not data['next_cursor']:
+                break
+            params = {'cursor': data['next_cursor']}
+
+        self.assertEqual(seen, [activity.id for activity in reversed(self.activities)])
+
+    def test_rows_sharing_a_date_are_split_by_id(self):
+        day = date(2025, 3, 10)
+        same_day = [
+            DailyActivity.objects.create(user=User.objects.create(sso_id=f'tie{n}', email=f'tie{n}@example.com'), date=day)
+            for n in range(3)
+        ]
+        queryset = DailyActivity.objects.filter(date=day)
+
+        first, cursor = keyset_page(queryset, None, 2)
+        second, last_cursor = keyset_page(queryset, decode_cursor(cursor), 2)
+
+        self.assertEqual([a.id for a in first + second], [a.id for a in reversed(same_day)])
+        self.assertIsNone(last_cursor)
+
+    def test_cursor_round_trip_and_malformed_cursor(self):
+        activity = self.activities[2]
+        self.assertEqual(decode_cursor(encode_cursor(activity)), (activity.date, activity.id))
+        self.assertIsNone(decode_cursor(''))
+        for value in ('not-a-cursor', 'MjAyNS0xMy0wMXwx', '!!'):
+            with self.assertRaises(InvalidCursor):
+                decode_cursor(value)
+
+        response = self._page(cursor='not-a-cursor')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Invalid cursor'})
+
+    def test_page_size_is_clamped(self):
+        self.assertEqual(len(self._page().json()['results']), 2)
+        self.assertEqual(len(self._page(page_size=0).json()['results']), 1)
+        self.assertEqual(len(self._page(page_size=1000).json()['results']), 3)
+        self.assertEqual(len(self._page(page_size='lots').json()['results']), 2)
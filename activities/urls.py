@@ -25,4 +25,5 @@ urlpatterns = [
     path('api/check-in/', views.check_in_api, name='check_in_api'),
     path('api/check-out/', views.check_out_api, name='check_out_api'),
     path('api/status/', views.activity_status_api, name='activity_status_api'),
+    path('api/list/', views.activity_list_api, name='activity_list_api'),
 ] 
\ No newline at end of file
@@ -4,7 +4,11 @@ from django.contrib import messages
 from django.utils import timezone
 from django.http import JsonResponse
 from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.template.loader import render_to_string
 from .models import DailyActivity, ActivityGoal, PlannedActivity, DailyGoal, AdditionalActivity
+from .pagination import InvalidCursor, decode_cursor, keyset_page, page_size_from
 from datetime import date, datetime
 import json
 import pytz
@@ -433,20 +437,46 @@ def daily_summary_view(request, activity_id=None):
     return render(request, 'activities/daily_summary.html', context)
 
 
-@login_required
-def activity_history_view(request):
-    """Display activity history"""
-    activities = DailyActivity.objects.filter(user=request.user).prefetch_related(
-        'planned_activities', 'daily_goals', 'additional_activities', 'goals'
-    ).order_by('-date')[:30]
-    
-    context = {
+def _child_count(model):
+    """Correlated COUNT of a DailyActivity child relation (no prefetch of the rows)"""
+    counts = (
+        model.objects.filter(daily_activity=OuterRef('pk'))
+        .order_by()
+        .values('daily_activity')
+        .annotate(total=Count('id'))
+        .values('total')
+    )
+    return Coalesce(Subquery(counts), 0)
+
+
+def _activity_page(request):
+    """
+    One keyset page of the user's activities with child counts annotated.
+    Raises InvalidCursor for a malformed ?cursor=.
+    """
+    activities = DailyActivity.objects.filter(user=request.user).annotate(
+        planned_count=_child_count(PlannedActivity),
+        goals_count=_child_count(DailyGoal),
+        additional_count=_child_count(AdditionalActivity),
+    )
+    cursor = decode_cursor(request.GET.get('cursor'))
+    return keyset_page(activities, cursor, page_size_from(request))
+
+
+def _activity_list_context(request, activities, next_cursor):
+    return {
         'user': request.user,
         'activities': activities,
+        'next_cursor': next_cursor,
+        'today': date.today(),
         'has_employee_profile': hasattr(request.user, 'employee_profile'),
     }
-    
-    return render(request, 'activities/history.html', context)
+
+
+@login_required
+def activity_history_view(request):
+    """Display activity history (same keyset pages as the activity list)"""
+    return activity_list_view(request)
 
 
 @login_required
@@ -473,21 +503,45 @@ def activity_detail_view(request, activity_id):
 
 @login_required
 def activity_list_view(request):
-    """Display list of all activities for the user"""
-    activities = DailyActivity.objects.filter(user=request.user).prefetch_related(
-        'planned_activities', 'daily_goals', 'additional_activities', 'goals'
-    ).order_by('-date')
-    
-    context = {
-        'user': request.user,
-        'activities': activities,
-        'today': date.today(),
-        'has_employee_profile': hasattr(request.user, 'employee_profile'),
-    }
+    """Display the user's activities, newest first, one keyset page at a time"""
+    try:
+        activities, next_cursor = _activity_page(request)
+    except InvalidCursor:
+        return redirect('activities:activity_list')
     
+    context = _activity_list_context(request, activities, next_cursor)
     return render(request, 'activities/activity_list.html', context)
 
 
+@login_required
+def activity_list_api(request):
+    """JSON "load more" variant of the activity list: next page plus its rendered cards"""
+    try:
+        activities, next_cursor = _activity_page(request)
+    except InvalidCursor:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+    
+    context = _activity_list_context(request, activities, next_cursor)
+    return JsonResponse({
+        'results': [
+            {
+                'id': activity.id,
+                'date': activity.date.isoformat(),
+                'status': activity.status,
+                'attendance_status': activity.attendance_status,
+                'checkin_time': activity.checkin_time.isoformat() if activity.checkin_time else None,
+                'checkout_time': activity.checkout_time.isoformat() if activity.checkout_time else None,
+                'planned_activities_count': activity.planned_count,
+                'daily_goals_count': activity.goals_count,
+                'additional_activities_count': activity.additional_count,
+            }
+            for activity in activities
+        ],
+        'next_cursor': next_cursor,
+        'html': render_to_string('activities/_activity_cards.html', context, request=request),
+    })
+
+
 @login_required
 def activity_data_redirect(request):
     """Redirect to today's activity detail view"""
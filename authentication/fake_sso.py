@@ -0,0 +1,419 @@
+"""
+Local stand-in for the SSO API (sso-api.json), for offline load and integration testing.
+
+FakeSSO serves the endpoints this app calls from memory: register/verify-email, login
+(with MFA when the user has it), Google login, MFA verify/status/set/disable, token
+refresh with rotation, logout, profiles and passkeys. It signs RS256 access and refresh
+tokens with its own key, so point the app at it with SSO_BASE_URL=fake.base_url,
+SSO_PUBLIC_KEY=fake.public_pem (or a file at SSO_PUBLIC_KEY_PATH) and JWT_ALGORITHM=RS256.
+
+Unknown emails log in with any non-empty password (auto_register), so load tests can use
+as many users as they like. The MFA code is always MFA_CODE.
+
+Latency (fixed plus random jitter) and failures (a share of requests answered with
+failure_status, or dropped without a response) can be set per instance and changed
+while it runs. Run it with `python manage.py run_fake_sso`, or in tests:
+
+    with FakeSSO(latency=0.05) as fake:
+        ...
+"""
+import base64
+import json
+import random
+import re
+import secrets
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+MFA_CODE = '123456'
+PRE_AUTH_SECONDS = 300
+
+
+def generate_private_key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+def _b64url(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+class FakeSSOError(Exception):
+    def __init__(self, status, payload):
+        super().__init__(status, payload)
+        self.status = status
+        self.payload = payload
+
+
+class FakeSSO:
+    """In-memory SSO API on a ThreadingHTTPServer (one thread per connection)"""
+
+    def __init__(
+        self, host='127.0.0.1', port=0, private_key=None, latency=0.0, jitter=0.0,
+        failure_rate=0.0, failure_status=503, drop_rate=0.0,
+        access_lifetime=300, refresh_lifetime=86400, auto_register=True, seed=None,
+    ):
+        self.private_key = private_key or generate_private_key()
+        self.public_pem = self.private_key.public_key().public_bytes(
+            serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo,
+        ).decode('ascii')
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.drop_rate = drop_rate
+        self.access_lifetime = access_lifetime
+        self.refresh_lifetime = refresh_lifetime
+        self.auto_register = auto_register
+        self.request_counts = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._users = {}  # email -> user dict
+        self._revoked = set()  # refresh token jti
+        self._passkey_ids = iter(range(1, 1 << 62))
+        self._server = ThreadingHTTPServer((host, port), _RequestHandler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    # ── Lifecycle ─────────────────────────────────────────────────────────
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-sso', daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        if self._thread:
+            self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    # ── Users and tokens ──────────────────────────────────────────────────
+
+    def add_user(self, email, password='password', mfa_enabled=False, **profile):
+        """Create (or replace) a user; profile sets full_name, bio, profile_picture, phone_number"""
+        user = {
+            'sso_id': str(uuid.uuid4()),
+            'email': email,
+            'password': password,
+            'mfa_enabled': mfa_enabled,
+            'passkeys': [],
+            'profile': {
+                'full_name': '', 'bio': '', 'profile_picture': '', 'phone_number': '',
+                **profile,
+            },
+        }
+        with self._lock:
+            self._users[email] = user
+        return user
+
+    def user(self, email):
+        with self._lock:
+            return self._users.get(email)
+
+    def _user_by_sso_id(self, sso_id):
+        with self._lock:
+            return next((user for user in self._users.values() if user['sso_id'] == sso_id), None)
+
+    def _sign(self, user, token_type, lifetime):
+        now = int(time.time())
+        payload = {
+            'user_id': user['sso_id'],
+            'email': user['email'],
+            'token_type': token_type,
+            'iat': now,
+            'exp': now + lifetime,
+            'jti': uuid.uuid4().hex,
+        }
+        return jwt.encode(payload, self.private_key, algorithm='RS256')
+
+    def issue_tokens(self, user):
+        """{'access', 'refresh'} for user, as SSO returns them on login"""
+        return {
+            'access': self._sign(user, 'access', self.access_lifetime),
+            'refresh': self._sign(user, 'refresh', self.refresh_lifetime),
+        }
+
+    def _claims(self, token, token_type):
+        try:
+            claims = jwt.decode(token or '', self.private_key.public_key(), algorithms=['RS256'])
+        except jwt.InvalidTokenError:
+            return None
+        return claims if claims.get('token_type') == token_type else None
+
+    # ── Request handling (called from the handler threads) ────────────────
+
+    def _inject(self):
+        """None, 'drop' or 'fail' for this request, after the configured latency"""
+        delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay > 0:
+            time.sleep(delay)
+        roll = self._random.random()
+        if roll < self.drop_rate:
+            return 'drop'
+        if roll < self.drop_rate + self.failure_rate:
+            return 'fail'
+        return None
+
+    def handle(self, method, path, headers, body):
+        """(status, payload, extra headers) for one request; raises FakeSSOError on client errors"""
+        for route_method, pattern, name in ROUTES:
+            match = pattern.fullmatch(path)
+            if match and route_method == method:
+                with self._lock:
+                    self.request_counts[name] += 1
+                handler = getattr(self, f'_{name}')
+                return handler(headers, body, **match.groupdict())
+        raise FakeSSOError(404, {'detail': 'Not found.'})
+
+    def _authenticated_user(self, headers):
+        auth = headers.get('Authorization') or ''
+        claims = self._claims(auth[7:] if auth.startswith('Bearer ') else '', 'access')
+        user = claims and self._user_by_sso_id(claims['user_id'])
+        if not user:
+            raise FakeSSOError(401, {'detail': 'Given token not valid for any token type'})
+        return user
+
+    def _login_response(self, user):
+        if user['mfa_enabled']:
+            return 200, {
+                'mfa_required': True,
+                'token': self._sign(user, 'mfa_pre_auth', PRE_AUTH_SECONDS),
+                'message': 'MFA is required. Please provide your MFA token.',
+            }, {}
+        return 200, self.issue_tokens(user), {}
+
+    def _register(self, headers, body):
+        email, password = body.get('email'), body.get('password')
+        if not email or not password:
+            raise FakeSSOError(400, {'email': ['This field is required.']})
+        if self.user(email):
+            raise FakeSSOError(400, {'email': ['User with this email already exists.']})
+        self.add_user(email, password)
+        return 201, {'message': 'Registration successful. Check your email for the OTP.'}, {}
+
+    def _verify_email(self, headers, body):
+        if not self.user(body.get('email')):
+            raise FakeSSOError(400, {'error': 'Invalid email or OTP'})
+        return 200, self.issue_tokens(self.user(body['email'])), {}
+
+    def _resend_email_otp(self, headers, body):
+        return 200, {'message': 'OTP sent.'}, {}
+
+    def _login(self, headers, body):
+        email, password = body.get('email'), body.get('password')
+        user = self.user(email)
+        if user is None and self.auto_register and email and password:
+            user = self.add_user(email, password)
+        if not user or user['password'] != password:
+            raise FakeSSOError(400, {'non_field_errors': ['Invalid credentials']})
+        return self._login_response(user)
+
+    def _google_login(self, headers, body):
+        token = body.get('token') or ''
+        if not token:
+            raise FakeSSOError(400, {'error': 'Token required'})
+        email = token if '@' in token else f'{token}@google.test'
+        user = self.user(email) or self.add_user(email, secrets.token_hex(8))
+        status, payload, extra = self._login_response(user)
+        return status, {**payload, 'email': email}, extra
+
+    def _mfa_verify(self, headers, body):
+        claims = self._claims(body.get('token'), 'mfa_pre_auth')
+        if not claims:
+            raise FakeSSOError(401, {'detail': 'Token Expired or Invalid'})
+        if body.get('mfa_token') != MFA_CODE:
+            raise FakeSSOError(400, {'mfa_token': ['Invalid MFA code']})
+        user = self._user_by_sso_id(claims['user_id'])
+        if not user:
+            raise FakeSSOError(404, {'detail': 'User not found'})
+        return 200, self.issue_tokens(user), {}
+
+    def _token_refresh(self, headers, body):
+        claims = self._claims(body.get('refresh'), 'refresh')
+        user = claims and self._user_by_sso_id(claims['user_id'])
+        with self._lock:
+            if not user or claims['jti'] in self._revoked:
+                raise FakeSSOError(401, {'detail': 'Token is invalid or expired', 'code': 'token_not_valid'})
+            # Rotation: each refresh token is good for one refresh
+            self._revoked.add(claims['jti'])
+        return 200, self.issue_tokens(user), {}
+
+    def _logout(self, headers, body):
+        claims = self._claims(body.get('refresh'), 'refresh')
+        if claims:
+            with self._lock:
+                self._revoked.add(claims['jti'])
+        return 200, {}, {}
+
+    def _profiles(self, headers, body):
+        user = self._authenticated_user(headers)
+        profile = {
+            'id': user['sso_id'],
+            'user': user['sso_id'],
+            'user_name': user['email'].split('@')[0],
+            **user['profile'],
+        }
+        return 200, [profile], {}
+
+    def _mfa_status(self, headers, body):
+        return 200, {'mfa_enabled': self._authenticated_user(headers)['mfa_enabled']}, {}
+
+    def _mfa_set(self, headers, body):
+        user = self._authenticated_user(headers)
+        if user['mfa_enabled']:
+            raise FakeSSOError(400, {'error': 'MFA is already enabled'})
+        user['mfa_enabled'] = True
+        secret = 'FAKESSOSECRET'
+        return 200, {
+            'mfa_secret': secret,
+            'qr_code_url': f"otpauth://totp/Fake%20SSO:{user['email']}?secret={secret}&issuer=Fake%20SSO",
+        }, {}
+
+    def _mfa_disable(self, headers, body):
+        user = self._authenticated_user(headers)
+        if body.get('password') != user['password'] and body.get('totp') != MFA_CODE:
+            raise FakeSSOError(400, {'error': 'Invalid password or TOTP code'})
+        user['mfa_enabled'] = False
+        return 200, {'detail': 'MFA disabled'}, {}
+
+    def _passkeys_list(self, headers, body):
+        return 200, list(self._authenticated_user(headers)['passkeys']), {}
+
+    def _challenge_response(self, user=None):
+        challenge = _b64url(secrets.token_bytes(32))
+        options = {'publicKey': {'challenge': challenge, 'rpId': 'localhost', 'timeout': 60000}}
+        if user:
+            options['publicKey']['user'] = {
+                'id': _b64url(user['sso_id'].encode('ascii')), 'name': user['email'], 'displayName': user['email'],
+            }
+            options['publicKey']['excludeCredentials'] = []
+        return 200, options, {'Set-Cookie': f'sessionid={challenge}; Path=/; HttpOnly'}
+
+    def _passkeys_register_begin(self, headers, body):
+        return self._challenge_response(self._authenticated_user(headers))
+
+    def _passkeys_register_complete(self, headers, body):
+        user = self._authenticated_user(headers)
+        if not headers.get('Cookie') or not body.get('id'):
+            raise FakeSSOError(400, {'error': 'Registration was not started'})
+        now = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        name = body.get('key_name') or 'Passkey'
+        with self._lock:
+            user['passkeys'].append({
+                'id': next(self._passkey_ids), 'credential_id': body['id'], 'name': name,
+                'platform': 'Fake', 'last_used': None, 'created_at': now,
+            })
+        return 200, {'status': 'OK', 'key_name': name}, {}
+
+    def _passkeys_delete(self, headers, body, passkey_id):
+        user = self._authenticated_user(headers)
+        with self._lock:
+            kept = [key for key in user['passkeys'] if key['id'] != int(passkey_id)]
+            if len(kept) == len(user['passkeys']):
+                raise FakeSSOError(404, {'detail': 'Not found.'})
+            user['passkeys'] = kept
+        return 204, None, {}
+
+    def _passkeys_login_begin(self, headers, body):
+        return self._challenge_response()
+
+    def _passkeys_login_complete(self, headers, body):
+        if not headers.get('Cookie'):
+            raise FakeSSOError(400, {'error': 'Login was not started'})
+        with self._lock:
+            owner = next((
+                user for user in self._users.values()
+                if any(key['credential_id'] == body.get('id') for key in user['passkeys'])
+            ), None)
+        if not owner:
+            raise FakeSSOError(400, {'error': 'Unknown passkey'})
+        return 200, self.issue_tokens(owner), {}
+
+
+# (method, path under /api, name); the handler is FakeSSO._<name>
+ROUTES = tuple(
+    (method, re.compile(f'/api{path}'), name)
+    for method, path, name in (
+        ('POST', '/auth/register/', 'register'),
+        ('POST', '/auth/verify-email/', 'verify_email'),
+        ('POST', '/auth/resend-email-otp/', 'resend_email_otp'),
+        ('POST', '/auth/login/', 'login'),
+        ('POST', '/auth/google-login/', 'google_login'),
+        ('POST', '/auth/mfa/verify/', 'mfa_verify'),
+        ('POST', '/auth/token/refresh/', 'token_refresh'),
+        ('POST', '/auth/logout/', 'logout'),
+        ('GET', '/profiles/', 'profiles'),
+        ('GET', '/auth/mfa/status/', 'mfa_status'),
+        ('POST', '/auth/mfa/set/', 'mfa_set'),
+        ('POST', '/auth/mfa/disable/', 'mfa_disable'),
+        ('GET', '/auth/passkeys/', 'passkeys_list'),
+        ('GET', '/auth/passkeys/register/begin/', 'passkeys_register_begin'),
+        ('POST', '/auth/passkeys/register/complete/', 'passkeys_register_complete'),
+        ('DELETE', r'/auth/passkeys/(?P<passkey_id>\d+)/', 'passkeys_delete'),
+        ('GET', '/auth/passkeys/login/begin/', 'passkeys_login_begin'),
+        ('POST', '/auth/passkeys/login/complete/', 'passkeys_login_complete'),
+    )
+)
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _dispatch(self):
+        fake = self.server.fake
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        injected = fake._inject()
+        if injected == 'drop':
+            self.close_connection = True
+            return
+        if injected == 'fail':
+            return self._send(fake.failure_status, {'detail': 'Injected failure'})
+
+        try:
+            body = json.loads(raw) if raw else {}
+            if not isinstance(body, dict):
+                body = {}
+            status, payload, extra = fake.handle(self.command, self.path.split('?')[0], self.headers, body)
+        except json.JSONDecodeError:
+            status, payload, extra = 400, {'detail': 'JSON parse error'}, {}
+        except FakeSSOError as exc:
+            status, payload, extra = exc.status, exc.payload, {}
+        self._send(status, payload, extra)
+
+    def _send(self, status, payload, extra=None):
+        data = b'' if payload is None else json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        if data:
+            self.send_header('Content-Type', 'application/json')
+        for name, value in (extra or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = do_DELETE = _dispatch
+
+    def log_message(self, *args):
+        pass
@@ -0,0 +1,61 @@
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+
+from authentication.middleware import JWTAuthenticationMiddleware, classify_path
+
+# (label, path, authenticated session?)
+SCENARIOS = (
+    ('static file', '/static/css/app.css', False),
+    ('public API (login)', '/auth/api/login/', False),
+    ('login page', '/auth/login/', False),
+    ('authenticated API', '/activities/api/activities/', True),
+    ('authenticated page', '/dashboard/', True),
+)
+
+
+class Command(BaseCommand):
+    help = 'Micro-benchmark JWTAuthenticationMiddleware.process_request per class of path (no SSO or DB calls)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20000, help='Requests per scenario')
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        session_store = import_module(settings.SESSION_ENGINE).SessionStore
+        factory = RequestFactory()
+        middleware = JWTAuthenticationMiddleware(lambda request: None)
+        user = get_user_model()(pk=1, username='bench')
+        cookies = {
+            settings.SSO_PUBLIC_ACCESS_COOKIE_NAME: 'bench-access',
+            settings.SSO_PUBLIC_REFRESH_COOKIE_NAME: 'bench-refresh',
+        }
+
+        def build(path, authenticated):
+            request = factory.get(path)
+            request.COOKIES.update(cookies)
+            # Session already loaded from its backend, so only the middleware is timed
+            request.session = session_store()
+            request.session._session_cache = {'access_token': 'bench-access', 'refresh_token': 'bench-refresh'}
+            request.user = user if authenticated else AnonymousUser()
+            return request
+
+        self.stdout.write(f'{"scenario":<20} {"class":<7} {"us/request":>11}  session read')
+        for label, path, authenticated in SCENARIOS:
+            best = None
+            for _repeat in range(3):
+                requests = [build(path, authenticated) for _ in range(iterations)]
+                started = time.perf_counter()
+                for request in requests:
+                    middleware.process_request(request)
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            accessed = 'yes' if requests[-1].session.accessed else 'no'
+            self.stdout.write(
+                f'{label:<20} {classify_path(path):<7} {best / iterations * 1e6:11.2f}  {accessed}'
+            )
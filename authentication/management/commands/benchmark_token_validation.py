@@ -0,0 +1,50 @@
+import time
+import timeit
+
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from authentication.tokens import DECODE_OPTIONS, VerifiedTokenCache, verify_token
+
+
+class Command(BaseCommand):
+    help = 'Micro-benchmark SSO access token validation (PEM per call vs parsed key vs verified-token cache)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=2000, help='Validations per variant')
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        public_pem = private_key.public_key().public_bytes(
+            serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo,
+        ).decode('ascii')
+        now = int(time.time())
+        token = jwt.encode({'user_id': 'bench', 'iat': now, 'exp': now + 3600}, private_key, algorithm='RS256')
+
+        def pem_per_call():
+            # The previous path: unverified decode, then the PEM parsed again for verification
+            jwt.decode(token, options={'verify_signature': False})
+            jwt.decode(token, public_pem, algorithms=['RS256'], options=DECODE_OPTIONS)
+
+        cache = VerifiedTokenCache()
+
+        with override_settings(
+            SSO_PUBLIC_KEY=public_pem, JWT_ALGORITHM='RS256',
+            JWT_VERIFIED_CACHE_SIZE=4096, JWT_VERIFIED_CACHE_SECONDS=300,
+        ):
+            assert verify_token(token) is not None
+            cache.put(token, 1, now + 3600)
+            variants = [
+                ('PEM parsed per call', pem_per_call),
+                ('parsed key', lambda: verify_token(token)),
+                ('verified-token cache hit', lambda: cache.get(token)),
+            ]
+            baseline = None
+            for label, func in variants:
+                seconds = min(timeit.repeat(func, number=iterations, repeat=3)) / iterations
+                baseline = baseline or seconds
+                self.stdout.write(f'{label:<26} {seconds * 1e6:10.1f} us/op  {baseline / seconds:8.1f}x')
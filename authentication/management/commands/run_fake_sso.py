@@ -0,0 +1,68 @@
+from pathlib import Path
+
+from cryptography.hazmat.primitives import serialization
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from authentication.fake_sso import MFA_CODE, FakeSSO, generate_private_key
+
+
+class Command(BaseCommand):
+    help = 'Run a local fake SSO API (RS256 tokens, latency and failure injection) for offline load tests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8099)
+        parser.add_argument(
+            '--key-dir', default=str(Path(settings.BASE_DIR) / 'var' / 'fake_sso'),
+            help='Where the signing key is kept between runs (private.pem) and its public.pem is written',
+        )
+        parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response')
+        parser.add_argument('--jitter', type=float, default=0.0, help='Random extra seconds, 0..jitter')
+        parser.add_argument('--failure-rate', type=float, default=0.0, help='Share of requests answered with --failure-status')
+        parser.add_argument('--failure-status', type=int, default=503)
+        parser.add_argument('--drop-rate', type=float, default=0.0, help='Share of connections closed without a response')
+        parser.add_argument('--access-lifetime', type=int, default=300, help='Access token lifetime in seconds')
+        parser.add_argument('--refresh-lifetime', type=int, default=86400, help='Refresh token lifetime in seconds')
+        parser.add_argument('--mfa-user', action='append', default=[], metavar='EMAIL', help='User with MFA enabled (repeatable)')
+        parser.add_argument('--seed', type=int, default=None, help='Random seed for jitter and failures')
+
+    def handle(self, *args, **options):
+        private_key = self._load_private_key(Path(options['key_dir']))
+        fake = FakeSSO(
+            host=options['host'], port=options['port'], private_key=private_key,
+            latency=options['latency'], jitter=options['jitter'],
+            failure_rate=options['failure_rate'], failure_status=options['failure_status'],
+            drop_rate=options['drop_rate'], access_lifetime=options['access_lifetime'],
+            refresh_lifetime=options['refresh_lifetime'], seed=options['seed'],
+        )
+        for email in options['mfa_user']:
+            fake.add_user(email, mfa_enabled=True)
+
+        self.stdout.write(f'Fake SSO listening on {fake.base_url}. Run the app with:')
+        self.stdout.write(f'  SSO_BASE_URL={fake.base_url}')
+        self.stdout.write(f"  SSO_PUBLIC_KEY_PATH={Path(options['key_dir']) / 'public.pem'}")
+        self.stdout.write('  JWT_ALGORITHM=RS256')
+        self.stdout.write(f'Any email logs in with any password; MFA code: {MFA_CODE}. Ctrl+C to stop.')
+        try:
+            fake.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            fake.stop()
+
+    def _load_private_key(self, key_dir):
+        """Reuse the key from earlier runs, so tokens already in sessions stay valid"""
+        key_dir.mkdir(parents=True, exist_ok=True)
+        private_path = key_dir / 'private.pem'
+        if private_path.exists():
+            private_key = serialization.load_pem_private_key(private_path.read_bytes(), password=None)
+        else:
+            private_key = generate_private_key()
+            private_path.write_bytes(private_key.private_bytes(
+                serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption(),
+            ))
+        (key_dir / 'public.pem').write_bytes(private_key.public_key().public_bytes(
+            serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo,
+        ))
+        return private_key
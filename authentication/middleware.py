@@ -1,27 +1,94 @@
+import re
+
 from django.utils.deprecation import MiddlewareMixin
-from django.contrib.auth import login
-from django.shortcuts import redirect
+from django.contrib.auth import alogin, login
+from django.contrib.auth.views import redirect_to_login
 from django.http import JsonResponse
 from django.conf import settings
 
+from authentication import sso_client
 from authentication.sso_cookies import (
+    acopy_public_sso_cookies_to_session,
+    arefresh_sso_session_tokens,
+    arenew_expiring_session_tokens,
     copy_public_sso_cookies_to_session,
     refresh_sso_session_tokens,
+    renew_expiring_session_tokens,
     set_public_sso_auth_cookies,
 )
 
+# Path classes, decided once per request by classify_path()
+PATH_STATIC = 'static'  # static/media files: nothing to do
+PATH_PUBLIC = 'public'  # login/registration APIs and admin: no session or SSO work
+PATH_LOGIN = 'login'  # login page, logout and root: SSO cookies synced, no authentication
+PATH_API = 'api'  # authenticated JSON endpoints (401 when tokens fail)
+PATH_PAGE = 'page'  # authenticated pages (login redirect when tokens fail)
+
+# (class, path, prefix?) in priority order; unmatched paths are PATH_PAGE
+PATH_RULES = (
+    (PATH_STATIC, '/static/', True),
+    (PATH_STATIC, '/media/', True),
+    (PATH_STATIC, '/favicon.ico', False),
+    (PATH_PUBLIC, '/auth/api/login/', True),
+    (PATH_PUBLIC, '/auth/api/google-login/', True),
+    (PATH_PUBLIC, '/auth/api/mfa/verify/', True),
+    (PATH_PUBLIC, '/auth/api/register/', True),
+    (PATH_PUBLIC, '/auth/api/verify-email/', True),
+    (PATH_PUBLIC, '/auth/api/resend-email-otp/', True),
+    (PATH_PUBLIC, '/auth/api/passkeys/login/', True),
+    (PATH_PUBLIC, '/admin/', True),
+    (PATH_LOGIN, '/', False),
+    (PATH_LOGIN, '/auth/login/', True),
+    (PATH_LOGIN, '/auth/logout/', True),
+)
+# Any other path with an /api/ segment
+_API_PATTERN = r'(?:/[^/]+)*/api/'
+
+
+def _compile_path_rules(rules):
+    """One regex for all rules; each alternative is a named group per rule index"""
+    alternatives = [
+        f'(?P<r{index}>{re.escape(path)}{"" if prefix else "$"})'
+        for index, (_path_class, path, prefix) in enumerate(rules)
+    ]
+    alternatives.append(f'(?P<api>{_API_PATTERN})')
+    return re.compile('|'.join(alternatives))
+
+
+_path_matcher = _compile_path_rules(PATH_RULES)
+
+
+def classify_path(path):
+    """PATH_STATIC, PATH_PUBLIC, PATH_LOGIN, PATH_API or PATH_PAGE for a request path"""
+    match = _path_matcher.match(path)
+    if match is None:
+        return PATH_PAGE
+    if match.lastgroup == 'api':
+        return PATH_API
+    return PATH_RULES[int(match.lastgroup[1:])][0]
+
 
 class JWTAuthenticationMiddleware(MiddlewareMixin):
-    """Middleware to handle SSO authentication and create Django sessions"""
-    
-    # Django middleware requirements
-    async_mode = False
-    sync_mode = True
-    
+    """
+    Middleware to handle SSO authentication and create Django sessions.
+
+    Sync and async capable: under ASGI, __acall__ runs the same steps with the async
+    session, auth and SSO APIs instead of blocking a thread on SSO.
+    """
+
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
         super().__init__(get_response)
 
+    async def __acall__(self, request):
+        response = await self.aprocess_request(request)
+        if response is None:
+            response = await self.get_response(request)
+        return self.process_response(request, response)
+
     def process_response(self, request, response):
         """Refresh public SSO cookies when this middleware rotates JWTs via refresh."""
         tokens = getattr(request, '_public_sso_cookie_tokens', None)
@@ -32,70 +99,91 @@ class JWTAuthenticationMiddleware(MiddlewareMixin):
     
     def process_request(self, request):
         """Process incoming requests - use Django sessions primarily"""
-        
-        # No SSO cookie sync for static/media
-        if (
-            request.path.startswith('/static/')
-            or request.path.startswith('/media/')
-            or request.path == '/favicon.ico'
-        ):
+        path_class = classify_path(request.path)
+
+        # Static files and public endpoints never touch the session or SSO
+        if path_class in (PATH_STATIC, PATH_PUBLIC):
             return None
 
         # Sync arna_sso_* cookies into session (shared parent domain with Account portal)
         copy_public_sso_cookies_to_session(request)
 
-        # Skip authentication for certain paths
-        skip_paths = [
-            '/',  # Root URL redirect
-            '/auth/login/',
-            '/auth/api/login/',
-            '/auth/api/google-login/',
-            '/auth/api/mfa/verify/',
-            '/auth/api/register/',
-            '/auth/api/verify-email/',
-            '/auth/api/resend-email-otp/',
-            '/auth/logout/',
-            '/admin/',
-        ]
-        
-        if any(request.path.startswith(path) for path in skip_paths):
+        # Login/logout/root read the synced tokens themselves
+        if path_class == PATH_LOGIN:
             return None
-        
+
         # If user is already authenticated via Django session, we're good
         if request.user.is_authenticated:
+            # Renew tokens close to exp so later requests do not wait on SSO
+            renew_expiring_session_tokens(request)
             return None
-        
+
         # User is not authenticated - check if we have valid tokens to create a session
         access_token = request.session.get('access_token')
-        refresh_token = request.session.get('refresh_token')
-        
-        if access_token:
-            # Try to validate the access token and create a session
-            user = self.validate_token_and_get_user(access_token)
-            if user:
-                login(request, user)
-                return None
-            else:
-                # Access token is invalid/expired, try to refresh
-                if refresh_token:
-                    new_access_token = refresh_sso_session_tokens(request)
-                    if new_access_token:
-                        # Try with new token
-                        user = self.validate_token_and_get_user(new_access_token)
-                        if user:
-                            login(request, user)
-                            return None
-                
-                # All tokens failed, clear session
-                request.session.flush()
-        
-        # No valid authentication found
-        if request.path.startswith('/api/') or request.content_type == 'application/json':
+        if not access_token:
+            # @login_required on the view redirects (keeping ?next=)
+            return None
+
+        # Try to validate the access token and create a session
+        user = self.validate_token_and_get_user(access_token)
+        if not user and request.session.get('refresh_token'):
+            # Access token is invalid/expired, try to refresh
+            new_access_token = refresh_sso_session_tokens(request)
+            if new_access_token:
+                user = self.validate_token_and_get_user(new_access_token)
+        if user:
+            login(request, user)
+            return None
+
+        # All tokens failed, clear session (unless SSO is down: the refresh
+        # token may still be good once it is back)
+        if sso_client.is_available():
+            request.session.flush()
+        return self.authentication_required(request, path_class)
+
+    async def aprocess_request(self, request):
+        """Async process_request()"""
+        path_class = classify_path(request.path)
+        if path_class in (PATH_STATIC, PATH_PUBLIC):
+            return None
+
+        await acopy_public_sso_cookies_to_session(request)
+        if path_class == PATH_LOGIN:
+            return None
+
+        user = await request.auser()
+        if user.is_authenticated:
+            await arenew_expiring_session_tokens(request)
+            return None
+
+        access_token = await request.session.aget('access_token')
+        if not access_token:
+            return None
+
+        user = await self.avalidate_token_and_get_user(access_token)
+        if not user and await request.session.aget('refresh_token'):
+            new_access_token = await arefresh_sso_session_tokens(request)
+            if new_access_token:
+                user = await self.avalidate_token_and_get_user(new_access_token)
+        if user:
+            await alogin(request, user)
+            return None
+
+        if await sso_client.ais_available():
+            await request.session.aflush()
+        return self.authentication_required(request, path_class)
+
+    def authentication_required(self, request, path_class):
+        """401 for API requests, login redirect (with ?next=) for pages"""
+        if path_class == PATH_API or request.content_type == 'application/json':
             return JsonResponse({'error': 'Authentication required'}, status=401)
-        else:
-            return redirect('authentication:login')
-    
+        return redirect_to_login(request.get_full_path())
+
     def validate_token_and_get_user(self, access_token):
         from authentication.views import authenticate_with_token
         return authenticate_with_token(access_token)
+
+    async def avalidate_token_and_get_user(self, access_token):
+        from authentication.views import aauthenticate_with_token
+        return await aauthenticate_with_token(access_token)
     
\ No newline at end of file
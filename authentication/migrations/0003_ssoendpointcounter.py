@@ -0,0 +1,25 @@
+# Generated by Django 5.2.4 on 2026-10-18 13:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0002_ssorefreshclaim'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SSOEndpointCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('endpoint', models.CharField(max_length=50)),
+                ('metric', models.CharField(max_length=20)),
+                ('value', models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('endpoint', 'metric'), name='unique_sso_endpoint_counter')],
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.4 on 2026-10-18 16:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0003_ssoendpointcounter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SSOCircuitBreaker',
+            fields=[
+                ('name', models.CharField(max_length=20, primary_key=True, serialize=False)),
+                ('consecutive_failures', models.PositiveIntegerField(default=0)),
+                ('open_until', models.DateTimeField(blank=True, null=True)),
+                ('probe_until', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.4 on 2026-10-18 16:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0004_ssocircuitbreaker'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SSOProfileRefreshClaim',
+            fields=[
+                ('sso_id', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
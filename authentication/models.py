@@ -49,3 +49,73 @@ class User(AbstractUser):
         elif self.last_name:
             return self.last_name
         return self.email
+
+
+class SSORefreshClaim(models.Model):
+    """
+    Single-flight claim on one refresh token (see authentication.sso_cookies).
+
+    Inserting the row is the lock: the primary key makes the claim atomic across worker
+    processes. The holder then stores the encrypted result for parallel requests.
+    """
+    
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    
+    # sha256 of the refresh token; the token itself is never stored
+    digest = models.CharField(max_length=64, primary_key=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    # Fernet token with the new (access, refresh), keyed by the old refresh token
+    result = models.TextField(blank=True)
+    expires_at = models.DateTimeField(db_index=True)
+    
+    def __str__(self):
+        return f"Refresh claim {self.digest[:12]} ({self.status})"
+
+
+class SSOEndpointCounter(models.Model):
+    """One counter of the SSO HTTP client (see authentication.sso_client), summed over all processes"""
+    
+    endpoint = models.CharField(max_length=50)
+    metric = models.CharField(max_length=20)
+    value = models.PositiveBigIntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['endpoint', 'metric'], name='unique_sso_endpoint_counter'),
+        ]
+    
+    def __str__(self):
+        return f"{self.endpoint} {self.metric}={self.value}"
+
+
+class SSOCircuitBreaker(models.Model):
+    """
+    Circuit breaker state of the SSO HTTP client (see authentication.sso_client), shared
+    by every worker process. One row, created on the first failure.
+    """
+    
+    name = models.CharField(max_length=20, primary_key=True)
+    consecutive_failures = models.PositiveIntegerField(default=0)
+    open_until = models.DateTimeField(null=True, blank=True)
+    # The half-open probe belongs to whoever set this (a conditional UPDATE) until it passes
+    probe_until = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"SSO breaker {self.name}: {self.consecutive_failures} failures"
+
+
+class SSOProfileRefreshClaim(models.Model):
+    """
+    Single-flight claim on the background profile completeness refresh of one SSO user
+    (see authentication.sso_profile). Inserting the row is the lock, across processes.
+    """
+    
+    sso_id = models.CharField(max_length=100, primary_key=True)
+    expires_at = models.DateTimeField(db_index=True)
+    
+    def __str__(self):
+        return f"Profile refresh claim {self.sso_id}"
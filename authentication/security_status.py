@@ -0,0 +1,73 @@
+"""
+Combined MFA and passkey status of a user (GET /auth/api/security-status/), used by the
+profile page badges and the security reminder in base.html.
+
+Both SSO calls run concurrently, and a complete result is cached per user in the shared
+Django cache for SECURITY_STATUS_CACHE_SECONDS. Views that change MFA or passkeys drop
+the entry, so the next page load sees the change.
+"""
+import asyncio
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+
+from authentication import sso_client
+
+logger = logging.getLogger(__name__)
+
+SECURITY_STATUS_KEY_PREFIX = 'sso:security-status:'
+
+
+def _cache_key(user):
+    return f'{SECURITY_STATUS_KEY_PREFIX}{user.pk}'
+
+
+def _json_from(response, label):
+    """JSON body of a 200 response, or None (logged) on an error or exception"""
+    if isinstance(response, Exception):
+        logger.warning('SSO %s failed: %s', label, response)
+        return None
+    if response.status_code != 200:
+        logger.warning('SSO %s HTTP %s', label, response.status_code)
+        return None
+    try:
+        return response.json()
+    except ValueError:
+        logger.warning('SSO %s returned invalid JSON', label)
+        return None
+
+
+async def afetch_security_status(user, access_token):
+    """
+    {'mfa_enabled': bool, 'passkeys': [...]} for user; a part SSO did not return is None
+    (and the result is then not cached).
+    """
+    key = _cache_key(user)
+    status = await cache.aget(key)
+    if status is not None:
+        return status
+
+    headers = {'Authorization': f'Bearer {access_token}'}
+    mfa_response, passkeys_response = await asyncio.gather(
+        sso_client.aget('mfa_status', '/api/auth/mfa/status/', headers=headers),
+        sso_client.aget('passkeys_list', '/api/auth/passkeys/', headers=headers),
+        return_exceptions=True,
+    )
+    mfa = _json_from(mfa_response, 'MFA status')
+    passkeys = _json_from(passkeys_response, 'passkeys list')
+    status = {
+        'mfa_enabled': bool(mfa.get('mfa_enabled')) if isinstance(mfa, dict) else None,
+        'passkeys': passkeys if isinstance(passkeys, list) else None,
+    }
+    if None not in status.values():
+        await cache.aset(key, status, timeout=settings.SECURITY_STATUS_CACHE_SECONDS)
+    return status
+
+
+def invalidate_security_status(user):
+    cache.delete(_cache_key(user))
+
+
+async def ainvalidate_security_status(user):
+    await cache.adelete(_cache_key(user))
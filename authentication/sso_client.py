@@ -0,0 +1,484 @@
+"""
+Shared HTTP client for the SSO API (SSO_BASE_URL).
+
+Every SSO call goes through one requests.Session per process, so calls reuse pooled
+keep-alive connections instead of paying a TCP+TLS handshake each time. Each endpoint
+has a name, which selects its timeout and labels its counters.
+
+Retries (SSO_HTTP_RETRIES, with backoff) cover connection failures, where nothing was
+sent. Idempotent requests (GET/HEAD/OPTIONS/DELETE) are also retried on read errors and
+on 502/503/504. A POST that reached SSO is never sent twice.
+
+The session keeps no cookies between calls, because it is shared by all users. Calls
+that need SSO cookies pass them explicitly.
+
+Per-endpoint counters (requests, errors, server errors, retries, rejections, total latency)
+are kept per process and added in batches to SSOEndpointCounter rows with atomic
+UPDATE ... SET value = value + n statements; see sso_client_stats().
+
+Async views use arequest() (aget/apost/adelete), backed by httpx. All async calls of a
+process run on one event loop thread with one connection pool
+(SSO_HTTP_ASYNC_MAX_CONNECTIONS), so any caller's loop (an ASGI worker, or async_to_sync
+under uWSGI) can await them without holding a thread per call. They share the timeouts,
+retry rules, counters and circuit breaker of request(), and raise the same requests
+exceptions.
+
+A circuit breaker protects the worker threads during SSO outages. Its state is one
+SSOCircuitBreaker row shared by every process. Failures (connection errors, timeouts or
+5xx) are counted with an atomic UPDATE ... SET consecutive_failures = n + 1. After
+SSO_BREAKER_FAILURE_THRESHOLD of them in a row it opens, and for SSO_BREAKER_OPEN_SECONDS
+every call of every process fails fast with SSOUnavailable (a requests.ConnectionError)
+instead of waiting on timeouts. After that window one call across all processes is let
+through as a probe: the one whose conditional UPDATE ... WHERE probe_until < now claims
+it. Its success closes the breaker; its failure opens it again. Async calls read and
+write the row through sync_to_async, never on the SSO event loop thread.
+"""
+import asyncio
+import http.cookiejar
+import logging
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+
+import httpx
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from authentication.models import SSOCircuitBreaker, SSOEndpointCounter
+
+logger = logging.getLogger(__name__)
+
+# Named SSO calls (for counters); ENDPOINT_READ_TIMEOUTS overrides SSO_HTTP_READ_TIMEOUT
+ENDPOINTS = (
+    'register', 'verify_email', 'resend_email_otp', 'login', 'google_login', 'mfa_verify',
+    'logout', 'token_refresh', 'profiles', 'mfa_status', 'mfa_set', 'mfa_disable',
+    'passkeys_list', 'passkeys_register_begin', 'passkeys_register_complete', 'passkeys_delete',
+    'passkeys_login_begin', 'passkeys_login_complete',
+)
+ENDPOINT_READ_TIMEOUTS = {
+    'logout': 5,
+    'token_refresh': 10,
+}
+
+RETRY_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS', 'DELETE'})
+RETRY_STATUSES = (502, 503, 504)
+
+METRIC_KEYS = ('requests', 'errors', 'server_errors', 'retries', 'rejected', 'latency_ms')
+
+# Local events recorded before they are added to the shared counters
+STATS_FLUSH_EVERY = 20
+
+# Primary key of the SSOCircuitBreaker row
+BREAKER_NAME = 'sso'
+
+_session = None
+_session_lock = threading.Lock()
+_loop = None
+_loop_lock = threading.Lock()
+# Only used on _loop's thread
+_async_client = None
+_stats_lock = threading.Lock()
+_pending_stats = Counter()
+_pending_events = 0
+
+
+class SSOUnavailable(requests.ConnectionError):
+    """Raised without contacting SSO while the circuit breaker is open"""
+
+
+def get_session():
+    """Process-wide requests.Session with a keep-alive pool and retries for the SSO API"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                retry = Retry(
+                    total=settings.SSO_HTTP_RETRIES,
+                    backoff_factor=settings.SSO_HTTP_RETRY_BACKOFF,
+                    status_forcelist=RETRY_STATUSES,
+                    allowed_methods=RETRY_METHODS,
+                    raise_on_status=False,
+                )
+                adapter = HTTPAdapter(
+                    pool_connections=2,
+                    pool_maxsize=settings.SSO_HTTP_POOL_SIZE,
+                    max_retries=retry,
+                )
+                session = requests.Session()
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                # Shared by all users: never store cookies from one user's response
+                session.cookies.set_policy(_no_cookies_policy())
+                _session = session
+    return _session
+
+
+def _no_cookies_policy():
+    return http.cookiejar.DefaultCookiePolicy(allowed_domains=[])
+
+
+def _timeouts(endpoint):
+    """(connect, read) timeout for a named endpoint"""
+    read_timeout = ENDPOINT_READ_TIMEOUTS.get(endpoint, settings.SSO_HTTP_READ_TIMEOUT)
+    return settings.SSO_HTTP_CONNECT_TIMEOUT, read_timeout
+
+
+def request(method, endpoint, path, **kwargs):
+    """
+    Send method to SSO_BASE_URL + path and return the response; raises RequestException
+    like requests does (SSOUnavailable while the circuit breaker is open). endpoint names
+    the call for its timeout and counters.
+    """
+    if 'timeout' not in kwargs:
+        kwargs['timeout'] = _timeouts(endpoint)
+    started = time.monotonic()
+    admission = _admit(endpoint, started)
+    try:
+        response = get_session().request(method, f'{settings.SSO_BASE_URL}{path}', **kwargs)
+    except requests.RequestException:
+        _record(endpoint, started, errors=1)
+        _breaker_result(False, admission)
+        raise
+    retries = getattr(getattr(response.raw, 'retries', None), 'history', ())
+    server_error = response.status_code >= 500
+    _record(endpoint, started, server_errors=int(server_error), retries=len(retries or ()))
+    _breaker_result(not server_error, admission)
+    return response
+
+
+def get(endpoint, path, **kwargs):
+    return request('GET', endpoint, path, **kwargs)
+
+
+def post(endpoint, path, **kwargs):
+    return request('POST', endpoint, path, **kwargs)
+
+
+def delete(endpoint, path, **kwargs):
+    return request('DELETE', endpoint, path, **kwargs)
+
+
+def _get_loop():
+    """Event loop thread that runs this process's async SSO calls"""
+    global _loop
+    # Started on first use so uWSGI forks workers before any thread exists
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='sso-http', daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+def _get_async_client():
+    global _async_client
+    if _async_client is None:
+        transport = httpx.AsyncHTTPTransport(
+            # httpx retries connection failures only; status retries are done in _arequest
+            retries=settings.SSO_HTTP_RETRIES,
+            limits=httpx.Limits(
+                max_connections=settings.SSO_HTTP_ASYNC_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.SSO_HTTP_POOL_SIZE,
+            ),
+        )
+        # Shared by all users, like the sync session: never store response cookies
+        cookies = http.cookiejar.CookieJar(policy=_no_cookies_policy())
+        _async_client = httpx.AsyncClient(transport=transport, cookies=cookies)
+    return _async_client
+
+
+async def arequest(method, endpoint, path, **kwargs):
+    """
+    Async request(): same arguments (json, headers, cookies, timeout), returns an
+    httpx.Response (status_code, json(), text, content, cookies like requests) and raises
+    requests exceptions.
+    """
+    started = time.monotonic()
+    # The breaker row is read and written here, in the caller's context: the ORM may not
+    # run on the SSO event loop thread
+    admission = await sync_to_async(_admit)(endpoint, started)
+    future = asyncio.run_coroutine_threadsafe(_arequest(method, endpoint, path, started, **kwargs), _get_loop())
+    try:
+        response = await asyncio.wrap_future(future)
+    except requests.RequestException:
+        await sync_to_async(_breaker_result)(False, admission)
+        raise
+    await sync_to_async(_breaker_result)(response.status_code < 500, admission)
+    return response
+
+
+async def aget(endpoint, path, **kwargs):
+    return await arequest('GET', endpoint, path, **kwargs)
+
+
+async def apost(endpoint, path, **kwargs):
+    return await arequest('POST', endpoint, path, **kwargs)
+
+
+async def adelete(endpoint, path, **kwargs):
+    return await arequest('DELETE', endpoint, path, **kwargs)
+
+
+def _timeout_pair(endpoint, timeout):
+    """(connect, read) from a requests-style timeout: None, one number or a pair"""
+    if timeout is None:
+        return _timeouts(endpoint)
+    if isinstance(timeout, (tuple, list)):
+        connect_timeout, read_timeout = timeout
+        return connect_timeout, read_timeout
+    return timeout, timeout
+
+
+async def _arequest(method, endpoint, path, started, headers=None, cookies=None, timeout=None, **kwargs):
+    connect_timeout, read_timeout = _timeout_pair(endpoint, timeout)
+    headers = dict(headers or {})
+    if cookies:
+        headers['Cookie'] = '; '.join(f'{name}={value}' for name, value in cookies.items())
+    client = _get_async_client()
+    retries = 0
+    while True:
+        try:
+            response = await client.request(
+                method, f'{settings.SSO_BASE_URL}{path}', headers=headers,
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout), **kwargs,
+            )
+        except httpx.HTTPError as exc:
+            if _should_retry(method, retries):
+                retries += 1
+                await _retry_backoff(retries)
+                continue
+            _record(endpoint, started, errors=1, retries=retries)
+            raise _as_requests_error(exc) from exc
+        if response.status_code in RETRY_STATUSES and _should_retry(method, retries):
+            retries += 1
+            await _retry_backoff(retries)
+            continue
+        break
+    _record(endpoint, started, server_errors=int(response.status_code >= 500), retries=retries)
+    return response
+
+
+def _should_retry(method, retries):
+    return method in RETRY_METHODS and retries < settings.SSO_HTTP_RETRIES
+
+
+async def _retry_backoff(retries):
+    if retries > 1:
+        await asyncio.sleep(settings.SSO_HTTP_RETRY_BACKOFF * 2 ** (retries - 1))
+
+
+def _as_requests_error(exc):
+    """The requests exception views already handle for an httpx error"""
+    if isinstance(exc, httpx.ConnectTimeout):
+        return requests.ConnectTimeout(str(exc))
+    if isinstance(exc, httpx.TimeoutException):
+        return requests.Timeout(str(exc))
+    if isinstance(exc, httpx.TransportError):
+        return requests.ConnectionError(str(exc))
+    return requests.RequestException(str(exc))
+
+
+def _breaker_rows():
+    return SSOCircuitBreaker.objects.filter(name=BREAKER_NAME)
+
+
+def is_available():
+    """False while the circuit breaker is open (SSO calls would fail fast)"""
+    open_until = _breaker_rows().values_list('open_until', flat=True).first()
+    return not open_until or open_until <= timezone.now()
+
+
+async def ais_available():
+    """Async is_available()"""
+    open_until = await _breaker_rows().values_list('open_until', flat=True).afirst()
+    return not open_until or open_until <= timezone.now()
+
+
+def breaker_state():
+    """{'state': closed/open/half_open, 'consecutive_failures', 'open_until'} of the shared breaker"""
+    row = _breaker_rows().values('consecutive_failures', 'open_until').first()
+    failures, open_until = (row['consecutive_failures'], row['open_until']) if row else (0, None)
+    if not open_until:
+        state = 'closed'
+    elif open_until > timezone.now():
+        state = 'open'
+    else:
+        state = 'half_open'
+    return {
+        'state': state,
+        'consecutive_failures': failures,
+        'open_until': open_until,
+    }
+
+
+def _breaker_admit():
+    """
+    (is_probe, consecutive failures seen) for a call allowed through; raises
+    SSOUnavailable while open
+    """
+    row = _breaker_rows().values('consecutive_failures', 'open_until').first()
+    if row is None:
+        return False, 0
+    if not row['open_until']:
+        return False, row['consecutive_failures']
+    now = timezone.now()
+    if now < row['open_until']:
+        raise SSOUnavailable('SSO circuit breaker is open')
+    # Half-open: one probe across all processes, the rest keep failing fast. A probe that
+    # never reported back (an unexpected exception) is replaced once its timeouts have passed.
+    probe_seconds = settings.SSO_HTTP_CONNECT_TIMEOUT + settings.SSO_HTTP_READ_TIMEOUT + 1
+    claimed = _breaker_rows().filter(
+        Q(probe_until__isnull=True) | Q(probe_until__lt=now),
+        open_until__lte=now,
+    ).update(probe_until=now + timedelta(seconds=probe_seconds))
+    if not claimed:
+        raise SSOUnavailable('SSO circuit breaker is probing')
+    return True, row['consecutive_failures']
+
+
+def _admit(endpoint, started):
+    """_breaker_admit(), counting a rejected call"""
+    try:
+        return _breaker_admit()
+    except SSOUnavailable:
+        _record(endpoint, started, errors=1, rejected=1)
+        raise
+
+
+def _add_failure():
+    """Atomically count one more consecutive failure; returns the new count"""
+    rows = _breaker_rows()
+    if not rows.update(consecutive_failures=F('consecutive_failures') + 1):
+        try:
+            with transaction.atomic():
+                SSOCircuitBreaker.objects.create(name=BREAKER_NAME, consecutive_failures=1)
+        except IntegrityError:
+            # Created concurrently
+            rows.update(consecutive_failures=F('consecutive_failures') + 1)
+    return rows.values_list('consecutive_failures', flat=True).first()
+
+
+def _breaker_result(succeeded, admission):
+    """Report a call admitted by _breaker_admit() (admission is its result)"""
+    probe, failures_seen = admission
+    if succeeded:
+        # Nothing to reset while the breaker was clean: no write on the common path
+        if probe or failures_seen:
+            _breaker_rows().update(consecutive_failures=0, open_until=None, probe_until=None)
+            if probe:
+                logger.info('SSO circuit breaker closed')
+        return
+
+    failures = _add_failure()
+    if not probe and failures < settings.SSO_BREAKER_FAILURE_THRESHOLD:
+        return
+    now = timezone.now()
+    rows = _breaker_rows()
+    if not probe:
+        # Calls still in flight when another process opened it do not extend the window
+        rows = rows.filter(Q(open_until__isnull=True) | Q(open_until__lte=now))
+    if rows.update(open_until=now + timedelta(seconds=settings.SSO_BREAKER_OPEN_SECONDS), probe_until=None):
+        logger.warning(
+            'SSO circuit breaker open for %ss after %d consecutive failures',
+            settings.SSO_BREAKER_OPEN_SECONDS, failures,
+        )
+
+
+def _record(endpoint, started, **counts):
+    global _pending_events
+    latency_ms = int((time.monotonic() - started) * 1000)
+    with _stats_lock:
+        _pending_stats[(endpoint, 'requests')] += 1
+        _pending_stats[(endpoint, 'latency_ms')] += latency_ms
+        for metric, count in counts.items():
+            if count:
+                _pending_stats[(endpoint, metric)] += count
+        _pending_events += 1
+        if _pending_events < STATS_FLUSH_EVERY:
+            return
+        pending = _take_pending()
+    _flush(pending)
+
+
+def _take_pending():
+    global _pending_events
+    pending = dict(_pending_stats)
+    _pending_stats.clear()
+    _pending_events = 0
+    return pending
+
+
+def _add_counter(endpoint, metric, count):
+    """Atomically add count to one shared counter (an UPDATE ... SET value = value + count)"""
+    counters = SSOEndpointCounter.objects.filter(endpoint=endpoint, metric=metric)
+    if counters.update(value=F('value') + count):
+        return
+    try:
+        with transaction.atomic():
+            SSOEndpointCounter.objects.create(endpoint=endpoint, metric=metric, value=count)
+    except IntegrityError:
+        # Created concurrently
+        counters.update(value=F('value') + count)
+
+
+def _add_to_shared(pending):
+    for (endpoint, metric), count in pending.items():
+        _add_counter(endpoint, metric, count)
+
+
+def _add_to_shared_in_executor(pending):
+    try:
+        _add_to_shared(pending)
+    except Exception:
+        logger.exception('Could not save SSO client counters')
+    finally:
+        # The executor thread's connection is not closed by any request cycle
+        connection.close()
+
+
+def _flush(pending):
+    """
+    Add pending events to the shared counters. On an event loop thread (async calls) the
+    ORM may not run, so the write goes to the loop's executor; returns its future then.
+    """
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        _add_to_shared(pending)
+        return None
+    return loop.run_in_executor(None, _add_to_shared_in_executor, pending)
+
+
+def sso_client_stats():
+    """{endpoint: counters + avg_latency_ms} for endpoints that were called (all processes)"""
+    with _stats_lock:
+        pending = _take_pending()
+    _add_to_shared(pending)
+    stored = {
+        (endpoint, metric): value
+        for endpoint, metric, value in SSOEndpointCounter.objects.values_list('endpoint', 'metric', 'value')
+    }
+    stats = {}
+    for endpoint in sorted({endpoint for endpoint, _metric in stored}):
+        counters = {metric: stored.get((endpoint, metric), 0) for metric in METRIC_KEYS}
+        if not counters['requests']:
+            continue
+        counters['avg_latency_ms'] = round(counters['latency_ms'] / counters['requests'], 1)
+        stats[endpoint] = counters
+    return stats
+
+
+def reset_stats():
+    """Zero the shared counters and this process's unflushed events, and close the breaker"""
+    with _stats_lock:
+        _take_pending()
+    SSOEndpointCounter.objects.all().delete()
+    _breaker_rows().delete()
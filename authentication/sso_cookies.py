@@ -3,8 +3,38 @@ Public SSO cookies shared across subdomains (names must match the Account portal
 
 When PUBLIC_AUTH_COOKIE_DOMAIN is set (e.g. .arnatech.id), the browser sends
 arna_sso_access_token and arna_sso_refresh_token to all subdomains under that domain.
+
+Refreshes are single-flight per refresh token across processes: the first request
+claims it by inserting an SSORefreshClaim row (atomic on the primary key, so two workers
+can never both rotate the token) and calls SSO; parallel requests from the same browser
+wait for its result instead of each spending, and racing to rotate, the same refresh
+token. The result is stored encrypted with a key derived from the old refresh token and
+kept for SSO_REFRESH_RESULT_SECONDS.
+
+The a-prefixed functions are the async equivalents for async views and middleware.
 """
+import asyncio
+import base64
+import hashlib
+import json
+import time
+from datetime import timedelta
+
+from cryptography.fernet import Fernet, InvalidToken
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from authentication import sso_client
+from authentication.models import SSORefreshClaim
+from authentication.tokens import unverified_exp
+
+# How often a waiting request checks for the leader's result
+REFRESH_POLL_SECONDS = 0.05
+# A failed refresh is shared briefly too, so waiters do not retry it one after another
+REFRESH_FAILURE_SECONDS = 5
 
 
 def copy_public_sso_cookies_to_session(request):
@@ -14,57 +44,250 @@ def copy_public_sso_cookies_to_session(request):
     If we only copied when the session had no access_token, an old employee session
     would block newer tokens from Account (same host). Prefer public cookies when
     their access value differs from the session.
+
+    Only changed values are written; SessionMiddleware saves the session once, at the
+    end of the request, and only when something changed.
     """
     access = request.COOKIES.get(settings.SSO_PUBLIC_ACCESS_COOKIE_NAME)
     if not access:
         return
     refresh = request.COOKIES.get(settings.SSO_PUBLIC_REFRESH_COOKIE_NAME) or ''
-    session_access = request.session.get('access_token')
-    session_refresh = request.session.get('refresh_token') or ''
-    if session_access == access and session_refresh == refresh:
+    if request.session.get('access_token') != access:
+        request.session['access_token'] = access
+    if (request.session.get('refresh_token') or '') != refresh:
+        request.session['refresh_token'] = refresh
+
+
+async def acopy_public_sso_cookies_to_session(request):
+    """Async copy_public_sso_cookies_to_session()"""
+    access = request.COOKIES.get(settings.SSO_PUBLIC_ACCESS_COOKIE_NAME)
+    if not access:
         return
-    request.session['access_token'] = access
-    request.session['refresh_token'] = refresh
-    request.session.save()
+    refresh = request.COOKIES.get(settings.SSO_PUBLIC_REFRESH_COOKIE_NAME) or ''
+    if await request.session.aget('access_token') != access:
+        await request.session.aset('access_token', access)
+    if (await request.session.aget('refresh_token') or '') != refresh:
+        await request.session.aset('refresh_token', refresh)
 
 
-def refresh_sso_session_tokens(request):
-    """
-    POST /api/auth/token/refresh/ using the session refresh token; update session.
-    Returns new access token or None. Sets request._public_sso_cookie_tokens when
-    PUBLIC_AUTH_COOKIE_DOMAIN is used so process_response can update arna_sso_*.
-    """
-    import requests
+def _refresh_digest(refresh_token):
+    return hashlib.sha256(refresh_token.encode('utf-8')).hexdigest()
 
-    refresh_token = request.session.get('refresh_token')
-    if not refresh_token:
+
+def _result_cipher(refresh_token):
+    """Fernet keyed by the old refresh token: only requests holding it can read the result"""
+    key = HKDF(
+        algorithm=hashes.SHA256(), length=32, salt=None, info=b'sso-refresh-result',
+    ).derive(refresh_token.encode('utf-8'))
+    return Fernet(base64.urlsafe_b64encode(key))
+
+
+def _tokens_from_refresh_response(response):
+    if response.status_code != 200:
+        return None
+    data = response.json()
+    if not data.get('access'):
+        return None
+    return data['access'], data.get('refresh') or ''
+
+
+def _post_refresh(refresh_token):
+    """(access, refresh) from POST /api/auth/token/refresh/, or None"""
+    try:
+        return _tokens_from_refresh_response(sso_client.post(
+            'token_refresh',
+            '/api/auth/token/refresh/',
+            json={'refresh': refresh_token},
+            headers={'Content-Type': 'application/json'},
+        ))
+    except Exception:
         return None
+
+
+async def _apost_refresh(refresh_token):
     try:
-        response = requests.post(
-            f'{settings.SSO_BASE_URL}/api/auth/token/refresh/',
+        return _tokens_from_refresh_response(await sso_client.apost(
+            'token_refresh',
+            '/api/auth/token/refresh/',
             json={'refresh': refresh_token},
             headers={'Content-Type': 'application/json'},
-            timeout=10,
+        ))
+    except Exception:
+        return None
+
+
+def _live_claims(digest):
+    return SSORefreshClaim.objects.filter(digest=digest, expires_at__gt=timezone.now())
+
+
+def _claim_result(claim, refresh_token):
+    """(access, refresh) stored on a finished claim, or None for a failed one"""
+    if claim.status != 'done':
+        return None
+    try:
+        return tuple(json.loads(_result_cipher(refresh_token).decrypt(claim.result.encode('ascii'))))
+    except (InvalidToken, ValueError):
+        return None
+
+
+def _finished_claim_fields(refresh_token, result):
+    if result:
+        return {
+            'status': 'done',
+            'result': _result_cipher(refresh_token).encrypt(json.dumps(result).encode('utf-8')).decode('ascii'),
+            'expires_at': timezone.now() + timedelta(seconds=settings.SSO_REFRESH_RESULT_SECONDS),
+        }
+    return {
+        'status': 'failed',
+        'result': '',
+        'expires_at': timezone.now() + timedelta(seconds=REFRESH_FAILURE_SECONDS),
+    }
+
+
+def _try_claim(digest):
+    """Insert the claim row for digest; False when another request holds a live claim"""
+    now = timezone.now()
+    # A claim past expires_at (crashed holder, or an old result) is free again
+    SSORefreshClaim.objects.filter(digest=digest, expires_at__lte=now).delete()
+    try:
+        with transaction.atomic():
+            SSORefreshClaim.objects.create(
+                digest=digest, expires_at=now + timedelta(seconds=settings.SSO_REFRESH_LOCK_SECONDS),
+            )
+    except IntegrityError:
+        return False
+    return True
+
+
+async def _atry_claim(digest):
+    now = timezone.now()
+    await SSORefreshClaim.objects.filter(digest=digest, expires_at__lte=now).adelete()
+    try:
+        await SSORefreshClaim.objects.acreate(
+            digest=digest, expires_at=now + timedelta(seconds=settings.SSO_REFRESH_LOCK_SECONDS),
         )
-        if response.status_code != 200:
+    except IntegrityError:
+        return False
+    return True
+
+
+def refresh_tokens_once(refresh_token, wait=True):
+    """
+    Exchange refresh_token for (access, refresh), or None, with one SSO call per refresh
+    token across all processes. Concurrent callers wait for that call's result; with
+    wait=False they return None immediately instead.
+    """
+    digest = _refresh_digest(refresh_token)
+    deadline = time.monotonic() + settings.SSO_REFRESH_LOCK_SECONDS
+    while True:
+        claim = _live_claims(digest).first()
+        if claim is not None and claim.status != 'pending':
+            return _claim_result(claim, refresh_token)
+        if claim is None and _try_claim(digest):
+            break
+        if not wait or time.monotonic() >= deadline:
             return None
-        data = response.json()
-        new_access = data.get('access')
-        new_refresh = data.get('refresh')
-        if not new_access:
+        time.sleep(REFRESH_POLL_SECONDS)
+
+    result = _post_refresh(refresh_token)
+    SSORefreshClaim.objects.filter(digest=digest).update(**_finished_claim_fields(refresh_token, result))
+    # Keep the table small: drop every other claim that has expired
+    SSORefreshClaim.objects.filter(expires_at__lte=timezone.now()).delete()
+    return result
+
+
+async def arefresh_tokens_once(refresh_token, wait=True):
+    """Async refresh_tokens_once(): same claim and shared result, polled with asyncio.sleep"""
+    digest = _refresh_digest(refresh_token)
+    deadline = time.monotonic() + settings.SSO_REFRESH_LOCK_SECONDS
+    while True:
+        claim = await _live_claims(digest).afirst()
+        if claim is not None and claim.status != 'pending':
+            return _claim_result(claim, refresh_token)
+        if claim is None and await _atry_claim(digest):
+            break
+        if not wait or time.monotonic() >= deadline:
             return None
-        request.session['access_token'] = new_access
-        if new_refresh:
-            request.session['refresh_token'] = new_refresh
-        request.session.save()
-        if getattr(settings, 'PUBLIC_AUTH_COOKIE_DOMAIN', '').strip():
-            request._public_sso_cookie_tokens = (
-                new_access,
-                new_refresh or refresh_token,
-            )
-        return new_access
-    except Exception:
+        await asyncio.sleep(REFRESH_POLL_SECONDS)
+
+    result = await _apost_refresh(refresh_token)
+    await SSORefreshClaim.objects.filter(digest=digest).aupdate(**_finished_claim_fields(refresh_token, result))
+    await SSORefreshClaim.objects.filter(expires_at__lte=timezone.now()).adelete()
+    return result
+
+
+def _remember_public_cookie_tokens(request, new_access, new_refresh, refresh_token):
+    if getattr(settings, 'PUBLIC_AUTH_COOKIE_DOMAIN', '').strip():
+        request._public_sso_cookie_tokens = (
+            new_access,
+            new_refresh or refresh_token,
+        )
+
+
+def refresh_sso_session_tokens(request, wait=True):
+    """
+    POST /api/auth/token/refresh/ using the session refresh token; update session.
+    Returns new access token or None. Sets request._public_sso_cookie_tokens when
+    PUBLIC_AUTH_COOKIE_DOMAIN is used so process_response can update arna_sso_*.
+    """
+    refresh_token = request.session.get('refresh_token')
+    if not refresh_token:
+        return None
+    result = refresh_tokens_once(refresh_token, wait=wait)
+    if not result:
+        return None
+    new_access, new_refresh = result
+    request.session['access_token'] = new_access
+    if new_refresh:
+        request.session['refresh_token'] = new_refresh
+    _remember_public_cookie_tokens(request, new_access, new_refresh, refresh_token)
+    return new_access
+
+
+async def arefresh_sso_session_tokens(request, wait=True):
+    """Async refresh_sso_session_tokens()"""
+    refresh_token = await request.session.aget('refresh_token')
+    if not refresh_token:
+        return None
+    result = await arefresh_tokens_once(refresh_token, wait=wait)
+    if not result:
+        return None
+    new_access, new_refresh = result
+    await request.session.aset('access_token', new_access)
+    if new_refresh:
+        await request.session.aset('refresh_token', new_refresh)
+    _remember_public_cookie_tokens(request, new_access, new_refresh, refresh_token)
+    return new_access
+
+
+def _expires_within_window(access):
+    window = settings.SSO_PROACTIVE_REFRESH_SECONDS
+    exp = unverified_exp(access)
+    return exp is not None and exp - time.time() <= window
+
+
+def renew_expiring_session_tokens(request):
+    """
+    Refresh ahead of time when the session access token expires within
+    SSO_PROACTIVE_REFRESH_SECONDS (0 disables). Never waits on a refresh already in flight:
+    the current token is still valid for this request.
+    """
+    if not settings.SSO_PROACTIVE_REFRESH_SECONDS:
+        return None
+    access = request.session.get('access_token')
+    if not access or not request.session.get('refresh_token') or not _expires_within_window(access):
+        return None
+    return refresh_sso_session_tokens(request, wait=False)
+
+
+async def arenew_expiring_session_tokens(request):
+    """Async renew_expiring_session_tokens()"""
+    if not settings.SSO_PROACTIVE_REFRESH_SECONDS:
+        return None
+    access = await request.session.aget('access_token')
+    if not access or not await request.session.aget('refresh_token') or not _expires_within_window(access):
         return None
+    return await arefresh_sso_session_tokens(request, wait=False)
 
 
 def _cookie_params(max_age):
@@ -1,16 +1,39 @@
 """
 Fetch UserProfile from SSO API (swagger: GET /api/profiles/, definitions.UserProfile).
+
+Profile completeness (for the reminder modal) is cached server-side per sso_id in the
+shared Django cache, across sessions and devices. Entries older than
+PROFILE_COMPLETION_REMINDER_CACHE_SECONDS are still served, while a background thread
+refreshes them from SSO, so rendering a page never waits on SSO for the reminder. One
+refresh runs per user across processes: it is claimed by inserting an
+SSOProfileRefreshClaim row, like the token refresh claims in sso_cookies.
 """
 import logging
-from typing import Any, Dict, Optional
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Any, Dict, List, Optional
 
-import requests
 from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
 
-from authentication.sso_cookies import refresh_sso_session_tokens
+from authentication import sso_client
+from authentication.models import SSOProfileRefreshClaim
+from authentication.sso_cookies import arefresh_sso_session_tokens
 
 logger = logging.getLogger(__name__)
 
+COMPLETENESS_KEY_PREFIX = 'sso:profile-completeness:'
+REQUIRED_PROFILE_FIELDS = ('full_name', 'profile_picture', 'phone_number')
+# Upper bound on one background refresh (connect + read timeout)
+REFRESH_LOCK_SECONDS = 30
+
+_refresh_pool = None
+_refresh_pool_lock = threading.Lock()
+
 
 def _profiles_list_from_response(data: Any) -> Optional[list]:
     if isinstance(data, list):
@@ -46,62 +69,171 @@ def _pick_profile(payload: Any, sso_user_id: str) -> Optional[dict]:
     return None
 
 
-def fetch_sso_user_profile(request) -> Dict[str, str]:
+def _profiles_headers(access: str) -> Dict[str, str]:
+    return {
+        'Authorization': f'Bearer {access}',
+        'Accept': 'application/json',
+    }
+
+
+def _request_profiles(access: str):
+    return sso_client.get('profiles', '/api/profiles/', headers=_profiles_headers(access))
+
+
+async def _arequest_profiles(access: str):
+    return await sso_client.aget('profiles', '/api/profiles/', headers=_profiles_headers(access))
+
+
+def _profile_from_response(response, sso_user_id: str) -> Optional[Dict[str, str]]:
+    """Profile dict from a /api/profiles/ response (EMPTY_PROFILE when the user has none); None on failure."""
+    if response.status_code != 200:
+        logger.warning(
+            'SSO profiles list HTTP %s: %s',
+            response.status_code,
+            response.text[:200],
+        )
+        return None
+
+    data = response.json()
+    listings = _profiles_list_from_response(data)
+    if listings is None:
+        logger.warning('SSO profiles unexpected JSON shape: %s', type(data).__name__)
+        return None
+    raw = _pick_profile(listings, sso_user_id)
+    if not raw:
+        return dict(EMPTY_PROFILE)
+
+    return {
+        'full_name': (raw.get('full_name') or '') if isinstance(raw.get('full_name'), str) else '',
+        'bio': (raw.get('bio') or '') if isinstance(raw.get('bio'), str) else '',
+        'profile_picture': (raw.get('profile_picture') or '') if isinstance(raw.get('profile_picture'), str) else '',
+        'phone_number': (raw.get('phone_number') or '') if isinstance(raw.get('phone_number'), str) else '',
+        'user_name': (raw.get('user_name') or '') if isinstance(raw.get('user_name'), str) else '',
+    }
+
+
+async def afetch_sso_user_profile(request) -> Dict[str, str]:
     """
     Load the current user's profile from GET /api/profiles/ using Bearer access token.
-    On 401, try refresh_sso_session_tokens once then retry.
+    On 401, try arefresh_sso_session_tokens once then retry.
     Returns a dict with keys: full_name, bio, profile_picture, phone_number, user_name.
+    A successful fetch also refreshes the user's cached profile completeness.
     """
-    user = getattr(request, 'user', None)
-    if not user or not user.is_authenticated:
+    user = await request.auser()
+    if not user.is_authenticated:
         return dict(EMPTY_PROFILE)
 
-    access = request.session.get('access_token')
-    if not access:
+    access = await request.session.aget('access_token')
+    if not access or not await sso_client.ais_available():
         return dict(EMPTY_PROFILE)
 
-    def _request(tok: str):
-        return requests.get(
-            f'{settings.SSO_BASE_URL}/api/profiles/',
-            headers={
-                'Authorization': f'Bearer {tok}',
-                'Accept': 'application/json',
-            },
-            timeout=15,
-        )
-
+    sso_user_id = str(getattr(user, 'sso_id', '') or '')
     try:
-        response = _request(access)
-        if response.status_code == 401 and request.session.get('refresh_token'):
-            new_tok = refresh_sso_session_tokens(request)
+        response = await _arequest_profiles(access)
+        if response.status_code == 401 and await request.session.aget('refresh_token'):
+            new_tok = await arefresh_sso_session_tokens(request)
             if new_tok:
                 access = new_tok
-                response = _request(access)
+                response = await _arequest_profiles(access)
 
-        if response.status_code != 200:
-            logger.warning(
-                'SSO profiles list HTTP %s: %s',
-                response.status_code,
-                response.text[:200],
-            )
-            return dict(EMPTY_PROFILE)
-
-        data = response.json()
-        listings = _profiles_list_from_response(data)
-        if listings is None:
-            logger.warning('SSO profiles unexpected JSON shape: %s', type(data).__name__)
-            return dict(EMPTY_PROFILE)
-        raw = _pick_profile(listings, str(getattr(user, 'sso_id', '') or ''))
-        if not raw:
-            return dict(EMPTY_PROFILE)
-
-        return {
-            'full_name': (raw.get('full_name') or '') if isinstance(raw.get('full_name'), str) else '',
-            'bio': (raw.get('bio') or '') if isinstance(raw.get('bio'), str) else '',
-            'profile_picture': (raw.get('profile_picture') or '') if isinstance(raw.get('profile_picture'), str) else '',
-            'phone_number': (raw.get('phone_number') or '') if isinstance(raw.get('phone_number'), str) else '',
-            'user_name': (raw.get('user_name') or '') if isinstance(raw.get('user_name'), str) else '',
-        }
+        profile = _profile_from_response(response, sso_user_id)
     except Exception as exc:
         logger.exception('SSO profile fetch failed: %s', exc)
         return dict(EMPTY_PROFILE)
+    if profile is None:
+        return dict(EMPTY_PROFILE)
+    await astore_profile_completeness(sso_user_id, profile)
+    return profile
+
+
+def missing_profile_fields(profile: Dict[str, str]) -> List[str]:
+    return [field for field in REQUIRED_PROFILE_FIELDS if not (profile.get(field) or '').strip()]
+
+
+def _completeness_key(sso_user_id: str) -> str:
+    return f'{COMPLETENESS_KEY_PREFIX}{sso_user_id}'
+
+
+def _completeness_entry(profile: Dict[str, str]) -> Dict[str, Any]:
+    return {'ts': time.time(), 'missing': missing_profile_fields(profile)}
+
+
+def store_profile_completeness(sso_user_id: str, profile: Dict[str, str]) -> None:
+    if not sso_user_id:
+        return
+    cache.set(
+        _completeness_key(sso_user_id), _completeness_entry(profile),
+        timeout=settings.PROFILE_COMPLETION_REMINDER_STALE_SECONDS,
+    )
+
+
+async def astore_profile_completeness(sso_user_id: str, profile: Dict[str, str]) -> None:
+    if not sso_user_id:
+        return
+    await cache.aset(
+        _completeness_key(sso_user_id), _completeness_entry(profile),
+        timeout=settings.PROFILE_COMPLETION_REMINDER_STALE_SECONDS,
+    )
+
+
+def cached_missing_profile_fields(user, access_token: str) -> Optional[List[str]]:
+    """
+    Missing required profile fields from the shared cache, or None when not known yet.
+    Never calls SSO itself: a missing or expired entry schedules a background refresh
+    and the stale value (if any) is returned meanwhile.
+    """
+    sso_user_id = str(getattr(user, 'sso_id', '') or '')
+    if not sso_user_id:
+        return None
+    entry = cache.get(_completeness_key(sso_user_id))
+    if entry is None or time.time() - entry['ts'] >= settings.PROFILE_COMPLETION_REMINDER_CACHE_SECONDS:
+        _schedule_completeness_refresh(sso_user_id, access_token)
+    return list(entry['missing']) if entry else None
+
+
+def _get_refresh_pool() -> ThreadPoolExecutor:
+    # Created on first use so uWSGI forks workers before any thread exists
+    global _refresh_pool
+    if _refresh_pool is None:
+        with _refresh_pool_lock:
+            if _refresh_pool is None:
+                _refresh_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='sso-profile')
+    return _refresh_pool
+
+
+def _try_claim_refresh(sso_user_id: str) -> bool:
+    """Insert the refresh claim row for sso_user_id; False when another request holds a live one"""
+    now = timezone.now()
+    # A claim past expires_at (its refresh crashed) is free again
+    SSOProfileRefreshClaim.objects.filter(sso_id=sso_user_id, expires_at__lte=now).delete()
+    try:
+        with transaction.atomic():
+            SSOProfileRefreshClaim.objects.create(
+                sso_id=sso_user_id, expires_at=now + timedelta(seconds=REFRESH_LOCK_SECONDS),
+            )
+    except IntegrityError:
+        return False
+    return True
+
+
+def _schedule_completeness_refresh(sso_user_id: str, access_token: str) -> None:
+    if not access_token or not sso_client.is_available():
+        return
+    if not _try_claim_refresh(sso_user_id):
+        return
+    _get_refresh_pool().submit(_refresh_completeness, sso_user_id, access_token)
+
+
+def _refresh_completeness(sso_user_id: str, access_token: str) -> None:
+    """Background: fetch the profile with the session's access token and cache its completeness"""
+    try:
+        # No token refresh here (no session to update); a 401 leaves the entry for next time
+        profile = _profile_from_response(_request_profiles(access_token), sso_user_id)
+        if profile is not None:
+            store_profile_completeness(sso_user_id, profile)
+    except Exception as exc:
+        logger.warning('SSO profile completeness refresh failed: %s', exc)
+    finally:
+        SSOProfileRefreshClaim.objects.filter(sso_id=sso_user_id).delete()
+        # A pool thread, outside any request cycle that would close its connection
+        connection.close()
@@ -1,3 +1,814 @@
-from django.test import TestCase
+import asyncio
+import json
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+import jwt
+import requests
+from asgiref.sync import async_to_sync
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.backends.signed_cookies import SessionStore
+from django.core.cache import cache
+from django.db import IntegrityError
+from django.db.models.query import QuerySet
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import sso_client
+from .fake_sso import MFA_CODE, FakeSSO
+from .middleware import (
+    PATH_API, PATH_LOGIN, PATH_PAGE, PATH_PUBLIC, PATH_STATIC, JWTAuthenticationMiddleware, classify_path,
+)
+from .models import SSOCircuitBreaker, SSOProfileRefreshClaim, SSORefreshClaim
+from .sso_cookies import (
+    _claim_result, _finished_claim_fields, _refresh_digest, arefresh_tokens_once,
+    copy_public_sso_cookies_to_session, refresh_tokens_once, renew_expiring_session_tokens,
+)
+from .tokens import VerifiedTokenCache, verified_tokens
+from .views import authenticate_with_token
+
+User = get_user_model()
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+_PRIVATE_KEY = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+PUBLIC_PEM = _PRIVATE_KEY.public_key().public_bytes(
+    serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo,
+).decode('ascii')
+
+
+def make_token(sso_id='sso-1', lifetime=3600, **claims):
+    now = int(time.time())
+    return jwt.encode({'user_id': sso_id, 'iat': now, 'exp': now + lifetime, **claims}, _PRIVATE_KEY, algorithm='RS256')
+
+
+@override_settings(SSO_PUBLIC_KEY=PUBLIC_PEM, JWT_ALGORITHM='RS256')
+class SSOTestCase(TestCase):
+    """Signs tokens with a throwaway key that settings.SSO_PUBLIC_KEY verifies"""
+
+    def setUp(self):
+        verified_tokens.clear()
+        self.addCleanup(verified_tokens.clear)
+
+
+class AuthenticateWithTokenTests(SSOTestCase):
+
+    def test_verified_token_is_not_verified_again(self):
+        token = make_token()
+        user = authenticate_with_token(token)
+
+        with mock.patch('authentication.views.verify_token') as verify:
+            self.assertEqual(authenticate_with_token(token), user)
+        verify.assert_not_called()
+        self.assertEqual(user.sso_id, 'sso-1')
+
+    def test_invalid_and_expired_tokens_are_rejected(self):
+        self.assertIsNone(authenticate_with_token(make_token(lifetime=-10)))
+        self.assertIsNone(authenticate_with_token(make_token() + 'x'))
+        self.assertEqual(len(verified_tokens), 0)
+        self.assertFalse(User.objects.exists())
+
+    def test_known_token_is_not_written_again(self):
+        token = make_token()
+        authenticate_with_token(token)
+        verified_tokens.clear()
+
+        with self.assertNumQueries(1):
+            user = authenticate_with_token(token)
+        self.assertEqual(user.sso_access_token, token)
+
+    def test_new_token_updates_only_the_token_column(self):
+        authenticate_with_token(make_token())
+        User.objects.filter(sso_id='sso-1').update(first_name='Ana')
+        token = make_token(jti='second')
+
+        with self.assertNumQueries(2):
+            authenticate_with_token(token)
+        user = User.objects.get(sso_id='sso-1')
+        self.assertEqual((user.sso_access_token, user.first_name), (token, 'Ana'))
+
+    def test_cached_user_that_was_deleted_falls_back_to_verification(self):
+        token = make_token()
+        authenticate_with_token(token).delete()
+
+        user = authenticate_with_token(token)
+
+        self.assertEqual(User.objects.get().pk, user.pk)
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_concurrent_first_login_converges_on_the_other_row(self):
+        # The other request inserted the row after our get missed it, so our create collides
+        User.objects.create(sso_id='sso-1', email='sso-1@arnatech.id', sso_access_token='theirs')
+        token = make_token(jti='ours')
+        real_get = QuerySet.get
+
+        def get_missing_once(queryset, *args, **kwargs):
+            if queryset.model is User and not missed:
+                missed.append(kwargs)
+                raise User.DoesNotExist
+            return real_get(queryset, *args, **kwargs)
+
+        missed = []
+        self.client.cookies['arna_sso_access_token'] = token
+        with mock.patch.object(QuerySet, 'get', autospec=True, side_effect=get_missing_once), \
+                mock.patch.object(QuerySet, 'create', autospec=True, side_effect=IntegrityError('duplicate key')) as create:
+            self.client.get(reverse('authentication:login'))
+
+        self.assertEqual(missed, [{'sso_id': 'sso-1'}])
+        create.assert_called_once()
+        user = User.objects.get()
+        self.assertEqual(user.sso_access_token, token)
+        self.assertEqual(int(self.client.session['_auth_user_id']), user.pk)
+
+
+class VerifiedTokenCacheTests(TestCase):
+
+    @override_settings(JWT_VERIFIED_CACHE_SIZE=2, JWT_VERIFIED_CACHE_SECONDS=300)
+    def test_least_recently_used_entries_are_dropped(self):
+        cache = VerifiedTokenCache()
+        exp = time.time() + 60
+        for n in range(3):
+            cache.put(f'token-{n}', n, exp)
+            cache.get('token-0')
+
+        self.assertEqual(cache.get('token-0'), 0)
+        self.assertIsNone(cache.get('token-1'))
+        self.assertEqual(cache.get('token-2'), 2)
+
+    @override_settings(JWT_VERIFIED_CACHE_SIZE=10, JWT_VERIFIED_CACHE_SECONDS=300)
+    def test_entries_expire_with_the_token(self):
+        cache = VerifiedTokenCache()
+        cache.put('token', 1, time.time() + 60)
+
+        with mock.patch('authentication.tokens.time.time', return_value=time.time() + 61):
+            self.assertIsNone(cache.get('token'))
+
+
+@override_settings(CACHES=LOCMEM_CACHES, SSO_REFRESH_LOCK_SECONDS=5, SSO_REFRESH_RESULT_SECONDS=10)
+class SingleFlightRefreshTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch('authentication.sso_client.post', side_effect=self._sso_refresh)
+        self.post = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.status = 200
+
+    def _sso_refresh(self, endpoint, path, json=None, **kwargs):
+        return mock.Mock(status_code=self.status, json=lambda: {'access': 'new-access', 'refresh': 'new-refresh'})
+
+    def _claim(self, expires_in=5):
+        return SSORefreshClaim.objects.create(
+            digest=_refresh_digest('old-refresh'), expires_at=timezone.now() + timedelta(seconds=expires_in),
+        )
+
+    def test_repeat_refresh_reuses_the_result(self):
+        self.assertEqual(refresh_tokens_once('old-refresh'), ('new-access', 'new-refresh'))
+        self.assertEqual(refresh_tokens_once('old-refresh'), ('new-access', 'new-refresh'))
+        self.assertEqual(self.post.call_count, 1)
+
+    def test_waiter_gets_the_holders_result(self):
+        claim = self._claim()
+
+        def holder_finishes(_seconds):
+            SSORefreshClaim.objects.filter(pk=claim.pk).update(
+                **_finished_claim_fields('old-refresh', ('new-access', 'new-refresh')),
+            )
+
+        with mock.patch('authentication.sso_cookies.time.sleep', side_effect=holder_finishes) as sleep:
+            self.assertEqual(refresh_tokens_once('old-refresh'), ('new-access', 'new-refresh'))
+
+        self.assertEqual(sleep.call_count, 1)
+        self.post.assert_not_called()
+
+    def test_held_claim_is_not_refreshed_again(self):
+        self._claim()
+        self.assertIsNone(refresh_tokens_once('old-refresh', wait=False))
+        self.post.assert_not_called()
+
+    def test_expired_claim_is_taken_over(self):
+        self._claim(expires_in=-1)
+        self.assertEqual(refresh_tokens_once('old-refresh'), ('new-access', 'new-refresh'))
+        self.assertEqual(self.post.call_count, 1)
+
+    def test_failed_refresh_is_shared(self):
+        self.status = 401
+        self.assertIsNone(refresh_tokens_once('old-refresh'))
+        self.assertIsNone(refresh_tokens_once('old-refresh'))
+        self.assertEqual(self.post.call_count, 1)
+
+    def test_result_is_stored_encrypted(self):
+        refresh_tokens_once('old-refresh')
+
+        claim = SSORefreshClaim.objects.get()
+        self.assertNotIn('old-refresh', claim.digest)
+        self.assertNotIn('new-', claim.result)
+        # Another refresh token cannot read it
+        self.assertIsNone(_claim_result(claim, 'other-refresh'))
+
+    def test_async_refresh_shares_the_claim(self):
+        sso_response = mock.Mock(status_code=200, json=lambda: {'access': 'new-access', 'refresh': 'new-refresh'})
+        with mock.patch('authentication.sso_client.apost', mock.AsyncMock(return_value=sso_response)) as apost:
+            self.assertEqual(async_to_sync(arefresh_tokens_once)('old-refresh'), ('new-access', 'new-refresh'))
+            self.assertEqual(refresh_tokens_once('old-refresh'), ('new-access', 'new-refresh'))
+
+        self.assertEqual(apost.await_count, 1)
+        self.post.assert_not_called()
+
+    def test_tokens_near_expiry_are_renewed(self):
+        request = RequestFactory().get('/')
+        request.session = SessionStore()
+        request.session['access_token'] = make_token(lifetime=30)
+        request.session['refresh_token'] = 'old-refresh'
+
+        with override_settings(SSO_PROACTIVE_REFRESH_SECONDS=0):
+            self.assertIsNone(renew_expiring_session_tokens(request))
+        with override_settings(SSO_PROACTIVE_REFRESH_SECONDS=10):
+            self.assertIsNone(renew_expiring_session_tokens(request))
+        with override_settings(SSO_PROACTIVE_REFRESH_SECONDS=60):
+            self.assertEqual(renew_expiring_session_tokens(request), 'new-access')
+
+        self.assertEqual(request.session['refresh_token'], 'new-refresh')
+        self.assertEqual(self.post.call_count, 1)
+
+
+class _FakeSSOHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        server.connections.add(self.client_address)
+        server.cookie_headers.append(self.headers.get('Cookie'))
+        status = server.statuses.pop(0) if server.statuses else 200
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Set-Cookie', 'sessionid=per-user; Path=/')
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+    do_POST = do_GET
+
+    def log_message(self, *args):
+        pass
+
+
+class _LocalSSOServerMixin:
+    """SSO_BASE_URL pointed at a local _FakeSSOHandler server; fresh sessions and counters"""
+
+    def setUp(self):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), _FakeSSOHandler)
+        server.connections, server.cookie_headers, server.statuses = set(), [], []
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.server = server
+        override = override_settings(SSO_BASE_URL=f'http://127.0.0.1:{server.server_port}')
+        override.enable()
+        self.addCleanup(override.disable)
+        sso_client.reset_stats()
+        patcher = mock.patch.object(sso_client, '_session', None)
+        patcher.start()
+        self.addCleanup(lambda: sso_client._session and sso_client._session.close())
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(sso_client, '_async_client', None)
+        patcher.start()
+        self.addCleanup(self._close_async_client)
+        self.addCleanup(patcher.stop)
+
+    def _close_async_client(self):
+        if sso_client._async_client:
+            asyncio.run_coroutine_threadsafe(sso_client._async_client.aclose(), sso_client._get_loop()).result()
+
+
+@override_settings(CACHES=LOCMEM_CACHES, SSO_HTTP_RETRY_BACKOFF=0)
+class SSOClientTests(_LocalSSOServerMixin, TestCase):
+    """authentication.sso_client against a local HTTP server"""
+
+    def test_calls_reuse_one_connection_and_share_no_cookies(self):
+        for _ in range(3):
+            sso_client.get('mfa_status', '/api/auth/mfa/status/')
+        sso_client.post('passkeys_login_complete', '/api/auth/passkeys/login/complete/', cookies={'sessionid': 'mine'})
+
+        self.assertEqual(len(self.server.connections), 1)
+        self.assertEqual(self.server.cookie_headers, [None, None, None, 'sessionid=mine'])
+
+    def test_only_idempotent_requests_are_retried(self):
+        self.server.statuses = [503, 200]
+        self.assertEqual(sso_client.get('mfa_status', '/api/auth/mfa/status/').status_code, 200)
+
+        self.server.statuses = [503, 200]
+        self.assertEqual(sso_client.post('login', '/api/auth/login/').status_code, 503)
+
+        stats = sso_client.sso_client_stats()
+        self.assertEqual((stats['mfa_status']['requests'], stats['mfa_status']['retries']), (1, 1))
+        self.assertEqual((stats['login']['requests'], stats['login']['server_errors']), (1, 1))
+        self.assertNotIn('register', stats)
+
+    def test_async_calls_share_one_pool_and_retry_like_sync_calls(self):
+        self.server.statuses = [503, 200]
+        for _ in range(2):
+            self.assertEqual(async_to_sync(sso_client.aget)('mfa_status', '/api/auth/mfa/status/').status_code, 200)
+        self.server.statuses = [503, 200]
+        response = async_to_sync(sso_client.apost)(
+            'passkeys_login_complete', '/api/auth/passkeys/login/complete/', cookies={'sessionid': 'mine'},
+        )
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(dict(response.cookies), {'sessionid': 'per-user'})
+        self.assertEqual(len(self.server.connections), 1)
+        self.assertEqual(self.server.cookie_headers, [None, None, None, 'sessionid=mine'])
+        stats = sso_client.sso_client_stats()
+        self.assertEqual((stats['mfa_status']['requests'], stats['mfa_status']['retries']), (2, 1))
+
+    def test_async_calls_accept_requests_style_timeouts(self):
+        for timeout in (5, 2.5, (1, 5), None):
+            response = async_to_sync(sso_client.aget)('mfa_status', '/api/auth/mfa/status/', timeout=timeout)
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(sso_client._timeout_pair('mfa_status', 4), (4, 4))
+        self.assertEqual(sso_client._timeout_pair('mfa_status', None), sso_client._timeouts('mfa_status'))
+
+    def test_async_connection_errors_raise_requests_exceptions(self):
+        with override_settings(SSO_BASE_URL='http://127.0.0.1:9', SSO_HTTP_RETRIES=0):
+            with self.assertRaises(requests.ConnectionError):
+                async_to_sync(sso_client.aget)('profiles', '/api/profiles/')
+
+
+@override_settings(CACHES=LOCMEM_CACHES, SSO_HTTP_RETRY_BACKOFF=0)
+class SSOClientAsyncStatsTests(_LocalSSOServerMixin, TransactionTestCase):
+    """Counters of async calls are saved from the SSO event loop thread without blocking it"""
+
+    def test_async_calls_flush_counters_off_the_loop(self):
+        calls = sso_client.STATS_FLUSH_EVERY * 2 + 5
+        flushes = []
+
+        def flush(pending):
+            flushes.append(real_flush(pending))
+            return flushes[-1]
+
+        real_flush = sso_client._flush
+        with mock.patch.object(sso_client, '_flush', flush):
+            for _ in range(calls):
+                self.assertEqual(async_to_sync(sso_client.aget)('mfa_status', '/api/auth/mfa/status/').status_code, 200)
+
+        # Both batches were handed to the executor; wait for their writes
+        self.assertEqual(len(flushes), 2)
+        self.assertTrue(all(flushes))
+
+        async def saved():
+            await asyncio.gather(*flushes)
+
+        asyncio.run_coroutine_threadsafe(saved(), sso_client._get_loop()).result(timeout=10)
+        self.assertEqual(sso_client.sso_client_stats()['mfa_status']['requests'], calls)
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES, SSO_BASE_URL='http://127.0.0.1:9', SSO_HTTP_RETRIES=0,
+    SSO_BREAKER_FAILURE_THRESHOLD=3, SSO_BREAKER_OPEN_SECONDS=30,
+)
+class SSOCircuitBreakerTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        sso_client.reset_stats()
+        self.addCleanup(sso_client.reset_stats)
+        patcher = mock.patch.object(sso_client, '_session', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.session = sso_client.get_session()
+        self.session.request = mock.Mock(side_effect=requests.ConnectTimeout('timed out'))
+
+    def _call(self):
+        return sso_client.get('profiles', '/api/profiles/')
+
+    def _fail_until_open(self):
+        with self.assertLogs('authentication.sso_client', 'WARNING'):
+            for _ in range(3):
+                with self.assertRaises(requests.ConnectTimeout):
+                    self._call()
+
+    def test_opens_after_consecutive_failures_and_fails_fast(self):
+        self._fail_until_open()
+
+        with self.assertRaises(sso_client.SSOUnavailable):
+            self._call()
+        self.assertEqual(self.session.request.call_count, 3)
+        self.assertFalse(sso_client.is_available())
+        self.assertEqual(sso_client.breaker_state()['state'], 'open')
+
+    def test_half_open_probe_closes_on_success(self):
+        self._fail_until_open()
+        self.session.request.side_effect = None
+        self.session.request.return_value = mock.Mock(status_code=200, raw=None)
+
+        with mock.patch('authentication.sso_client.timezone.now', return_value=timezone.now() + timedelta(seconds=31)):
+            self.assertEqual(self._call().status_code, 200)
+        self.assertEqual(sso_client.breaker_state(), {'state': 'closed', 'consecutive_failures': 0, 'open_until': None})
+
+    def test_half_open_lets_one_probe_through(self):
+        self._fail_until_open()
+        later = timezone.now() + timedelta(seconds=31)
+
+        with mock.patch('authentication.sso_client.timezone.now', return_value=later):
+            admission = sso_client._breaker_admit()
+            self.assertEqual(admission, (True, 3))
+            # The probe is claimed in the shared row, so no other process gets one either
+            with self.assertRaises(sso_client.SSOUnavailable):
+                sso_client._breaker_admit()
+            with self.assertLogs('authentication.sso_client', 'WARNING'):
+                sso_client._breaker_result(False, admission)
+
+            self.assertEqual(sso_client.breaker_state()['state'], 'open')
+
+    def test_breaker_opened_by_another_process_fails_fast_here(self):
+        SSOCircuitBreaker.objects.create(
+            name=sso_client.BREAKER_NAME, consecutive_failures=3, open_until=timezone.now() + timedelta(seconds=30),
+        )
+
+        with self.assertRaises(sso_client.SSOUnavailable):
+            self._call()
+        with self.assertRaises(sso_client.SSOUnavailable):
+            async_to_sync(sso_client.aget)('profiles', '/api/profiles/')
+        self.session.request.assert_not_called()
+        self.assertFalse(async_to_sync(sso_client.ais_available)())
+
+    def test_successful_call_on_a_closed_breaker_only_reads_it(self):
+        self.session.request.side_effect = None
+        self.session.request.return_value = mock.Mock(status_code=200, raw=None)
+
+        with self.assertNumQueries(1):
+            self._call()
+        self.assertFalse(SSOCircuitBreaker.objects.exists())
+
+    def test_profile_reminder_is_skipped_while_open(self):
+        from .context_processors import profile_completion_reminder
+
+        self._fail_until_open()
+        request = RequestFactory().get('/')
+        request.session = SessionStore()
+        request.session['access_token'] = 'token'
+        request.user = User.objects.create(sso_id='sso-1', email='sso-1@example.com')
+
+        self.assertFalse(profile_completion_reminder(request)['show_profile_completion_reminder'])
+        self.assertEqual(self.session.request.call_count, 3)
+
+
+class SSOClientStatsTests(TestCase):
+    """Shared SSO counters are database rows; admins read them at /auth/api/sso/stats/"""
+
+    def setUp(self):
+        sso_client.reset_stats()
+
+    def test_counters_are_summed_in_the_database(self):
+        sso_client._add_to_shared({('login', 'requests'): 2, ('login', 'latency_ms'): 50})
+        sso_client._add_to_shared({('login', 'requests'): 3, ('login', 'errors'): 1, ('login', 'latency_ms'): 75})
+
+        stats = sso_client.sso_client_stats()
+
+        self.assertEqual(stats['login']['requests'], 5)
+        self.assertEqual(stats['login']['errors'], 1)
+        self.assertEqual(stats['login']['avg_latency_ms'], 25.0)
+
+    def test_stats_view_is_for_admins(self):
+        sso_client._add_to_shared({('login', 'requests'): 1})
+        user = User.objects.create(sso_id='emp', email='emp@example.com')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(reverse('authentication:api_sso_client_stats')).status_code, 302)
+
+        user.is_staff = True
+        user.save()
+        response = self.client.get(reverse('authentication:api_sso_client_stats'))
+
+        self.assertEqual(response.json()['endpoints']['login']['requests'], 1)
+        self.assertEqual(response.json()['breaker']['state'], 'closed')
+
+
+class _InlinePool:
+    def __init__(self):
+        self.submitted = 0
+
+    def submit(self, fn, *args):
+        self.submitted += 1
+        # A pool thread closes its own connection when done; inline, that would be the test's
+        with mock.patch('authentication.sso_profile.connection'):
+            fn(*args)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, PROFILE_COMPLETION_REMINDER_CACHE_SECONDS=300)
+class ProfileReminderCacheTests(TestCase):
+    """The reminder reads completeness cached per sso_id; SSO is only called in the background"""
+
+    def setUp(self):
+        from .context_processors import profile_completion_reminder
+
+        self.reminder = profile_completion_reminder
+        cache.clear()
+        sso_client.reset_stats()
+        self.user = User.objects.create(sso_id='sso-1', email='sso-1@example.com')
+        self.pool = _InlinePool()
+        patcher = mock.patch('authentication.sso_profile._get_refresh_pool', return_value=self.pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        profile = {'user': 'sso-1', 'full_name': 'Ana', 'profile_picture': 'a.png', 'phone_number': ''}
+        patcher = mock.patch('authentication.sso_client.get', return_value=mock.Mock(
+            status_code=200, json=lambda: [profile],
+        ))
+        self.sso_get = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _render(self):
+        request = RequestFactory().get('/')
+        request.session = SessionStore()
+        request.session['access_token'] = 'token'
+        request.user = self.user
+        return self.reminder(request)
+
+    def test_first_render_does_not_wait_and_later_sessions_share_the_result(self):
+        with mock.patch('authentication.sso_profile._get_refresh_pool', return_value=mock.Mock()) as pool:
+            self.assertFalse(self._render()['show_profile_completion_reminder'])
+        pool.return_value.submit.assert_called_once()
+        self.sso_get.assert_not_called()
+
+        cache.clear()
+        SSOProfileRefreshClaim.objects.all().delete()  # the mocked pool never released it
+        self._render()  # refresh runs inline here
+        context = self._render()  # another session, same user
+
+        self.assertTrue(context['show_profile_completion_reminder'])
+        self.assertEqual(context['profile_reminder_missing'], ['phone_number'])
+        self.assertEqual(self.sso_get.call_count, 1)
+
+    def test_stale_value_is_served_while_refreshing(self):
+        self._render()
+        with mock.patch('authentication.sso_profile.time.time', return_value=time.time() + 301):
+            self.sso_get.return_value = mock.Mock(status_code=503, text='down')
+            with self.assertLogs('authentication.sso_profile', 'WARNING'):
+                context = self._render()
+
+        self.assertEqual(context['profile_reminder_missing'], ['phone_number'])
+        self.assertEqual(self.pool.submitted, 2)
+
+    def test_refresh_claimed_by_another_process_is_not_repeated(self):
+        SSOProfileRefreshClaim.objects.create(
+            sso_id='sso-1', expires_at=timezone.now() + timedelta(seconds=30),
+        )
+        self.assertFalse(self._render()['show_profile_completion_reminder'])
+        self.assertEqual(self.pool.submitted, 0)
+
+        SSOProfileRefreshClaim.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self._render()  # an expired claim is free again
+        self.assertEqual(self.pool.submitted, 1)
+        self.assertFalse(SSOProfileRefreshClaim.objects.exists())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SessionTests(TestCase):
+
+    def test_session_cookie_carries_only_the_session_id(self):
+        self.client.cookies['arna_sso_access_token'] = 'a' * 1200
+        self.client.cookies['arna_sso_refresh_token'] = 'r' * 1200
+        response = self.client.get(reverse('authentication:login'))
+
+        session_cookie = response.cookies['sessionid'].value
+        self.assertLess(len(session_cookie), 64)
+        self.assertEqual(self.client.session['access_token'], 'a' * 1200)
+
+    def test_unchanged_public_cookies_do_not_modify_the_session(self):
+        request = RequestFactory().get('/')
+        request.COOKIES = {'arna_sso_access_token': 'access', 'arna_sso_refresh_token': 'refresh'}
+        request.session = self.client.session
+        request.session.update({'access_token': 'access', 'refresh_token': 'refresh'})
+        request.session.save()
+        request.session.modified = False
+
+        copy_public_sso_cookies_to_session(request)
+        self.assertFalse(request.session.modified)
+
+        request.COOKIES['arna_sso_access_token'] = 'rotated'
+        copy_public_sso_cookies_to_session(request)
+        self.assertTrue(request.session.modified)
+        self.assertEqual(request.session['access_token'], 'rotated')
+
+
+class MiddlewarePathClassTests(SSOTestCase):
+
+    def _request(self, path, **session):
+        request = RequestFactory().get(path)
+        request.session = self.client.session
+        request.session.update(session)
+        request.session.accessed = False
+        request.user = AnonymousUser()
+        return request
+
+    def test_classify_path(self):
+        cases = {
+            '/static/css/app.css': PATH_STATIC,
+            '/favicon.ico': PATH_STATIC,
+            '/auth/api/login/': PATH_PUBLIC,
+            '/auth/api/passkeys/login/begin/': PATH_PUBLIC,
+            '/admin/auth/user/': PATH_PUBLIC,
+            '/': PATH_LOGIN,
+            '/auth/login/': PATH_LOGIN,
+            '/auth/logout/': PATH_LOGIN,
+            '/auth/api/mfa/status/': PATH_API,
+            '/activities/api/activities/': PATH_API,
+            '/dashboard/': PATH_PAGE,
+            '/favicon.ico/x': PATH_PAGE,
+        }
+        for path, expected in cases.items():
+            with self.subTest(path=path):
+                self.assertEqual(classify_path(path), expected)
+
+    def test_public_api_does_not_touch_the_session(self):
+        request = self._request('/auth/api/login/')
+        request.COOKIES['arna_sso_access_token'] = 'access'
+
+        self.assertIsNone(JWTAuthenticationMiddleware(lambda r: None).process_request(request))
+        self.assertFalse(request.session.accessed)
+
+    def test_page_logs_in_from_session_token(self):
+        request = self._request('/dashboard/', access_token=make_token())
+
+        self.assertIsNone(JWTAuthenticationMiddleware(lambda r: None).process_request(request))
+        self.assertTrue(request.user.is_authenticated)
+        self.assertEqual(request.user.sso_id, 'sso-1')
+
+    def test_invalid_token_on_api_path_returns_401(self):
+        request = self._request('/auth/api/mfa/status/', access_token='not-a-jwt')
+
+        response = JWTAuthenticationMiddleware(lambda r: None).process_request(request)
+        self.assertEqual(response.status_code, 401)
+        self.assertNotIn('access_token', request.session)
+
+    def test_async_path_logs_in_from_session_token(self):
+        async def get_response(request):
+            return HttpResponse()
+
+        async def auser():
+            return AnonymousUser()
+
+        request = self._request('/dashboard/', access_token=make_token())
+        request.auser = auser
+
+        response = async_to_sync(JWTAuthenticationMiddleware(get_response))(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(request.user.is_authenticated)
+        self.assertEqual(request.user.sso_id, 'sso-1')
+
+
+class AsyncSSOViewTests(SSOTestCase):
+
+    def test_login_stores_tokens_and_logs_in(self):
+        access, refresh = make_token(), 'refresh-1'
+        sso_response = mock.Mock(status_code=200, json=lambda: {'access': access, 'refresh': refresh})
+        with mock.patch('authentication.sso_client.apost', mock.AsyncMock(return_value=sso_response)) as apost:
+            response = self.client.post(
+                reverse('authentication:api_login'),
+                json.dumps({'email': 'ana@example.com', 'password': 'secret'}),
+                content_type='application/json',
+            )
+
+        self.assertEqual(response.json(), {'success': True, 'redirect_url': '/dashboard/'})
+        self.assertEqual(apost.await_args.args[0], 'login')
+        self.assertEqual(self.client.session['access_token'], access)
+        self.assertEqual(self.client.session['refresh_token'], refresh)
+        self.assertEqual(User.objects.get(pk=self.client.session['_auth_user_id']).sso_id, 'sso-1')
+
+    def test_proxy_view_reports_unreachable_sso(self):
+        user = User.objects.create(sso_id='sso-1', email='sso-1@example.com')
+        self.client.force_login(user)
+        session = self.client.session
+        session['access_token'] = 'token'
+        session.save()
+
+        failing = mock.AsyncMock(side_effect=requests.ConnectionError('refused'))
+        with mock.patch('authentication.sso_client.aget', failing):
+            response = self.client.get(reverse('authentication:api_mfa_status'))
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(failing.await_args.kwargs['headers'], {'Authorization': 'Bearer token'})
+
+
+@override_settings(CACHES=LOCMEM_CACHES, SECURITY_STATUS_CACHE_SECONDS=60)
+class SecurityStatusTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create(sso_id='sso-1', email='sso-1@example.com')
+        self.client.force_login(user)
+        session = self.client.session
+        session['access_token'] = 'token'
+        session.save()
+        self.responses = {
+            'mfa_status': mock.Mock(status_code=200, json=lambda: {'mfa_enabled': True}),
+            'passkeys_list': mock.Mock(status_code=200, json=lambda: [{'id': 1, 'name': 'Laptop'}]),
+        }
+        patcher = mock.patch(
+            'authentication.sso_client.aget',
+            mock.AsyncMock(side_effect=lambda endpoint, path, **kwargs: self.responses[endpoint]),
+        )
+        self.aget = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _status(self):
+        return self.client.get(reverse('authentication:api_security_status')).json()
+
+    def test_one_fan_out_then_cached_per_user(self):
+        expected = {'mfa_enabled': True, 'passkeys': [{'id': 1, 'name': 'Laptop'}]}
+        self.assertEqual(self._status(), expected)
+        self.assertEqual(self._status(), expected)
+
+        self.assertEqual(sorted(call.args[0] for call in self.aget.await_args_list), ['mfa_status', 'passkeys_list'])
+
+    def test_partial_failure_is_not_cached(self):
+        self.responses['passkeys_list'] = mock.Mock(status_code=503)
+        with self.assertLogs('authentication.security_status', 'WARNING'):
+            self.assertEqual(self._status(), {'mfa_enabled': True, 'passkeys': None})
+        self.responses['passkeys_list'] = mock.Mock(status_code=200, json=lambda: [])
+
+        self.assertEqual(self._status(), {'mfa_enabled': True, 'passkeys': []})
+        self.assertEqual(self.aget.await_count, 4)
+
+    def test_mfa_change_drops_the_cached_status(self):
+        self._status()
+        disabled = mock.Mock(status_code=200, json=lambda: {'detail': 'MFA disabled'})
+        with mock.patch('authentication.sso_client.apost', mock.AsyncMock(return_value=disabled)):
+            self.client.post(reverse('authentication:api_mfa_disable'), '{}', content_type='application/json')
+        self.responses['mfa_status'] = mock.Mock(status_code=200, json=lambda: {'mfa_enabled': False})
+
+        self.assertFalse(self._status()['mfa_enabled'])
+        self.assertEqual(self.aget.await_count, 4)
+
+
+class FakeSSOIntegrationTests(TestCase):
+    """The real views and SSO client against authentication.fake_sso"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.fake = FakeSSO().start()
+        cls.addClassCleanup(cls.fake.stop)
+
+    def setUp(self):
+        self.fake.failure_rate = 0.0
+        override = override_settings(
+            CACHES=LOCMEM_CACHES, SSO_BASE_URL=self.fake.base_url, SSO_PUBLIC_KEY=self.fake.public_pem,
+            JWT_ALGORITHM='RS256', SSO_HTTP_RETRIES=0,
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        cache.clear()
+        sso_client.reset_stats()
+        verified_tokens.clear()
+        self.addCleanup(verified_tokens.clear)
+
+    def _login(self, email, password='secret'):
+        return self.client.post(
+            reverse('authentication:api_login'), json.dumps({'email': email, 'password': password}),
+            content_type='application/json',
+        )
+
+    def test_login_then_profile_and_security_status(self):
+        self.fake.add_user('ana@example.com', 'secret', full_name='Ana', phone_number='0812')
+
+        self.assertEqual(self._login('ana@example.com').json()['success'], True)
+        self.assertContains(self.client.get(reverse('authentication:profile')), 'Ana')
+        status = self.client.get(reverse('authentication:api_security_status')).json()
+
+        self.assertEqual(status, {'mfa_enabled': False, 'passkeys': []})
+        self.assertEqual(User.objects.get().sso_id, self.fake.user('ana@example.com')['sso_id'])
+
+    def test_mfa_login(self):
+        self.fake.add_user('mfa@example.com', 'secret', mfa_enabled=True)
+        pre_auth = self._login('mfa@example.com').json()['token']
+
+        response = self.client.post(
+            reverse('authentication:mfa_verify'), json.dumps({'token': pre_auth, 'mfa_token': MFA_CODE}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.json()['success'], True)
+
+    def test_middleware_refreshes_an_expired_session_token(self):
+        user = self.fake.add_user('bob@example.com')
+        tokens = self.fake.issue_tokens(user)
+        session = self.client.session
+        session.update({'access_token': make_token(lifetime=-60), 'refresh_token': tokens['refresh']})
+        session.save()
+
+        response = self.client.get(reverse('authentication:api_mfa_status'))
+
+        self.assertEqual(response.json(), {'mfa_enabled': False})
+        self.assertNotEqual(self.client.session['refresh_token'], tokens['refresh'])
+        self.assertEqual(self.fake.request_counts['token_refresh'], 1)
+
+    def test_injected_failures_surface_as_unavailable(self):
+        self.fake.failure_rate = 1.0
+        self.assertEqual(self._login('ana@example.com').status_code, 503)
@@ -0,0 +1,111 @@
+"""
+SSO access token (JWT) verification for the authentication hot path.
+
+The SSO public key is parsed once per process (per PEM/algorithm pair) instead of on
+every decode. Tokens that passed full verification are remembered in a bounded
+in-process LRU keyed by the token's SHA-256, mapping to the Django user id they
+resolved to; an entry never outlives the token's exp (nor JWT_VERIFIED_CACHE_SECONDS),
+so a cache hit skips RSA verification without extending any token's lifetime.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+import jwt
+from django.conf import settings
+
+DECODE_OPTIONS = {
+    "verify_signature": True,
+    "verify_exp": True,
+    "verify_nbf": True,
+    "verify_iat": True,
+    "verify_aud": False,  # Skip audience verification
+    "verify_iss": False,  # Skip issuer verification
+}
+
+
+@lru_cache(maxsize=4)
+def _prepared_key(pem, algorithm):
+    return jwt.get_algorithm_by_name(algorithm).prepare_key(pem)
+
+
+def sso_public_key():
+    """SSO_PUBLIC_KEY parsed into a key object for JWT_ALGORITHM (cached per process)"""
+    if not settings.SSO_PUBLIC_KEY:
+        return None
+    return _prepared_key(settings.SSO_PUBLIC_KEY, settings.JWT_ALGORITHM)
+
+
+def verify_token(access_token):
+    """Verified claims of an SSO access token, or None when invalid or expired"""
+    key = sso_public_key()
+    if key is None:
+        return None
+    try:
+        return jwt.decode(access_token, key, algorithms=[settings.JWT_ALGORITHM], options=DECODE_OPTIONS)
+    except jwt.InvalidTokenError:
+        return None
+
+
+def unverified_exp(access_token):
+    """exp claim read without verification (only to schedule a refresh), or None"""
+    try:
+        exp = jwt.decode(access_token, options={"verify_signature": False}).get('exp')
+    except jwt.InvalidTokenError:
+        return None
+    return exp if isinstance(exp, (int, float)) else None
+
+
+def token_digest(access_token):
+    return hashlib.sha256(access_token.encode('utf-8')).digest()
+
+
+class VerifiedTokenCache:
+    """Thread-safe LRU of token digest -> (user_id, expires_at)"""
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, access_token):
+        """User id a still-valid cached token resolved to, or None"""
+        digest = token_digest(access_token)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                return None
+            user_id, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[digest]
+                return None
+            self._entries.move_to_end(digest)
+            return user_id
+
+    def put(self, access_token, user_id, exp):
+        """Remember a verified token until its exp (capped by JWT_VERIFIED_CACHE_SECONDS)"""
+        max_size = settings.JWT_VERIFIED_CACHE_SIZE
+        if not max_size or not isinstance(exp, (int, float)):
+            return
+        expires_at = min(exp, time.time() + settings.JWT_VERIFIED_CACHE_SECONDS)
+        digest = token_digest(access_token)
+        with self._lock:
+            self._entries[digest] = (user_id, expires_at)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > max_size:
+                self._entries.popitem(last=False)
+
+    def discard(self, access_token):
+        with self._lock:
+            self._entries.pop(token_digest(access_token), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+verified_tokens = VerifiedTokenCache()
@@ -14,6 +14,8 @@ urlpatterns = [
     path('api/mfa/status/', views.api_mfa_status, name='api_mfa_status'),
     path('api/mfa/set/', views.api_mfa_set, name='api_mfa_set'),
     path('api/mfa/disable/', views.api_mfa_disable, name='api_mfa_disable'),
+    path('api/security-status/', views.api_security_status, name='api_security_status'),
+    path('api/sso/stats/', views.api_sso_client_stats, name='api_sso_client_stats'),
     path('api/passkeys/', views.api_passkeys_list, name='api_passkeys_list'),
     path('api/passkeys/register/begin/', views.api_passkeys_register_begin, name='api_passkeys_register_begin'),
     path('api/passkeys/register/complete/', views.api_passkeys_register_complete, name='api_passkeys_register_complete'),
@@ -1,6 +1,6 @@
 from django.shortcuts import render, redirect
-from django.contrib.auth import login, logout
-from django.contrib.auth.decorators import login_required
+from django.contrib.auth import alogin, login, logout
+from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth import get_user_model
 from django.conf import settings
 from django.http import JsonResponse
@@ -10,15 +10,17 @@ from django.utils.decorators import method_decorator
 from django.views.decorators.http import require_http_methods
 import requests
 import json
+from asgiref.sync import sync_to_async
 from employees.models import Employee
-from .context_processors import PROFILE_REMINDER_SESSION_KEY
-from .sso_profile import fetch_sso_user_profile
+from . import sso_client
+from .security_status import afetch_security_status, ainvalidate_security_status
+from .sso_profile import afetch_sso_user_profile
+from .tokens import verified_tokens, verify_token
 from .sso_cookies import (
     clear_public_sso_auth_cookies,
     refresh_sso_session_tokens,
     set_public_sso_auth_cookies,
 )
-import jwt
 import os
 
 User = get_user_model()
@@ -87,11 +89,11 @@ def api_register(request):
         
         # Call SSO registration API
         try:
-            sso_response = requests.post(
-                f"{settings.SSO_BASE_URL}/api/auth/register/",
+            sso_response = sso_client.post(
+                'register',
+                "/api/auth/register/",
                 json={'email': email, 'password': password},
-                headers={'Content-Type': 'application/json'},
-                timeout=15
+                headers={'Content-Type': 'application/json'}
             )
             
         except requests.exceptions.Timeout:
@@ -164,11 +166,11 @@ def api_verify_email(request):
         
         # Call SSO email verification API
         try:
-            sso_response = requests.post(
-                f"{settings.SSO_BASE_URL}/api/auth/verify-email/",
+            sso_response = sso_client.post(
+                'verify_email',
+                "/api/auth/verify-email/",
                 json={'email': email, 'otp': otp},
-                headers={'Content-Type': 'application/json'},
-                timeout=15
+                headers={'Content-Type': 'application/json'}
             )
             
         except requests.exceptions.Timeout:
@@ -238,11 +240,11 @@ def api_resend_email_otp(request):
         
         # Call SSO resend OTP API
         try:
-            sso_response = requests.post(
-                f"{settings.SSO_BASE_URL}/api/auth/resend-email-otp/",
+            sso_response = sso_client.post(
+                'resend_email_otp',
+                "/api/auth/resend-email-otp/",
                 json={'email': email},
-                headers={'Content-Type': 'application/json'},
-                timeout=15
+                headers={'Content-Type': 'application/json'}
             )
             
         except requests.exceptions.Timeout:
@@ -296,7 +298,7 @@ def api_resend_email_otp(request):
 
 @csrf_exempt
 @require_http_methods(["POST"])
-def api_login(request):
+async def api_login(request):
     """Handle API login with SSO service"""
     try:
         data = json.loads(request.body)
@@ -308,11 +310,11 @@ def api_login(request):
         
         # Call SSO login API
         try:
-            sso_response = requests.post(
-                f"{settings.SSO_BASE_URL}/api/auth/login/",
+            sso_response = await sso_client.apost(
+                'login',
+                "/api/auth/login/",
                 json={'email': email, 'password': password},
-                headers={'Content-Type': 'application/json'},
-                timeout=15  # Increased timeout
+                headers={'Content-Type': 'application/json'}
             )
             
         except requests.exceptions.Timeout:
@@ -345,15 +347,10 @@ def api_login(request):
             refresh_token = response_data.get('refresh')
             
             if access_token and refresh_token:
-                # Store tokens in session
-                request.session['access_token'] = access_token
-                request.session['refresh_token'] = refresh_token
-                
-                # Authenticate user
-                user = authenticate_with_token(access_token)
+                # Store tokens in session and authenticate user
+                user = await _alogin_with_tokens(request, access_token, refresh_token)
                 
                 if user:
-                    login(request, user)
                     resp = JsonResponse({'success': True, 'redirect_url': '/dashboard/'})
                     return set_public_sso_auth_cookies(resp, access_token, refresh_token)
                 else:
@@ -410,7 +407,7 @@ def api_login(request):
     
 @csrf_exempt
 @require_http_methods(["POST"])
-def api_google_login(request):
+async def api_google_login(request):
     """Handle API Google login with SSO service"""
     try:
         data = json.loads(request.body)
@@ -421,11 +418,11 @@ def api_google_login(request):
         
         # Call SSO login API
         try:
-            sso_response = requests.post(
-                f"{settings.SSO_BASE_URL}/api/auth/google-login/",
+            sso_response = await sso_client.apost(
+                'google_login',
+                "/api/auth/google-login/",
                 json={'token': token},
-                headers={'Content-Type': 'application/json'},
-                timeout=15  # Increased timeout
+                headers={'Content-Type': 'application/json'}
             )
             
         except requests.exceptions.Timeout:
@@ -457,15 +454,10 @@ def api_google_login(request):
             refresh_token = response_data.get('refresh')
             
             if access_token and refresh_token:
-                # Store tokens in session
-                request.session['access_token'] = access_token
-                request.session['refresh_token'] = refresh_token
-                
-                # Authenticate user
-                user = authenticate_with_token(access_token)
+                # Store tokens in session and authenticate user
+                user = await _alogin_with_tokens(request, access_token, refresh_token)
                 
                 if user:
-                    login(request, user)
                     resp = JsonResponse({'success': True, 'redirect_url': '/dashboard/'})
                     return set_public_sso_auth_cookies(resp, access_token, refresh_token)
                 else:
@@ -518,7 +510,7 @@ def api_google_login(request):
 
 @csrf_exempt
 @require_http_methods(["POST"])
-def mfa_verify(request):
+async def mfa_verify(request):
     """Handle MFA verification (SSO spec: POST /auth/mfa/verify/ with token + mfa_token)."""
     try:
         data = json.loads(request.body)
@@ -532,11 +524,11 @@ def mfa_verify(request):
         
         # Call SSO MFA verify API
         try:
-            sso_response = requests.post(
-                f"{settings.SSO_BASE_URL}/api/auth/mfa/verify/",
+            sso_response = await sso_client.apost(
+                'mfa_verify',
+                "/api/auth/mfa/verify/",
                 json={'token': pre_auth_token, 'mfa_token': mfa_token},
-                headers={'Content-Type': 'application/json'},
-                timeout=15
+                headers={'Content-Type': 'application/json'}
             )
             
         except requests.exceptions.Timeout:
@@ -552,14 +544,9 @@ def mfa_verify(request):
             refresh_token = response_data.get('refresh')
             
             if access_token and refresh_token:
-                # Store tokens in session
-                request.session['access_token'] = access_token
-                request.session['refresh_token'] = refresh_token
-                
-                # Authenticate user using Simple JWT
-                user = authenticate_with_token(access_token)
+                # Store tokens in session and authenticate user
+                user = await _alogin_with_tokens(request, access_token, refresh_token)
                 if user:
-                    login(request, user)
                     resp = JsonResponse({'success': True, 'redirect_url': '/dashboard/'})
                     return set_public_sso_auth_cookies(resp, access_token, refresh_token)
                 else:
@@ -636,8 +623,9 @@ def logout_view(request):
     # Attempt to logout from SSO service
     if refresh_token:
         try:
-            requests.post(
-                f"{settings.SSO_BASE_URL}/api/auth/logout/",
+            sso_client.post(
+                'logout',
+                "/api/auth/logout/",
                 json={'refresh': refresh_token},
                 headers={'Content-Type': 'application/json'}
             )
@@ -656,10 +644,14 @@ def logout_view(request):
 
 
 @login_required
-def profile_view(request):
+async def profile_view(request):
     """Display profile: names/photo/bio/phone from SSO UserProfile; edit on Account portal."""
-    request.session.pop(PROFILE_REMINDER_SESSION_KEY, None)
-    sso_profile = fetch_sso_user_profile(request)
+    # Also refreshes the cached profile completeness behind the reminder modal
+    sso_profile = await afetch_sso_user_profile(request)
+    return await sync_to_async(_render_profile)(request, sso_profile)
+
+
+def _render_profile(request, sso_profile):
     display_full_name = (sso_profile.get('full_name') or '').strip()
     if not display_full_name:
         display_full_name = request.user.get_full_name().strip()
@@ -683,8 +675,9 @@ def refresh_token_view(request):
         return JsonResponse({'error': 'No refresh token available'}, status=401)
     
     try:
-        response = requests.post(
-            f"{settings.SSO_BASE_URL}/api/auth/token/refresh/",
+        response = sso_client.post(
+            'token_refresh',
+            "/api/auth/token/refresh/",
             json={'refresh': refresh_token},
             headers={'Content-Type': 'application/json'}
         )
@@ -724,15 +717,15 @@ def refresh_token_view(request):
 
 @login_required
 @require_http_methods(["GET"])
-def api_mfa_status(request):
-    access_token = request.session.get('access_token')
+async def api_mfa_status(request):
+    access_token = await request.session.aget('access_token')
     if not access_token:
         return JsonResponse({'error': 'Not authenticated'}, status=401)
     try:
-        r = requests.get(
-            f"{settings.SSO_BASE_URL}/api/auth/mfa/status/",
+        r = await sso_client.aget(
+            'mfa_status',
+            "/api/auth/mfa/status/",
             headers={'Authorization': f'Bearer {access_token}'},
-            timeout=15,
         )
         return JsonResponse(r.json(), status=r.status_code)
     except requests.exceptions.RequestException as e:
@@ -742,16 +735,17 @@ def api_mfa_status(request):
 @login_required
 @csrf_exempt
 @require_http_methods(["POST"])
-def api_mfa_set(request):
-    access_token = request.session.get('access_token')
+async def api_mfa_set(request):
+    access_token = await request.session.aget('access_token')
     if not access_token:
         return JsonResponse({'error': 'Not authenticated'}, status=401)
     try:
-        r = requests.post(
-            f"{settings.SSO_BASE_URL}/api/auth/mfa/set/",
+        r = await sso_client.apost(
+            'mfa_set',
+            "/api/auth/mfa/set/",
             headers={'Authorization': f'Bearer {access_token}', 'Content-Type': 'application/json'},
-            timeout=15,
         )
+        await ainvalidate_security_status(await request.auser())
         return JsonResponse(r.json(), status=r.status_code)
     except requests.exceptions.RequestException as e:
         return JsonResponse({'error': str(e)}, status=503)
@@ -760,36 +754,61 @@ def api_mfa_set(request):
 @login_required
 @csrf_exempt
 @require_http_methods(["POST"])
-def api_mfa_disable(request):
-    access_token = request.session.get('access_token')
+async def api_mfa_disable(request):
+    access_token = await request.session.aget('access_token')
     if not access_token:
         return JsonResponse({'error': 'Not authenticated'}, status=401)
     try:
         body = json.loads(request.body) if request.body else {}
-        r = requests.post(
-            f"{settings.SSO_BASE_URL}/api/auth/mfa/disable/",
+        r = await sso_client.apost(
+            'mfa_disable',
+            "/api/auth/mfa/disable/",
             json=body,
             headers={'Authorization': f'Bearer {access_token}', 'Content-Type': 'application/json'},
-            timeout=15,
         )
+        await ainvalidate_security_status(await request.auser())
         return JsonResponse(r.json(), status=r.status_code)
     except requests.exceptions.RequestException as e:
         return JsonResponse({'error': str(e)}, status=503)
 
 
+@login_required
+@require_http_methods(["GET"])
+async def api_security_status(request):
+    """MFA status and passkeys in one call: one concurrent SSO fan-out, cached per user"""
+    access_token = await request.session.aget('access_token')
+    if not access_token:
+        return JsonResponse({'error': 'Not authenticated'}, status=401)
+    status = await afetch_security_status(await request.auser(), access_token)
+    return JsonResponse(status)
+
+
+def is_admin_or_hr(user):
+    """Check if user is admin or HR"""
+    return user.is_staff or user.is_superuser
+
+
+@login_required
+@user_passes_test(is_admin_or_hr)
+@require_http_methods(["GET"])
+def api_sso_client_stats(request):
+    """Per-endpoint request/error/latency counters and the SSO circuit breaker (all processes)"""
+    return JsonResponse({'breaker': sso_client.breaker_state(), 'endpoints': sso_client.sso_client_stats()})
+
+
 # ── Passkey Proxy Views (authenticated — registration & management) ─────────
 
 @login_required
 @require_http_methods(["GET"])
-def api_passkeys_list(request):
-    access_token = request.session.get('access_token')
+async def api_passkeys_list(request):
+    access_token = await request.session.aget('access_token')
     if not access_token:
         return JsonResponse({'error': 'Not authenticated'}, status=401)
     try:
-        r = requests.get(
-            f"{settings.SSO_BASE_URL}/api/auth/passkeys/",
+        r = await sso_client.aget(
+            'passkeys_list',
+            "/api/auth/passkeys/",
             headers={'Authorization': f'Bearer {access_token}'},
-            timeout=15,
         )
         data = r.json() if r.content else []
         return JsonResponse(data, safe=False, status=r.status_code)
@@ -799,18 +818,18 @@ def api_passkeys_list(request):
 
 @login_required
 @require_http_methods(["GET"])
-def api_passkeys_register_begin(request):
-    access_token = request.session.get('access_token')
+async def api_passkeys_register_begin(request):
+    access_token = await request.session.aget('access_token')
     if not access_token:
         return JsonResponse({'error': 'Not authenticated'}, status=401)
     try:
-        r = requests.get(
-            f"{settings.SSO_BASE_URL}/api/auth/passkeys/register/begin/",
+        r = await sso_client.aget(
+            'passkeys_register_begin',
+            "/api/auth/passkeys/register/begin/",
             headers={'Authorization': f'Bearer {access_token}'},
-            timeout=15,
         )
         # Capture SSO session cookies so we can replay them in the complete step
-        request.session['sso_passkey_reg_cookies'] = dict(r.cookies)
+        await request.session.aset('sso_passkey_reg_cookies', dict(r.cookies))
         return JsonResponse(r.json(), status=r.status_code)
     except requests.exceptions.RequestException as e:
         return JsonResponse({'error': str(e)}, status=503)
@@ -819,20 +838,21 @@ def api_passkeys_register_begin(request):
 @login_required
 @csrf_exempt
 @require_http_methods(["POST"])
-def api_passkeys_register_complete(request):
-    access_token = request.session.get('access_token')
+async def api_passkeys_register_complete(request):
+    access_token = await request.session.aget('access_token')
     if not access_token:
         return JsonResponse({'error': 'Not authenticated'}, status=401)
-    sso_cookies = request.session.pop('sso_passkey_reg_cookies', {})
+    sso_cookies = await request.session.apop('sso_passkey_reg_cookies', {})
     try:
         body = json.loads(request.body)
-        r = requests.post(
-            f"{settings.SSO_BASE_URL}/api/auth/passkeys/register/complete/",
+        r = await sso_client.apost(
+            'passkeys_register_complete',
+            "/api/auth/passkeys/register/complete/",
             json=body,
             headers={'Authorization': f'Bearer {access_token}', 'Content-Type': 'application/json'},
             cookies=sso_cookies,
-            timeout=15,
         )
+        await ainvalidate_security_status(await request.auser())
         return JsonResponse(r.json(), status=r.status_code)
     except requests.exceptions.RequestException as e:
         return JsonResponse({'error': str(e)}, status=503)
@@ -841,16 +861,17 @@ def api_passkeys_register_complete(request):
 @login_required
 @csrf_exempt
 @require_http_methods(["DELETE"])
-def api_passkeys_delete(request, passkey_id):
-    access_token = request.session.get('access_token')
+async def api_passkeys_delete(request, passkey_id):
+    access_token = await request.session.aget('access_token')
     if not access_token:
         return JsonResponse({'error': 'Not authenticated'}, status=401)
     try:
-        r = requests.delete(
-            f"{settings.SSO_BASE_URL}/api/auth/passkeys/{passkey_id}/",
+        r = await sso_client.adelete(
+            'passkeys_delete',
+            f"/api/auth/passkeys/{passkey_id}/",
             headers={'Authorization': f'Bearer {access_token}'},
-            timeout=15,
         )
+        await ainvalidate_security_status(await request.auser())
         data = r.json() if r.content else {'status': 'OK'}
         return JsonResponse(data, status=r.status_code)
     except requests.exceptions.RequestException as e:
@@ -860,13 +881,13 @@ def api_passkeys_delete(request, passkey_id):
 # ── Passkey Login (public — no auth required) ──────────────────────────────
 
 @require_http_methods(["GET"])
-def api_passkeys_login_begin(request):
+async def api_passkeys_login_begin(request):
     try:
-        r = requests.get(
-            f"{settings.SSO_BASE_URL}/api/auth/passkeys/login/begin/",
-            timeout=15,
+        r = await sso_client.aget(
+            'passkeys_login_begin',
+            "/api/auth/passkeys/login/begin/",
         )
-        request.session['sso_passkey_login_cookies'] = dict(r.cookies)
+        await request.session.aset('sso_passkey_login_cookies', dict(r.cookies))
         return JsonResponse(r.json(), status=r.status_code)
     except requests.exceptions.RequestException as e:
         return JsonResponse({'error': str(e)}, status=503)
@@ -874,27 +895,24 @@ def api_passkeys_login_begin(request):
 
 @csrf_exempt
 @require_http_methods(["POST"])
-def api_passkeys_login_complete(request):
-    sso_cookies = request.session.pop('sso_passkey_login_cookies', {})
+async def api_passkeys_login_complete(request):
+    sso_cookies = await request.session.apop('sso_passkey_login_cookies', {})
     try:
         body = json.loads(request.body)
-        r = requests.post(
-            f"{settings.SSO_BASE_URL}/api/auth/passkeys/login/complete/",
+        r = await sso_client.apost(
+            'passkeys_login_complete',
+            "/api/auth/passkeys/login/complete/",
             json=body,
             headers={'Content-Type': 'application/json'},
             cookies=sso_cookies,
-            timeout=15,
         )
         if r.status_code == 200:
             response_data = r.json()
             access_token = response_data.get('access')
             refresh_token = response_data.get('refresh')
             if access_token and refresh_token:
-                request.session['access_token'] = access_token
-                request.session['refresh_token'] = refresh_token
-                user = authenticate_with_token(access_token)
+                user = await _alogin_with_tokens(request, access_token, refresh_token)
                 if user:
-                    login(request, user)
                     resp = JsonResponse({'success': True, 'redirect_url': '/dashboard/'})
                     return set_public_sso_auth_cookies(resp, access_token, refresh_token)
             return JsonResponse({'error': 'Invalid passkey login response from SSO'}, status=500)
@@ -906,62 +924,60 @@ def api_passkeys_login_complete(request):
 
 # ── User Authentication Helper ─────────────────────────────────────────────
 
+async def _alogin_with_tokens(request, access_token, refresh_token):
+    """Store SSO tokens in the session and log in their user (None when the token is rejected)"""
+    await request.session.aset('access_token', access_token)
+    await request.session.aset('refresh_token', refresh_token)
+    user = await aauthenticate_with_token(access_token)
+    if user:
+        await alogin(request, user)
+    return user
+
+
+async def aauthenticate_with_token(access_token):
+    """authenticate_with_token() for async views (database access in a worker thread)"""
+    return await sync_to_async(authenticate_with_token)(access_token)
+
+
 def authenticate_with_token(access_token):
     """Authenticate user using access token by validating JWT and extracting user info"""
+    # Tokens verified before skip the RSA check until they expire
+    user_id = verified_tokens.get(access_token)
+    if user_id is not None:
+        user = User.objects.filter(pk=user_id).first()
+        if user:
+            return user
+        verified_tokens.discard(access_token)
+
     try:
-        # First, let's decode the token to see what claims it has (without verification)
-        unverified_payload = jwt.decode(access_token, options={"verify_signature": False})
-        
-        # Simple validation - just check if token is properly signed with our public key
-        try:
-            # Basic verification - just signature and expiration
-            jwt.decode(
-                access_token,
-                settings.SSO_PUBLIC_KEY,
-                algorithms=[settings.JWT_ALGORITHM],
-                options={
-                    "verify_signature": True,
-                    "verify_exp": True,
-                    "verify_nbf": True,
-                    "verify_iat": True,
-                    "verify_aud": False,  # Skip audience verification
-                    "verify_iss": False,  # Skip issuer verification
-                }
-            )
-        except jwt.ExpiredSignatureError:
-            return None
-        except jwt.InvalidTokenError as e:
+        payload = verify_token(access_token)
+        if payload is None:
             return None
         
-        # Extract user information from unverified payload (we trust it since signature is valid)
-        sso_user_id = unverified_payload.get('user_id')
+        sso_user_id = payload.get('user_id')
         
         if not sso_user_id:
             return None
         
-        # Try to find existing user by sso_id
-        try:
-            user = User.objects.get(sso_id=str(sso_user_id))
-            
-            # Update tokens
-            user.sso_access_token = access_token
-            user.save()
-            
-            return user
-            
-        except User.DoesNotExist:
-            # Create new user with sso_id
-            user = User.objects.create(
-                sso_id=str(sso_user_id),
+        # Concurrent first logins converge on one row (get_or_create retries the get on IntegrityError)
+        user, created = User.objects.get_or_create(
+            sso_id=str(sso_user_id),
+            defaults={
                 # email will be auto-generated as <sso_id>@arnatech.id
                 # username will be set to sso_id
-                first_name="",
-                last_name="",
-                sso_access_token=access_token,
-                is_active=True
-            )
-            
-            return user
+                'first_name': "",
+                'last_name': "",
+                'sso_access_token': access_token,
+                'is_active': True,
+            },
+        )
+        if not created and user.sso_access_token != access_token:
+            # Only the token column, and only when it changed
+            User.objects.filter(pk=user.pk).update(sso_access_token=access_token)
+            user.sso_access_token = access_token
+        
+        verified_tokens.put(access_token, user.pk, payload.get('exp'))
+        return user
                 
     except Exception as e:
         return None
@@ -1,3 +1,27 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import ExportJob, ExportJobChunk
+
+
+class ExportJobChunkInline(admin.TabularInline):
+    model = ExportJobChunk
+    extra = 0
+    can_delete = False
+    readonly_fields = ('sequence', 'start_date', 'end_date', 'status', 'rows_processed', 'completed_at')
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'requested_by', 'start_date', 'end_date', 'company', 'employee', 'status', 'rows_processed', 'created_at', 'finished_at')
+    list_filter = ('kind', 'status', 'created_at')
+    ordering = ('-created_at',)
+    inlines = [ExportJobChunkInline]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,77 @@
+"""
+Versioned cache for computed admin dashboard data.
+
+Entries are keyed by the normalised dashboard filters plus the data version of the
+slice they were computed from. Versions are per company (DashboardDataVersion rows),
+so a check-in only invalidates its own company's entries and the all-companies view;
+the company list shared by every view has its own 'companies' scope. Versions are
+bumped after the writing transaction commits (see dashboard.signals), so a concurrent
+request cannot cache uncommitted data under the new version. Old entries simply expire
+with DASHBOARD_CACHE_SECONDS.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+
+from .models import DashboardDataVersion
+
+COMPANIES_SCOPE = 'companies'
+
+
+def company_scope(company_id):
+    """Version scope of one company's dashboard data (None: users without an employee profile)"""
+    return f'company:{company_id if company_id is not None else "none"}'
+
+
+def data_version(company_filter=''):
+    """
+    Version tag of the data behind a dashboard view: the filtered company plus the
+    company list, or every scope when not filtered by company.
+    """
+    versions = DashboardDataVersion.objects.all()
+    if company_filter:
+        rows = dict(versions.filter(scope__in=[company_scope(company_filter), COMPANIES_SCOPE])
+                    .values_list('scope', 'version'))
+        return f'{rows.get(company_scope(company_filter), 0)}.{rows.get(COMPANIES_SCOPE, 0)}'
+    # Versions only grow, so their sum changes whenever any scope is bumped
+    return f's{versions.aggregate(total=Sum("version"))["total"] or 0}'
+
+
+def bump_data_version(scope):
+    """Invalidate cached dashboard data of one scope (atomic in the database)"""
+    if DashboardDataVersion.objects.filter(scope=scope).update(version=F('version') + 1):
+        return
+    try:
+        with transaction.atomic():
+            DashboardDataVersion.objects.create(scope=scope, version=1)
+    except IntegrityError:
+        # Created concurrently
+        DashboardDataVersion.objects.filter(scope=scope).update(version=F('version') + 1)
+
+
+def bump_data_version_on_commit(scope):
+    """bump_data_version() once the current transaction commits (now in autocommit)"""
+    transaction.on_commit(lambda: bump_data_version(scope))
+
+
+def dashboard_cache_key(kind, company_filter, *parts):
+    """Cache key for one kind of dashboard payload and its normalised filter parts."""
+    raw = '|'.join('' if part is None else str(part) for part in (company_filter, *parts))
+    digest = hashlib.sha1(raw.encode('utf-8')).hexdigest()
+    return f'dashboard:{kind}:v{data_version(company_filter)}:{digest}'
+
+
+def cached_dashboard_data(kind, parts, compute):
+    """
+    Return cached data for (kind, parts), computing and storing it on a miss.
+    parts starts with the company filter, which selects the data version.
+    """
+    key = dashboard_cache_key(kind, *parts)
+    data = cache.get(key)
+    if data is None:
+        data = compute()
+        cache.set(key, data, timeout=settings.DASHBOARD_CACHE_SECONDS)
+    return data
@@ -0,0 +1,148 @@
+"""
+On-disk cache of produced export files.
+
+Files are content-addressed: the key hashes the export format, the normalised dashboard
+filters and a fingerprint of the data the export covers (row counts and latest
+updated_at of the activities in range, their planned activities, goals and additional
+activities, plus employees and companies, and the names of the users shown). Any edit, insert or delete in that data
+changes the key, so a cached file never needs invalidating; the key doubles as the
+ETag. Hits refresh the file's mtime and the least recently used files are evicted once
+the cache grows past EXPORT_CACHE_MAX_BYTES.
+"""
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Count, Max
+from django.utils.http import parse_etags, quote_etag
+
+from activities.models import AdditionalActivity, DailyGoal, PlannedActivity
+from employees.models import Company, Employee
+
+from .exports import export_queryset
+
+logger = logging.getLogger(__name__)
+
+# format -> file extension
+EXPORT_EXTENSIONS = {
+    'xlsx': 'xlsx',
+    'csv': 'csv',
+    'ndjson.gz': 'ndjson.gz',
+}
+
+
+def export_fingerprint(company_id, employee_id, start_date, end_date):
+    """Digest of row counts and latest updated_at for everything an export reads"""
+    activities = export_queryset(company_id, employee_id, start_date, end_date).order_by()
+    parts = [activities.aggregate(rows=Count('id'), latest=Max('updated_at'))]
+    for model in (PlannedActivity, DailyGoal, AdditionalActivity):
+        parts.append(model.objects.filter(daily_activity__in=activities.values('id')).aggregate(
+            rows=Count('id'), latest=Max('updated_at'),
+        ))
+    for model in (Employee, Company):
+        parts.append(model.objects.aggregate(rows=Count('id'), latest=Max('updated_at')))
+    raw = '|'.join(f"{part['rows']}:{part['latest'].isoformat() if part['latest'] else ''}" for part in parts)
+    # User has no updated_at: hash the name fields the export prints instead
+    names = hashlib.sha1()
+    users = get_user_model().objects.filter(id__in=activities.values('user_id')).order_by('id')
+    for user_id, first_name, last_name, username in users.values_list('id', 'first_name', 'last_name', 'username'):
+        names.update(f'{user_id}\0{first_name}\0{last_name}\0{username}\n'.encode('utf-8'))
+    raw += '|' + names.hexdigest()
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def export_cache_key(export_format, company_id, employee_id, start_date, end_date):
+    fingerprint = export_fingerprint(company_id, employee_id, start_date, end_date)
+    raw = '|'.join([export_format, company_id or '', employee_id or '', str(start_date), str(end_date), fingerprint])
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def etag_matches(request, key):
+    """True if the request's If-None-Match already names this content key"""
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    etags = parse_etags(header)
+    return '*' in etags or quote_etag(key) in etags
+
+
+def _cache_path(key, extension):
+    return os.path.join(settings.EXPORT_CACHE_ROOT, f'{key}.{extension}')
+
+
+def cached_export(key):
+    """(path, extension) of the cached file for key, marking it recently used; None on a miss"""
+    for extension in EXPORT_EXTENSIONS.values():
+        path = _cache_path(key, extension)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            continue
+        return path, extension
+    return None
+
+
+def store_export(source_path, key, extension):
+    """Add a finished export file to the cache (hard link when possible) and enforce the size cap"""
+    os.makedirs(settings.EXPORT_CACHE_ROOT, exist_ok=True)
+    path = _cache_path(key, extension)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        os.link(source_path, tmp_path)
+    except OSError:
+        shutil.copyfile(source_path, tmp_path)
+    os.replace(tmp_path, path)
+    evict_export_cache()
+
+
+def tee_into_cache(chunks, key, extension):
+    """Pass streamed chunks through while writing them to the cache; an interrupted stream is discarded"""
+    os.makedirs(settings.EXPORT_CACHE_ROOT, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=settings.EXPORT_CACHE_ROOT, suffix='.tmp')
+    completed = False
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            for chunk in chunks:
+                fh.write(chunk)
+                yield chunk
+        os.replace(tmp_path, _cache_path(key, extension))
+        completed = True
+        evict_export_cache()
+    finally:
+        if not completed and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def evict_export_cache(max_bytes=None):
+    """Delete least recently used cached files until the cache fits in max_bytes; returns files removed"""
+    max_bytes = settings.EXPORT_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    entries = []
+    total = 0
+    with os.scandir(settings.EXPORT_CACHE_ROOT) as it:
+        for entry in it:
+            if not entry.is_file() or entry.name.endswith('.tmp'):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+
+    removed = 0
+    for _mtime, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    if removed:
+        logger.info('Evicted %d cached export file(s)', removed)
+    return removed
@@ -0,0 +1,229 @@
+"""
+Background processing of admin dashboard Excel exports.
+
+The request only creates an ExportJob. `manage.py run_export_worker` claims pending jobs
+and builds them one calendar month at a time, newest first: each chunk's rows are written
+to a JSON-lines file under the job's directory before the chunk is marked completed, so a
+job whose worker died is resumed from the first unfinished month. Once every chunk is on
+disk the workbook is assembled from the chunk files and served by the download view.
+
+Employee report bundles (the Django admin action) are queued the same way as
+kind='report_bundle' jobs, so their process pool runs in the single-threaded worker
+rather than in a web server thread.
+"""
+import json
+import logging
+import os
+import shutil
+from datetime import timedelta
+from itertools import zip_longest
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .export_cache import store_export
+from .exports import (
+    export_filename, export_queryset, export_rows, track_column_lengths, write_export_workbook,
+)
+from .models import ExportJob, ExportJobChunk
+
+logger = logging.getLogger(__name__)
+
+# Persist rows_processed/heartbeat_at after this many rows within a chunk
+PROGRESS_EVERY_ROWS = 500
+
+
+def month_chunks(start_date, end_date):
+    """(start, end) date pairs covering the range one calendar month at a time, newest first"""
+    chunks = []
+    chunk_start = start_date
+    while chunk_start <= end_date:
+        next_month = (chunk_start.replace(day=1) + timedelta(days=32)).replace(day=1)
+        chunk_end = min(next_month - timedelta(days=1), end_date)
+        chunks.append((chunk_start, chunk_end))
+        chunk_start = next_month
+    chunks.reverse()
+    return chunks
+
+
+@transaction.atomic
+def create_export_job(user, company_id, employee_id, start_date, end_date, cache_key=''):
+    """Queue an export for the dashboard filters; the worker picks it up"""
+    job = ExportJob.objects.create(
+        requested_by=user,
+        company_id=company_id or None,
+        employee_id=employee_id or None,
+        start_date=start_date,
+        end_date=end_date,
+        cache_key=cache_key,
+    )
+    ExportJobChunk.objects.bulk_create([
+        ExportJobChunk(job=job, sequence=sequence, start_date=chunk_start, end_date=chunk_end)
+        for sequence, (chunk_start, chunk_end) in enumerate(month_chunks(start_date, end_date))
+    ])
+    return job
+
+
+def create_report_bundle_job(user, employee_ids, start_date, end_date):
+    """Queue a ZIP of per-employee report workbooks; the worker picks it up"""
+    return ExportJob.objects.create(
+        kind='report_bundle',
+        requested_by=user,
+        employee_ids=sorted(employee_ids),
+        start_date=start_date,
+        end_date=end_date,
+    )
+
+
+def requeue_stale_jobs():
+    """Return running jobs whose worker stopped reporting progress to the queue"""
+    cutoff = timezone.now() - timedelta(seconds=settings.EXPORT_JOB_STALE_SECONDS)
+    return ExportJob.objects.filter(status='running', heartbeat_at__lt=cutoff).update(status='pending')
+
+
+def claim_next_job():
+    """Mark the oldest pending job as running and return it; None when the queue is empty"""
+    for job in ExportJob.objects.filter(status='pending').order_by('created_at')[:10]:
+        now = timezone.now()
+        # Conditional update: only one worker wins the job
+        claimed = ExportJob.objects.filter(pk=job.pk, status='pending').update(
+            status='running', started_at=now, heartbeat_at=now,
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+    return None
+
+
+def _write_chunk(job, chunk, rows_before):
+    """Write one chunk's rows to its file and mark it completed; returns the row count"""
+    qs = export_queryset(job.company_id, job.employee_id, chunk.start_date, chunk.end_date)
+    tmp_path = chunk.file_abspath + '.tmp'
+    rows = 0
+    column_lengths = []
+    with open(tmp_path, 'w', encoding='utf-8') as fh:
+        for row in export_rows(qs):
+            fh.write(json.dumps(row, default=str))
+            fh.write('\n')
+            track_column_lengths(column_lengths, row)
+            rows += 1
+            if rows % PROGRESS_EVERY_ROWS == 0:
+                ExportJob.objects.filter(pk=job.pk).update(
+                    rows_processed=rows_before + rows, heartbeat_at=timezone.now(),
+                )
+    os.replace(tmp_path, chunk.file_abspath)
+
+    chunk.status = 'completed'
+    chunk.rows_processed = rows
+    chunk.column_lengths = column_lengths
+    chunk.completed_at = timezone.now()
+    chunk.save(update_fields=['status', 'rows_processed', 'column_lengths', 'completed_at'])
+    return rows
+
+
+def _heartbeat(job):
+    ExportJob.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now())
+
+
+def _chunk_file_rows(job, chunks):
+    """
+    Rows of the chunk files in order. Keeps the job's heartbeat going while the workbook
+    is assembled, so requeue_stale_jobs() does not take a long assembly for a dead worker.
+    """
+    rows = 0
+    for chunk in chunks:
+        with open(chunk.file_abspath, encoding='utf-8') as fh:
+            for line in fh:
+                yield json.loads(line)
+                rows += 1
+                if rows % PROGRESS_EVERY_ROWS == 0:
+                    _heartbeat(job)
+    # The workbook is saved (zipped) once the last row is written
+    _heartbeat(job)
+
+
+def run_report_bundle_job(job):
+    """Write a claimed report bundle job's ZIP; rows_processed counts the workbooks added"""
+    from employees.reports import iter_report_bundle, report_bundle_filename
+
+    os.makedirs(job.work_dir, exist_ok=True)
+    filename = report_bundle_filename(job.start_date, job.end_date)
+    final_path = os.path.join(job.work_dir, filename)
+    try:
+        workbooks = 0
+        with open(final_path + '.tmp', 'wb') as fh:
+            # One piece per workbook added, then the ZIP directory
+            for piece in iter_report_bundle(job.employee_ids, job.start_date, job.end_date):
+                fh.write(piece)
+                workbooks = min(workbooks + 1, len(job.employee_ids))
+                ExportJob.objects.filter(pk=job.pk).update(rows_processed=workbooks, heartbeat_at=timezone.now())
+        os.replace(final_path + '.tmp', final_path)
+    except Exception as exc:
+        logger.exception('Report bundle job %s failed', job.pk)
+        ExportJob.objects.filter(pk=job.pk).update(status='failed', error=str(exc), finished_at=timezone.now())
+        return False
+
+    ExportJob.objects.filter(pk=job.pk).update(
+        status='completed',
+        file_path=os.path.join(str(job.pk), filename),
+        finished_at=timezone.now(),
+        heartbeat_at=timezone.now(),
+    )
+    return True
+
+
+def run_export_job(job):
+    """Build a claimed job's chunks (skipping ones already on disk) and assemble the workbook"""
+    if job.kind == 'report_bundle':
+        return run_report_bundle_job(job)
+    os.makedirs(job.work_dir, exist_ok=True)
+    chunks = list(job.chunks.all())
+    for chunk in chunks:
+        chunk.job = job
+    try:
+        rows_processed = 0
+        for chunk in chunks:
+            if chunk.status != 'completed' or not os.path.exists(chunk.file_abspath):
+                _write_chunk(job, chunk, rows_processed)
+            rows_processed += chunk.rows_processed
+            ExportJob.objects.filter(pk=job.pk).update(rows_processed=rows_processed, heartbeat_at=timezone.now())
+
+        # Widths were measured while the chunks were written; the assembly is a single pass
+        column_lengths = [
+            max(lengths) for lengths in zip_longest(*(chunk.column_lengths for chunk in chunks), fillvalue=0)
+        ]
+
+        filename = export_filename()
+        final_path = os.path.join(job.work_dir, filename)
+        write_export_workbook(_chunk_file_rows(job, chunks), final_path + '.tmp', column_lengths)
+        os.replace(final_path + '.tmp', final_path)
+        for chunk in chunks:
+            os.remove(chunk.file_abspath)
+        if job.cache_key:
+            store_export(final_path, job.cache_key, 'xlsx')
+    except Exception as exc:
+        logger.exception('Export job %s failed', job.pk)
+        ExportJob.objects.filter(pk=job.pk).update(status='failed', error=str(exc), finished_at=timezone.now())
+        return False
+
+    ExportJob.objects.filter(pk=job.pk).update(
+        status='completed',
+        rows_processed=rows_processed,
+        file_path=os.path.join(str(job.pk), filename),
+        finished_at=timezone.now(),
+        heartbeat_at=timezone.now(),
+    )
+    return True
+
+
+def purge_expired_jobs():
+    """Delete finished jobs older than EXPORT_RETENTION_HOURS together with their files"""
+    cutoff = timezone.now() - timedelta(hours=settings.EXPORT_RETENTION_HOURS)
+    expired = ExportJob.objects.filter(status__in=['completed', 'failed'], finished_at__lt=cutoff)
+    count = 0
+    for job in expired:
+        shutil.rmtree(job.work_dir, ignore_errors=True)
+        job.delete()
+        count += 1
+    return count
@@ -0,0 +1,251 @@
+"""
+Activity detail export: flattened rows, the styled Excel workbook and streamed CSV / NDJSON.
+
+Each DailyActivity becomes one or more rows; planned activities, daily goals and
+additional activities are laid out side by side, and the activity columns are only
+filled on its first row.
+"""
+import csv
+import json
+import zlib
+from datetime import datetime
+
+import pytz
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, NamedStyle, PatternFill, Side
+from openpyxl.utils import get_column_letter
+
+from activities.models import DailyActivity
+
+# Timezone for GMT+7
+EXPORT_TZ = pytz.timezone('Asia/Jakarta')
+
+EXPORT_HEADERS = [
+    "Employee", "Position", "Company", "Date",
+    "Check In (GMT+7)", "Check Out (GMT+7)",
+    "Status", "Attendance Status", "Work Duration",
+    "Morning Problems", "Afternoon Problems", "Notes",
+    "Planned Activities", "Activity Status", "Activity Priority", "Activity Reasons",
+    "Daily Goals", "Goal Status", "Goal Priority", "Target", "Achieved", "Completion %", "Goal Reasons",
+    "Additional Activities", "Add. Category", "Add. Status", "Add. Duration", "Add. Impact"
+]
+ACTIVITY_COLUMNS = 12
+
+EXPORT_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Named cell styles registered on every export workbook
+HEADER_STYLE = 'export_header'
+CELL_STYLE = 'export_cell'
+
+# Activities fetched (and their related rows prefetched) per database round trip
+EXPORT_QUERY_CHUNK_SIZE = 500
+
+# Rows compressed together before a gzip flush in streamed NDJSON exports
+STREAM_BATCH_ROWS = 200
+
+
+def export_queryset(company_id, employee_id, start_date, end_date):
+    """DailyActivity rows for an export, newest first, with related rows prefetched"""
+    activities_qs = DailyActivity.objects.filter(date__gte=start_date, date__lte=end_date)
+    if company_id:
+        activities_qs = activities_qs.filter(user__employee_profile__company_id=company_id)
+    if employee_id:
+        activities_qs = activities_qs.filter(user__employee_profile__id=employee_id)
+    return activities_qs.select_related(
+        'user__employee_profile__company',
+    ).prefetch_related(
+        'planned_activities',
+        'daily_goals',
+        'additional_activities',
+    ).order_by('-date', '-checkin_time')
+
+
+def _format_time(value, day):
+    if not value:
+        return "N/A"
+    if isinstance(value, datetime):
+        return value.astimezone(EXPORT_TZ).strftime('%Y-%m-%d %H:%M:%S')
+    return EXPORT_TZ.localize(datetime.combine(day, value)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def activity_rows(activity):
+    """Flattened export rows (lists of strings) for one DailyActivity"""
+    # Calculate work duration
+    work_duration = "N/A"
+    if activity.work_duration:
+        total_seconds = activity.work_duration.total_seconds()
+        hours = int(total_seconds // 3600)
+        minutes = int((total_seconds % 3600) // 60)
+        work_duration = f"{hours}h {minutes}m"
+
+    employee = getattr(activity.user, 'employee_profile', None)
+
+    planned_activities = list(activity.planned_activities.all())
+    daily_goals = list(activity.daily_goals.all())
+    additional_activities = list(activity.additional_activities.all())
+
+    # Determine max rows needed for this activity
+    max_rows = max(1, len(planned_activities), len(daily_goals), len(additional_activities))
+
+    rows = []
+    for i in range(max_rows):
+        pa = planned_activities[i] if i < len(planned_activities) else None
+        dg = daily_goals[i] if i < len(daily_goals) else None
+        aa = additional_activities[i] if i < len(additional_activities) else None
+
+        # Only include main activity details in first row
+        if i == 0:
+            row = [
+                activity.user.get_full_name() or activity.user.username,
+                employee.position if employee else "N/A",
+                employee.company.name if (employee and employee.company) else "N/A",
+                activity.date.strftime("%Y-%m-%d"),
+                _format_time(activity.checkin_time, activity.date),
+                _format_time(activity.checkout_time, activity.date),
+                activity.get_status_display(),
+                activity.get_attendance_status_display(),
+                work_duration,
+                activity.morning_problems or "",
+                activity.afternoon_problems or "",
+                activity.notes or ""
+            ]
+        else:
+            row = [""] * ACTIVITY_COLUMNS
+
+        row.extend([
+            pa.title if pa else "",
+            pa.get_status_display() if pa else "",
+            pa.get_priority_display() if pa else "",
+            pa.reasons if pa else ""
+        ])
+        row.extend([
+            dg.title if dg else "",
+            dg.get_status_display() if dg else "",
+            dg.get_priority_display() if dg else "",
+            dg.target_value if dg else "",
+            dg.achieved_value if dg else "",
+            f"{dg.completion_percentage}%" if dg and dg.completion_percentage is not None else "",
+            dg.reasons if dg else ""
+        ])
+        row.extend([
+            aa.title if aa else "",
+            aa.get_category_display() if aa else "",
+            aa.get_status_display() if aa else "",
+            str(aa.duration) if aa and aa.duration else "",
+            aa.impact_on_planned_work if aa else ""
+        ])
+        rows.append(row)
+    return rows
+
+
+def export_rows(activities_qs):
+    """
+    Flattened export rows for every activity in the queryset, fetched in chunks of
+    EXPORT_QUERY_CHUNK_SIZE with the prefetches done per chunk
+    """
+    for activity in activities_qs.iterator(chunk_size=EXPORT_QUERY_CHUNK_SIZE):
+        yield from activity_rows(activity)
+
+
+def track_column_lengths(lengths, row):
+    """Update lengths (list of max text length per column) in place with one row"""
+    for index, value in enumerate(row):
+        length = len(str(value)) if value else 0
+        if index >= len(lengths):
+            lengths.append(length)
+        elif length > lengths[index]:
+            lengths[index] = length
+    return lengths
+
+
+def _add_export_styles(wb):
+    thin = Side(style='thin')
+    border = Border(left=thin, right=thin, top=thin, bottom=thin)
+    wb.add_named_style(NamedStyle(
+        name=HEADER_STYLE,
+        fill=PatternFill(start_color="2D6099", end_color="2D6099", fill_type="solid"),
+        font=Font(bold=True, color="FFFFFF"),
+        alignment=Alignment(horizontal='center'),
+        border=border,
+    ))
+    wb.add_named_style(NamedStyle(name=CELL_STYLE, border=border))
+
+
+def _styled_row(ws, values, style):
+    row = []
+    for value in values:
+        cell = WriteOnlyCell(ws, value=value)
+        cell.style = style
+        row.append(cell)
+    return row
+
+
+def write_export_workbook(rows, target, column_lengths):
+    """
+    Stream header plus rows into a styled "Activity Details" workbook saved to target
+    (path or file). Uses openpyxl write-only mode, so memory does not grow with the
+    row count; column widths come from column_lengths (see track_column_lengths),
+    because write-only sheets need them before the first row.
+    """
+    wb = Workbook(write_only=True)
+    _add_export_styles(wb)
+    ws_activities = wb.create_sheet("Activity Details")
+
+    # Auto adjust column widths
+    lengths = track_column_lengths(list(column_lengths), EXPORT_HEADERS)
+    for index, max_length in enumerate(lengths[:len(EXPORT_HEADERS)], start=1):
+        ws_activities.column_dimensions[get_column_letter(index)].width = (max_length + 2) * 1.2
+
+    ws_activities.append(_styled_row(ws_activities, EXPORT_HEADERS, HEADER_STYLE))
+    for row in rows:
+        ws_activities.append(_styled_row(ws_activities, row, CELL_STYLE))
+
+    wb.save(target)
+
+
+class _Echo:
+    """File-like object whose write() returns the value, for csv.writer into a generator"""
+
+    def write(self, value):
+        return value
+
+
+def csv_export_chunks(rows):
+    """Header plus rows as UTF-8 CSV, one encoded line at a time"""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_HEADERS).encode('utf-8')
+    for row in rows:
+        yield writer.writerow(row).encode('utf-8')
+
+
+def ndjson_gzip_export_chunks(rows, batch_rows=STREAM_BATCH_ROWS):
+    """
+    Rows as gzip-compressed newline-delimited JSON objects keyed by EXPORT_HEADERS.
+    Compressed output is flushed every batch_rows rows so the client keeps receiving
+    bytes while the query runs.
+    """
+    compressor = zlib.compressobj(wbits=31)  # gzip container
+    pending = []
+    for row in rows:
+        pending.append(json.dumps(dict(zip(EXPORT_HEADERS, row)), default=str))
+        if len(pending) >= batch_rows:
+            pending.append('')
+            yield compressor.compress('\n'.join(pending).encode('utf-8')) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            pending = []
+    if pending:
+        pending.append('')
+        yield compressor.compress('\n'.join(pending).encode('utf-8'))
+    yield compressor.flush()
+
+
+# format -> (chunk generator, content type, file extension) for streamed exports
+STREAM_FORMATS = {
+    'csv': (csv_export_chunks, 'text/csv; charset=utf-8', 'csv'),
+    'ndjson.gz': (ndjson_gzip_export_chunks, 'application/gzip', 'ndjson.gz'),
+}
+
+
+def export_filename(now=None, extension='xlsx'):
+    now = now or datetime.now(EXPORT_TZ)
+    return f"activity_details_export_{now.strftime('%Y%m%d_%H%M%S')}.{extension}"
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from dashboard.tile_cache import evict_tiles
+
+
+class Command(BaseCommand):
+    help = 'Evict unused and least recently used tiles from the shared tile cache (the export worker also runs it every TILE_CACHE_EVICT_SECONDS)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-bytes', type=int, help='Size to shrink the store to (default: TILE_CACHE_MAX_BYTES)')
+        parser.add_argument('--max-age', type=int, help='Evict tiles unused for this many seconds (default: TILE_CACHE_MAX_AGE_SECONDS)')
+
+    def handle(self, *args, **options):
+        removed = evict_tiles(max_bytes=options['max_bytes'], max_age=options['max_age'])
+        self.stdout.write(self.style.SUCCESS(f'Evicted {removed} cached tile(s).'))
@@ -0,0 +1,62 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard.tile_prewarm import company_bboxes, tiles_for_bbox, warm_tiles
+
+
+class Command(BaseCommand):
+    help = "Pre-fetch OSM tiles around each company's usual check-in area into the shared tile cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, action='append', default=[], help='Company id (repeatable; default: all)')
+        parser.add_argument('--min-zoom', type=int, default=12, help='Lowest zoom level to warm')
+        parser.add_argument('--max-zoom', type=int, default=16, help='Highest zoom level to warm')
+        parser.add_argument('--days', type=int, default=90, help='Check-ins from the last N days define the area')
+        parser.add_argument('--trim-percent', type=float, default=5.0, help='Outlying check-ins ignored on each side')
+        parser.add_argument('--margin', type=float, default=0.01, help='Padding around the area in degrees')
+        parser.add_argument('--concurrency', type=int, default=2, help='Upstream fetches in flight')
+        parser.add_argument('--rate', type=float, default=2.0, help='Upstream requests per second (0 = unlimited)')
+        parser.add_argument('--max-tiles', type=int, default=2000, help='Refuse to run above this many tiles')
+        parser.add_argument('--dry-run', action='store_true', help='Only report the areas and tile counts')
+
+    def handle(self, *args, **options):
+        # OSM's tile policy requires an identifiable Referer; without one every fetch is wasted
+        if not (settings.OSM_TILE_REFERER or '').strip():
+            raise CommandError('OSM_TILE_REFERER is empty; set it (or PUBLIC_SITE_URL) to the public site URL')
+        min_zoom, max_zoom = options['min_zoom'], options['max_zoom']
+        if not 0 <= min_zoom <= max_zoom <= settings.OSM_TILE_MAX_ZOOM:
+            raise CommandError(f'Zoom range must be within 0..{settings.OSM_TILE_MAX_ZOOM} and ascending')
+
+        bboxes = company_bboxes(
+            days=options['days'],
+            trim_percent=options['trim_percent'],
+            margin_degrees=options['margin'],
+            company_ids=options['company'],
+        )
+        if not bboxes:
+            raise CommandError('No companies with located check-ins in range')
+
+        tiles = set()
+        for company, bbox in bboxes.items():
+            company_tiles = set(tiles_for_bbox(bbox, min_zoom, max_zoom))
+            self.stdout.write(
+                f'{company.name}: {len(company_tiles)} tiles, bbox {",".join(f"{v:.5f}" for v in bbox)}'
+            )
+            tiles |= company_tiles
+        # OSM's tile policy forbids bulk downloading; keep runs to the areas actually used
+        if len(tiles) > options['max_tiles']:
+            raise CommandError(f'{len(tiles)} tiles exceed --max-tiles {options["max_tiles"]}; narrow the zoom range')
+        if options['dry_run']:
+            self.stdout.write(f'{len(tiles)} tiles would be warmed.')
+            return
+
+        started = time.monotonic()
+        outcomes = warm_tiles(
+            sorted(tiles), settings.OSM_TILE_REFERER,
+            concurrency=options['concurrency'], rate=options['rate'],
+        )
+        summary = ', '.join(f'{count} {outcome}' for outcome, count in sorted(outcomes.items()))
+        style = self.style.WARNING if outcomes.get('failed') else self.style.SUCCESS
+        self.stdout.write(style(f'Warmed {len(tiles)} tiles in {time.monotonic() - started:.1f}s ({summary}).'))
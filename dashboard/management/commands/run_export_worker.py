@@ -0,0 +1,59 @@
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from dashboard.export_jobs import claim_next_job, purge_expired_jobs, requeue_stale_jobs, run_export_job
+from dashboard.tile_cache import evict_tiles
+
+
+class Command(BaseCommand):
+    help = 'Process queued admin dashboard Excel exports and employee report bundles, and evict cached map tiles (run under supervisord)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Process the queued jobs and exit')
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=settings.EXPORT_WORKER_POLL_SECONDS,
+            help='Seconds to wait between polls when the queue is empty',
+        )
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        # First eviction one interval after start, not on every restart
+        next_eviction = time.monotonic() + settings.TILE_CACHE_EVICT_SECONDS
+        while not self.stopping:
+            requeued = requeue_stale_jobs()
+            if requeued:
+                self.stdout.write(f'Requeued {requeued} stale export job(s).')
+
+            job = claim_next_job()
+            if job is None:
+                purged = purge_expired_jobs()
+                if purged:
+                    self.stdout.write(f'Purged {purged} expired export job(s).')
+                if settings.TILE_CACHE_EVICT_SECONDS and time.monotonic() >= next_eviction:
+                    evicted = evict_tiles()
+                    if evicted:
+                        self.stdout.write(f'Evicted {evicted} cached tile(s).')
+                    next_eviction = time.monotonic() + settings.TILE_CACHE_EVICT_SECONDS
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+                continue
+
+            self.stdout.write(f'Export {job.pk}: {job.start_date} to {job.end_date}')
+            if run_export_job(job):
+                job.refresh_from_db()
+                self.stdout.write(self.style.SUCCESS(f'Export {job.pk} completed ({job.rows_processed} rows).'))
+            else:
+                self.stdout.write(self.style.ERROR(f'Export {job.pk} failed.'))
+
+    def _stop(self, signum, frame):
+        # Finish the current job; an interrupted one is resumed from its last chunk anyway
+        self.stopping = True
@@ -0,0 +1,81 @@
+"""
+Grid clustering for the admin dashboard map (GET /dashboard/admin/map-points/).
+
+Points are snapped to a lat/lng grid whose cell size follows the Leaflet zoom level,
+so the browser only receives one marker per cell instead of every check-in/check-out.
+At or above MAP_POINTS_CLUSTER_MAX_ZOOM individual points are returned as-is.
+"""
+import math
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+
+def parse_bbox(raw: str) -> Optional[Tuple[float, float, float, float]]:
+    """
+    Parse Leaflet's LatLngBounds.toBBoxString() format: "west,south,east,north".
+    Returns (west, south, east, north) or None when missing/invalid.
+    """
+    if not raw:
+        return None
+    try:
+        west, south, east, north = (float(part) for part in raw.split(','))
+    except ValueError:
+        return None
+    if not all(math.isfinite(v) for v in (west, south, east, north)):
+        return None
+    south, north = max(-90.0, south), min(90.0, north)
+    west, east = max(-180.0, west), min(180.0, east)
+    if south > north or west > east:
+        return None
+    return west, south, east, north
+
+
+def in_bbox(lat: float, lng: float, bbox: Optional[Tuple[float, float, float, float]]) -> bool:
+    if bbox is None:
+        return True
+    west, south, east, north = bbox
+    return south <= lat <= north and west <= lng <= east
+
+
+def grid_cell_degrees(zoom: int) -> float:
+    """Cell size in degrees: a 256px tile split into MAP_POINTS_GRID_CELLS_PER_TILE cells per side."""
+    return 360.0 / (1 << zoom) / settings.MAP_POINTS_GRID_CELLS_PER_TILE
+
+
+def cluster_points(points: List[Dict], zoom: int) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Group points (dicts with at least lat/lng) by grid cell.
+    Returns (clusters, singles): cells holding several points become
+    {'lat', 'lng', 'count'} at their centroid, lone points are returned unchanged.
+    """
+    if zoom >= settings.MAP_POINTS_CLUSTER_MAX_ZOOM:
+        return [], points
+
+    cell = grid_cell_degrees(zoom)
+    cells: Dict[Tuple[int, int], List[Dict]] = {}
+    for point in points:
+        key = (math.floor(point['lat'] / cell), math.floor(point['lng'] / cell))
+        cells.setdefault(key, []).append(point)
+
+    clusters = []
+    singles = []
+    for members in cells.values():
+        if len(members) == 1:
+            singles.append(members[0])
+            continue
+        clusters.append({
+            'lat': sum(p['lat'] for p in members) / len(members),
+            'lng': sum(p['lng'] for p in members) / len(members),
+            'count': len(members),
+        })
+    return clusters, singles
+
+
+def points_bounds(points: List[Dict]) -> Optional[List[List[float]]]:
+    """Leaflet-style [[south, west], [north, east]] around all points, or None."""
+    if not points:
+        return None
+    lats = [p['lat'] for p in points]
+    lngs = [p['lng'] for p in points]
+    return [[min(lats), min(lngs)], [max(lats), max(lngs)]]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0001_export_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportjobchunk',
+            name='column_lengths',
+            field=models.JSONField(blank=True, default=list, help_text='Longest value per column, for sizing the sheet'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 13:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0002_exportjobchunk_column_lengths'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportjob',
+            name='cache_key',
+            field=models.CharField(blank=True, help_text='Content key of the export (see dashboard.export_cache)', max_length=40),
+        ),
+    ]
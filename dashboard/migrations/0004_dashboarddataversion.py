@@ -0,0 +1,20 @@
+# Generated by Django 5.2.4 on 2026-10-18 13:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0003_exportjob_cache_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardDataVersion',
+            fields=[
+                ('scope', models.CharField(help_text="'company:<id>', 'company:none' or 'companies'", max_length=40, primary_key=True, serialize=False)),
+                ('version', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-18 13:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0004_dashboarddataversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportjob',
+            name='employee_ids',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='exportjob',
+            name='kind',
+            field=models.CharField(choices=[('dashboard', 'Dashboard export'), ('report_bundle', 'Employee report bundle')], default='dashboard', max_length=20),
+        ),
+    ]
@@ -1,3 +1,124 @@
+import os
+import uuid
+
+from django.conf import settings
 from django.db import models
 
-# Create your models here.
+
+class ExportJob(models.Model):
+    """Admin dashboard Excel export or employee report bundle, built in the background by the export worker"""
+
+    KIND_CHOICES = [
+        ('dashboard', 'Dashboard export'),
+        ('report_bundle', 'Employee report bundle'),
+    ]
+
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default='dashboard')
+    requested_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='export_jobs'
+    )
+
+    # Dashboard filters the export was requested with
+    company = models.ForeignKey('employees.Company', on_delete=models.CASCADE, null=True, blank=True)
+    employee = models.ForeignKey('employees.Employee', on_delete=models.CASCADE, null=True, blank=True)
+    start_date = models.DateField()
+    end_date = models.DateField()
+    # Employees of a report bundle
+    employee_ids = models.JSONField(default=list, blank=True)
+
+    # Progress
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending', db_index=True)
+    rows_processed = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    # Finished workbook, relative to EXPORT_ROOT
+    file_path = models.CharField(max_length=255, blank=True)
+    cache_key = models.CharField(max_length=40, blank=True, help_text="Content key of the export (see dashboard.export_cache)")
+
+    # Timestamps
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True, help_text="Last progress update from the worker")
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Export {self.id} ({self.start_date} to {self.end_date}) - {self.get_status_display()}"
+
+    @property
+    def work_dir(self):
+        """Directory holding this job's chunk files and finished workbook"""
+        return os.path.join(settings.EXPORT_ROOT, str(self.id))
+
+    @property
+    def file_abspath(self):
+        return os.path.join(settings.EXPORT_ROOT, self.file_path) if self.file_path else ''
+
+
+class ExportJobChunk(models.Model):
+    """One month (or part of one) of an ExportJob; completed chunks are kept on disk and skipped on resume"""
+
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('completed', 'Completed'),
+    ]
+
+    job = models.ForeignKey(ExportJob, on_delete=models.CASCADE, related_name='chunks')
+    sequence = models.PositiveIntegerField()
+    start_date = models.DateField()
+    end_date = models.DateField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    rows_processed = models.PositiveIntegerField(default=0)
+    column_lengths = models.JSONField(default=list, blank=True, help_text="Longest value per column, for sizing the sheet")
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['job', 'sequence']
+        constraints = [
+            models.UniqueConstraint(fields=['job', 'sequence'], name='unique_export_job_chunk_sequence'),
+        ]
+
+    def __str__(self):
+        return f"Export {self.job_id} chunk {self.sequence} ({self.start_date} to {self.end_date})"
+
+    @property
+    def file_abspath(self):
+        return os.path.join(self.job.work_dir, f'chunk-{self.sequence:04d}.jsonl')
+
+
+class DashboardDataVersion(models.Model):
+    """
+    Version counter of one slice of admin dashboard data (see dashboard.cache).
+
+    Kept in the database rather than the cache so it is bumped atomically and can never
+    be culled back to an older value.
+    """
+
+    scope = models.CharField(max_length=40, primary_key=True, help_text="'company:<id>', 'company:none' or 'companies'")
+    version = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.scope} v{self.version}"
+
+
+class TileCacheCounter(models.Model):
+    """One tile cache event counter (see dashboard.tile_cache), summed over all processes"""
+
+    event = models.CharField(max_length=20, unique=True)
+    value = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.event}={self.value}"
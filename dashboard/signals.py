@@ -0,0 +1,50 @@
+"""
+Invalidate cached dashboard data when the models it is computed from change.
+
+Each change bumps the version of the company it belongs to, after the writing
+transaction commits (see dashboard.cache).
+"""
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from activities.models import DailyActivity, DailyAttendanceRollup
+from employees.models import Company, Employee
+
+from .cache import COMPANIES_SCOPE, bump_data_version_on_commit, company_scope
+
+
+@receiver([post_save, post_delete], sender=DailyActivity)
+def invalidate_activity_company(sender, instance, **kwargs):
+    company_id = Employee.objects.filter(user_id=instance.user_id).values_list('company_id', flat=True).first()
+    bump_data_version_on_commit(company_scope(company_id))
+
+
+@receiver([post_save, post_delete], sender=DailyAttendanceRollup)
+def invalidate_rollup_company(sender, instance, **kwargs):
+    bump_data_version_on_commit(company_scope(instance.company_id))
+
+
+@receiver(pre_save, sender=Employee)
+def remember_employee_company(sender, instance, raw=False, **kwargs):
+    """Keep the company an existing employee is moving away from"""
+    if instance.pk and not raw:
+        instance._previous_company_id = (
+            Employee.objects.filter(pk=instance.pk).values_list('company_id', flat=True).first()
+        )
+
+
+@receiver([post_save, post_delete], sender=Employee)
+def invalidate_employee_company(sender, instance, **kwargs):
+    bump_data_version_on_commit(company_scope(instance.company_id))
+    if kwargs.get('created', True):
+        # The user's activities move between company=None and the company
+        bump_data_version_on_commit(company_scope(None))
+    previous = getattr(instance, '_previous_company_id', None)
+    if previous is not None and previous != instance.company_id:
+        bump_data_version_on_commit(company_scope(previous))
+
+
+@receiver([post_save, post_delete], sender=Company)
+def invalidate_company(sender, instance, **kwargs):
+    bump_data_version_on_commit(company_scope(instance.pk))
+    bump_data_version_on_commit(COMPANIES_SCOPE)
@@ -1,3 +1,678 @@
-from django.test import TestCase
+import contextlib
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time as time_module
+from datetime import date, datetime, time, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings as django_settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.http import FileResponse
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+import openpyxl
+
+from activities.models import DailyActivity, PlannedActivity
+from employees.models import Company, Employee
+
+from . import export_jobs, tile_cache
+from .cache import company_scope
+from .export_cache import evict_export_cache
+from .export_jobs import claim_next_job, month_chunks, requeue_stale_jobs, run_export_job
+from .exports import EXPORT_CONTENT_TYPE
+from .models import DashboardDataVersion, ExportJob
+from .tile_prewarm import company_bboxes, tiles_for_bbox, warm_tiles
+
+User = get_user_model()
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES, DASHBOARD_CACHE_SECONDS=0)
+class AdminDashboardTodayStatsTests(TestCase):
+    """Today block of the admin dashboard: counts, absent list and query budget"""
+
+    def setUp(self):
+        cache.clear()
+        self.today = date.today()
+        self.company = Company.objects.create(name='Arnatech', code='ARN')
+        self.admin = User.objects.create(sso_id='admin', email='admin@example.com', is_staff=True)
+        self.client.force_login(self.admin)
+        self.employee_count = 0
+
+    def _employee(self, employment_status='active'):
+        self.employee_count += 1
+        n = self.employee_count
+        user = User.objects.create(sso_id=f'emp{n}', email=f'emp{n}@example.com', first_name=f'Emp{n}')
+        Employee.objects.create(
+            user=user,
+            employee_id=f'E{n}',
+            full_name=f'Emp{n}',
+            company=self.company,
+            position='Engineer',
+            employment_status=employment_status,
+            hire_date=self.today,
+        )
+        return user
+
+    def _activity(self, user, checked_out=False, attendance_status='on_time'):
+        checkin = timezone.make_aware(datetime.combine(self.today, time(8, 0)))
+        checkout = timezone.make_aware(datetime.combine(self.today, time(17, 0)))
+        return DailyActivity.objects.create(
+            user=user,
+            date=self.today,
+            checkin_time=checkin,
+            checkout_time=checkout if checked_out else None,
+            checkin_location='-6.2,106.8',
+            checkout_location='-6.2,106.8' if checked_out else '',
+            status='completed' if checked_out else 'pending',
+            attendance_status=attendance_status,
+        )
+
+    def _populate(self, employees):
+        """Half the active employees check in (one of them late), plus an inactive one"""
+        users = [self._employee() for _ in range(employees)]
+        for i, user in enumerate(users[: employees // 2]):
+            self._activity(user, checked_out=(i == 0), attendance_status='late' if i == 1 else 'on_time')
+        self._activity(self._employee(employment_status='terminated'))
+        return users
+
+    def _get(self):
+        return self.client.get(reverse('dashboard:admin'), {'company': self.company.id})
+
+    def test_today_stats_and_absent_list(self):
+        users = self._populate(6)
+
+        response = self._get()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['today_stats'], {
+            'total_expected': 6,
+            'checked_in': 3,
+            'checked_out': 1,
+            'on_time': 3,
+            'late': 1,
+            'absent': 3,
+        })
+        self.assertEqual(
+            [u.pk for u in response.context['absent_today']],
+            [u.pk for u in sorted(users[3:], key=lambda u: u.first_name)],
+        )
+
+    def test_query_count_does_not_grow_with_employees(self):
+        self._populate(4)
+        with CaptureQueriesContext(connection) as small:
+            self._get()
+
+        self._populate(20)
+        with CaptureQueriesContext(connection) as large:
+            self._get()
+
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+    def test_query_count(self):
+        self._populate(6)
+        # session, user, data version, employee aggregate, today rollup, range rollup, the admin's
+        # own profile (base template), companies and employees dropdowns, late list,
+        # absent list, recent activities
+        with self.assertNumQueries(12):
+            self._get()
+
+    def test_absent_list_uses_anti_join(self):
+        self._populate(6)
+        with CaptureQueriesContext(connection) as queries:
+            self._get()
+
+        absent_sql = [q['sql'] for q in queries.captured_queries if 'NOT (EXISTS' in q['sql']]
+        self.assertEqual(len(absent_sql), 1)
+        self.assertNotIn(' IN (', absent_sql[0])
+
+
+@override_settings(CACHES=LOCMEM_CACHES, DASHBOARD_CACHE_SECONDS=300)
+class AdminDashboardCacheTests(TestCase):
+    """Computed dashboard data is cached per filter set and invalidated by model saves"""
+
+    def setUp(self):
+        cache.clear()
+        self.company = Company.objects.create(name='Arnatech', code='ARN')
+        self.admin = User.objects.create(sso_id='admin', email='admin@example.com', is_staff=True)
+        self.client.force_login(self.admin)
+        self.user = User.objects.create(sso_id='emp1', email='emp1@example.com')
+        self.employee = Employee.objects.create(
+            user=self.user, employee_id='E1', full_name='Emp1', company=self.company,
+            position='Engineer', hire_date=date.today(),
+        )
+
+    def _get(self, **params):
+        return self.client.get(reverse('dashboard:admin'), {'company': self.company.id, **params})
+
+    def test_repeat_request_is_served_from_cache(self):
+        self._get()
+        # Only the session, its user, the data version and the admin's own profile (base template)
+        with self.assertNumQueries(4):
+            response = self._get()
+        self.assertEqual(response.context['today_stats']['total_expected'], 1)
+
+    def test_equivalent_filters_share_an_entry(self):
+        self._get(date_range='not-a-range')
+        with self.assertNumQueries(4):
+            self._get()
+
+    def _check_in(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            DailyActivity.objects.create(
+                user=self.user, date=date.today(), checkin_time=timezone.now(), checkin_location='-6.2,106.8',
+            )
+
+    def test_model_save_invalidates(self):
+        self._get()
+        self._check_in()
+
+        response = self._get()
+
+        self.assertEqual(response.context['today_stats']['checked_in'], 1)
+
+    def test_version_is_bumped_on_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            DailyActivity.objects.create(
+                user=self.user, date=date.today(), checkin_time=timezone.now(), checkin_location='-6.2,106.8',
+            )
+        self.assertFalse(DashboardDataVersion.objects.exists())
+
+        for callback in callbacks:
+            callback()
+
+        self.assertGreater(DashboardDataVersion.objects.get(scope=company_scope(self.company.id)).version, 0)
+
+    def test_other_company_keeps_its_entry(self):
+        other = Company.objects.create(name='Other', code='OTH')
+        self.client.get(reverse('dashboard:admin'), {'company': other.id})
+        self._check_in()
+
+        with self.assertNumQueries(4):
+            self.client.get(reverse('dashboard:admin'), {'company': other.id})
+        self.assertEqual(self._get().context['today_stats']['checked_in'], 1)
+
+    def test_employee_moving_company_invalidates_both(self):
+        other = Company.objects.create(name='Other', code='OTH')
+        self._get()
+        self.client.get(reverse('dashboard:admin'), {'company': other.id})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.employee.company = other
+            self.employee.save()
+
+        self.assertEqual(self._get().context['today_stats']['total_expected'], 0)
+        response = self.client.get(reverse('dashboard:admin'), {'company': other.id})
+        self.assertEqual(response.context['today_stats']['total_expected'], 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, DASHBOARD_CACHE_SECONDS=0, MAP_POINTS_CLUSTER_MAX_ZOOM=16)
+class MapPointsTests(TestCase):
+    """admin_map_points_api: bbox filtering, clustering and the per-request activity cap"""
+
+    def setUp(self):
+        self.admin = User.objects.create(sso_id='admin', email='admin@example.com', is_staff=True)
+        self.client.force_login(self.admin)
+        # Newest first: two check-ins around the Jakarta office, one in Bali (checked out in Jakarta)
+        self.activities = [
+            self._activity(1, date(2025, 3, 5), '-6.2,106.8'),
+            self._activity(2, date(2025, 3, 4), '-6.2001,106.8001'),
+            self._activity(3, date(2025, 3, 3), '-8.65,115.2', checkout_location='-6.2,106.8'),
+        ]
+
+    def _activity(self, n, day, checkin_location, checkout_location=''):
+        user = User.objects.create(sso_id=f'emp{n}', email=f'emp{n}@example.com')
+        return DailyActivity.objects.create(
+            user=user, date=day, checkin_location=checkin_location, checkout_location=checkout_location,
+        )
+
+    def _points(self, **params):
+        params.setdefault('date_range', '2025-03-01_2025-03-31')
+        return self.client.get(reverse('dashboard:admin_map_points'), params)
+
+    def test_unbounded_load_clusters_and_returns_bounds(self):
+        data = self._points(zoom=5).json()
+
+        self.assertEqual([cluster['count'] for cluster in data['clusters']], [3])
+        self.assertEqual([(p['kind'], p['lat']) for p in data['points']], [('checkin', -8.65)])
+        self.assertEqual(data['bounds'], [[-8.65, 106.8], [-6.2, 115.2]])
+        self.assertFalse(data['truncated'])
+
+    def test_bbox_keeps_only_points_inside(self):
+        data = self._points(zoom=18, bbox='106.7,-6.3,106.9,-6.1').json()
+
+        self.assertEqual(data['clusters'], [])
+        self.assertEqual(
+            sorted((p['id'], p['kind']) for p in data['points']),
+            sorted([(self.activities[0].id, 'checkin'), (self.activities[1].id, 'checkin'),
+                    (self.activities[2].id, 'checkout')]),
+        )
+        self.assertIsNone(data['bounds'])
+
+    def test_only_the_unbounded_load_is_cached(self):
+        with override_settings(DASHBOARD_CACHE_SECONDS=300), \
+                mock.patch('dashboard.cache.cache.set', wraps=cache.set) as cache_set:
+            self._points(zoom=5)
+            self._points(zoom=12, bbox='106.7,-6.3,106.9,-6.1')
+            self._points(zoom=13, bbox='106.75,-6.25,106.85,-6.15')
+
+        self.assertEqual([call.args[0].split(':')[1] for call in cache_set.call_args_list], ['map'])
+
+    def test_invalid_bbox_and_zoom_are_rejected(self):
+        self.assertEqual(self._points(bbox='106.7,-6.3,106.9').status_code, 400)
+        self.assertEqual(self._points(bbox='106.7,-6.1,106.9,-6.3').status_code, 400)
+        self.assertEqual(self._points(bbox='nan,-6.3,106.9,-6.1').status_code, 400)
+        self.assertEqual(self._points(zoom='far').status_code, 400)
+        # Out-of-range zoom is clamped rather than rejected
+        self.assertEqual(self._points(zoom=99).json()['zoom'], django_settings.OSM_TILE_MAX_ZOOM)
+
+    def test_activity_cap_keeps_the_newest(self):
+        with override_settings(MAP_POINTS_MAX_ACTIVITIES=2):
+            data = self._points(zoom=18).json()
+
+        self.assertTrue(data['truncated'])
+        self.assertEqual({p['id'] for p in data['points']}, {self.activities[0].id, self.activities[1].id})
+
+        with override_settings(MAP_POINTS_MAX_ACTIVITIES=3):
+            self.assertFalse(self._points(zoom=18).json()['truncated'])
+
+
+class ExportTestCase(TestCase):
+    """Admin with three activities (one per month, Jan-Mar 2025) and temporary export directories"""
+
+    def setUp(self):
+        self.export_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.export_root, ignore_errors=True)
+        override = override_settings(
+            EXPORT_ROOT=self.export_root,
+            EXPORT_CACHE_ROOT=os.path.join(self.export_root, 'cache'),
+            CACHES=LOCMEM_CACHES,
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.admin = User.objects.create(sso_id='admin', email='admin@example.com', is_staff=True)
+        self.client.force_login(self.admin)
+        for day in (date(2025, 1, 15), date(2025, 2, 10), date(2025, 3, 5)):
+            DailyActivity.objects.create(
+                user=self.admin, date=day, checkin_location='-6.2,106.8',
+                checkin_time=timezone.make_aware(datetime.combine(day, time(8, 0))),
+            )
+
+    def _queue(self, date_range='2025-01-01_2025-03-31'):
+        return self.client.post(reverse('dashboard:export_admin_dashboard'), {'date_range': date_range})
+
+    def _queue_format(self, export_format):
+        return self.client.post(
+            reverse('dashboard:export_admin_dashboard'),
+            {'date_range': '2025-01-01_2025-03-31', 'format': export_format},
+        )
+
+
+class ExportJobTests(ExportTestCase):
+    """Excel exports are queued, built per month by the worker and resumable"""
+
+    def test_month_chunks_newest_first(self):
+        self.assertEqual(month_chunks(date(2025, 1, 20), date(2025, 3, 3)), [
+            (date(2025, 3, 1), date(2025, 3, 3)),
+            (date(2025, 2, 1), date(2025, 2, 28)),
+            (date(2025, 1, 20), date(2025, 1, 31)),
+        ])
+
+    def test_export_is_queued_then_built_by_worker(self):
+        response = self._queue()
+        self.assertEqual(response.status_code, 202)
+        status_url = response.json()['status_url']
+        self.assertEqual(self.client.get(status_url).json()['status'], 'pending')
+
+        run_export_job(claim_next_job())
+
+        status = self.client.get(status_url).json()
+        self.assertEqual(status['status'], 'completed')
+        self.assertEqual(status['rows_processed'], 3)
+        self.assertEqual((status['chunks_total'], status['chunks_done']), (3, 3))
+        download = self.client.get(status['download_url'])
+        self.assertEqual(download.status_code, 200)
+        sheet = openpyxl.load_workbook(io.BytesIO(b''.join(download.streaming_content)))['Activity Details']
+        self.assertEqual(sheet.max_row, 4)
+        self.assertEqual(sheet['A1'].style, 'export_header')
+        self.assertEqual(sheet['D2'].style, 'export_cell')
+        # Width measured while the chunks were written: check-in timestamps are the longest values
+        self.assertAlmostEqual(sheet.column_dimensions['E'].width, (19 + 2) * 1.2)
+
+    def test_range_is_validated(self):
+        self.assertEqual(self._queue('2025-03-31_2025-01-01').status_code, 400)
+        self.assertEqual(self._queue('2020-01-01_2025-01-01').status_code, 400)
+        self.assertEqual(self.client.get(reverse('dashboard:export_admin_dashboard')).status_code, 405)
+        self.assertEqual(self._queue_format('pdf').status_code, 400)
+
+    def test_csv_is_streamed(self):
+        response = self.client.get(
+            reverse('dashboard:export_admin_dashboard'),
+            {'date_range': '2025-01-01_2025-03-31', 'format': 'csv'},
+        )
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(lines[0].split(',')[:2], ['Employee', 'Position'])
+        self.assertEqual([line.split(',')[3] for line in lines[1:]], ['2025-03-05', '2025-02-10', '2025-01-15'])
+        self.assertFalse(ExportJob.objects.exists())
+
+    def test_ndjson_gz_is_streamed(self):
+        response = self._queue_format('ndjson.gz')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        records = [json.loads(line) for line in gzip.decompress(b''.join(response.streaming_content)).splitlines()]
+        self.assertEqual([r['Date'] for r in records], ['2025-03-05', '2025-02-10', '2025-01-15'])
+        self.assertEqual(records[0]['Employee'], 'admin')
+
+    def test_other_users_cannot_see_job(self):
+        status_url = self._queue().json()['status_url']
+        other = User.objects.create(sso_id='other', email='other@example.com', is_staff=True)
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(status_url).status_code, 404)
+
+    def test_stale_job_resumes_after_completed_chunks(self):
+        job = ExportJob.objects.get(pk=self._queue().json()['job_id'])
+        # A worker finished the newest month, then died
+        first = job.chunks.get(sequence=0)
+        os.makedirs(job.work_dir)
+        with open(first.file_abspath, 'w') as fh:
+            fh.write(json.dumps(['from the first run']) + '\n')
+        first.status = 'completed'
+        first.rows_processed = 1
+        first.save()
+        ExportJob.objects.filter(pk=job.pk).update(
+            status='running', heartbeat_at=timezone.now() - timedelta(hours=1),
+        )
+
+        self.assertEqual(requeue_stale_jobs(), 1)
+        job = claim_next_job()
+        # chunk list, progress for the skipped month, 2 remaining months x (activities,
+        # 3 prefetches, chunk save, progress), assembly heartbeat, completion; no query
+        # for the finished month
+        with self.assertNumQueries(16):
+            run_export_job(job)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual(job.rows_processed, 3)
+
+
+    def test_heartbeat_continues_while_the_workbook_is_assembled(self):
+        self._queue()
+        job = claim_next_job()
+
+        with mock.patch('dashboard.export_jobs.PROGRESS_EVERY_ROWS', 1), \
+                mock.patch('dashboard.export_jobs._heartbeat', wraps=export_jobs._heartbeat) as heartbeat:
+            run_export_job(job)
+
+        # One per row read back from the chunk files, then one before the workbook is saved
+        self.assertEqual(heartbeat.call_count, 4)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'completed')
+
+
+class ExportCacheTests(ExportTestCase):
+    """Repeated exports of unchanged data are served from the file cache with an ETag"""
+
+    def _csv(self, **headers):
+        return self.client.get(
+            reverse('dashboard:export_admin_dashboard'),
+            {'date_range': '2025-01-01_2025-03-31', 'format': 'csv'},
+            **headers,
+        )
+
+    def test_repeat_is_served_from_cache(self):
+        first = self._csv()
+        body = b''.join(first.streaming_content)
+        etag = first['ETag']
+
+        second = self._csv()
+
+        self.assertIsInstance(second, FileResponse)
+        self.assertEqual(second['ETag'], etag)
+        self.assertEqual(b''.join(second.streaming_content), body)
+
+    def test_if_none_match_returns_304(self):
+        etag = self._csv()['ETag']
+        response = self._csv(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_child_edit_changes_key(self):
+        etag = self._csv()['ETag']
+        PlannedActivity.objects.create(daily_activity=DailyActivity.objects.first(), title='Deploy')
+
+        response = self._csv(HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn(b'Deploy', b''.join(response.streaming_content))
+
+    def test_user_name_change_changes_key(self):
+        etag = self._csv()['ETag']
+        User.objects.filter(pk=self.admin.pk).update(first_name='Ada', last_name='Lovelace')
+
+        response = self._csv(HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Ada Lovelace', b''.join(response.streaming_content))
+
+    def test_finished_workbook_is_reused(self):
+        self._queue()
+        run_export_job(claim_next_job())
+
+        response = self._queue()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(ExportJob.objects.count(), 1)
+        download = self.client.get(response.json()['download_url'])
+        self.assertEqual(download['Content-Type'], EXPORT_CONTENT_TYPE)
+
+    def test_least_recently_used_files_are_evicted(self):
+        cache_root = os.path.join(self.export_root, 'cache')
+        os.makedirs(cache_root)
+        for age, name in enumerate(['new.csv', 'old.csv']):
+            path = os.path.join(cache_root, name)
+            with open(path, 'wb') as fh:
+                fh.write(b'x' * 100)
+            os.utime(path, (1000 - age, 1000 - age))
+
+        self.assertEqual(evict_export_cache(max_bytes=150), 1)
+        self.assertEqual(os.listdir(cache_root), ['new.csv'])
+
+
+class TileCacheTests(TestCase):
+    """osm_tile_proxy serves tiles from the shared disk cache and only goes upstream on a miss"""
+
+    def setUp(self):
+        tile_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tile_root, ignore_errors=True)
+        override = override_settings(TILE_CACHE_ROOT=tile_root, CACHES=LOCMEM_CACHES)
+        override.enable()
+        self.addCleanup(override.disable)
+        tile_cache.reset_stats()
+
+        self.admin = User.objects.create(sso_id='admin', email='admin@example.com', is_staff=True)
+        self.client.force_login(self.admin)
+        patcher = mock.patch('dashboard.tile_upstream.get_session')
+        self.upstream = patcher.start().return_value.get
+        self.upstream.side_effect = self._upstream
+        self.addCleanup(patcher.stop)
+        self.upstream_status = 200
+
+    def _upstream(self, url, headers=None, **kwargs):
+        status = self.upstream_status
+        if status == 200 and (headers or {}).get('If-None-Match') == '"v1"':
+            status = 304
+        response = mock.Mock(status_code=status, content=b'PNG:' + url.encode() if status == 200 else b'')
+        response.headers = {'Content-Type': 'image/png', 'ETag': '"v1"'}
+        return response
+
+    def _tile(self, z=12, x=3263, y=2119, **extra):
+        return self.client.get(reverse('dashboard:osm_tile', args=[z, x, y]), **extra)
+
+    def test_second_request_is_a_disk_hit(self):
+        first = self._tile()
+        second = self._tile()
+
+        self.assertEqual(self.upstream.call_count, 1)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['ETag'], '"v1"')
+        stats = self.client.get(reverse('dashboard:osm_tile_cache_stats')).json()
+        self.assertEqual((stats['hits'], stats['misses'], stats['stored']), (1, 1, 1))
+
+    def test_stale_tile_is_revalidated_and_served_if_upstream_fails(self):
+        first = self._tile()
+        with override_settings(TILE_CACHE_MAX_AGE_SECONDS=0):
+            revalidated = self._tile()
+            self.assertEqual(self.upstream.call_count, 2)
+            self.assertEqual(self.upstream.call_args.kwargs['headers']['If-None-Match'], '"v1"')
+            self.assertEqual(revalidated.content, first.content)
+
+            self.upstream_status = 503
+            response = self._tile()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content.startswith(b'PNG:'))
+        stats = tile_cache.tile_cache_stats()
+        self.assertEqual((stats['stale'], stats['revalidated'], stats['upstream_errors']), (2, 1, 1))
+
+    def test_matching_client_etag_gets_304(self):
+        self._tile()
+        response = self._tile(HTTP_IF_NONE_MATCH='"v1"')
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], '"v1"')
+        self.assertIn('max-age', response['Cache-Control'])
+        self.assertEqual(self._tile(HTTP_IF_NONE_MATCH='"v0"').status_code, 200)
+
+    def test_miss_filled_while_waiting_is_not_refetched(self):
+        @contextlib.contextmanager
+        def other_worker_fetched(z, x, y):
+            tile_cache.store_tile(z, x, y, b'PNG:other', 'image/png', '"v1"')
+            yield
+
+        with mock.patch('dashboard.tile_upstream.single_flight', other_worker_fetched):
+            response = self._tile()
+
+        self.assertEqual(response.content, b'PNG:other')
+        self.upstream.assert_not_called()
+        self.assertEqual(tile_cache.tile_cache_stats()['coalesced'], 1)
+
+    def test_upstream_404_is_not_cached(self):
+        self.upstream_status = 404
+        self.assertEqual(self._tile().status_code, 404)
+        self.assertIsNone(tile_cache.get_tile(12, 3263, 2119))
+
+    def test_least_recently_used_tiles_are_evicted(self):
+        for y in range(3):
+            tile_cache.store_tile(5, 1, y, b'x' * 100)
+        for age, y in enumerate([2, 0, 1]):
+            _directory, _tile_path, meta_path = tile_cache._tile_paths(5, 1, y)
+            os.utime(meta_path, (time_module.time() - age, time_module.time() - age))
+
+        self.assertEqual(tile_cache.evict_tiles(max_bytes=250), 1)
+        self.assertIsNone(tile_cache.get_tile(5, 1, 1))
+        self.assertIsNotNone(tile_cache.get_tile(5, 1, 0))
+
+    def test_fetch_locks_are_per_tile_and_removed(self):
+        from .tile_upstream import single_flight
+
+        other_tile_locked = threading.Event()
+
+        def lock_other_tile():
+            with single_flight(12, 3263, 2120):
+                other_tile_locked.set()
+
+        with single_flight(12, 3263, 2119):
+            thread = threading.Thread(target=lock_other_tile)
+            thread.start()
+            # An unrelated tile does not wait for this one's fetch
+            self.assertTrue(other_tile_locked.wait(timeout=5))
+            thread.join()
+
+        lock_dir = os.path.join(django_settings.TILE_CACHE_ROOT, '.locks')
+        self.assertEqual(os.listdir(lock_dir) if os.path.isdir(lock_dir) else [], [])
+
+    def test_stores_never_evict_in_the_request(self):
+        with override_settings(TILE_CACHE_MAX_BYTES=0), mock.patch('dashboard.tile_cache.os.walk') as walk:
+            for y in range(3):
+                tile_cache.store_tile(5, 1, y, b'x' * 100)
+        walk.assert_not_called()
+
+        out = io.StringIO()
+        call_command('evict_tiles', '--max-bytes', '150', stdout=out)
+        self.assertIn('Evicted 2 cached tile(s).', out.getvalue())
+
+    def test_counters_are_summed_in_the_database(self):
+        tile_cache._add_to_shared({'hits': 3, 'misses': 1})
+        tile_cache._add_to_shared({'hits': 2})
+
+        stats = tile_cache.tile_cache_stats()
+
+        self.assertEqual((stats['hits'], stats['misses'], stats['hit_ratio']), (5, 1, round(5 / 6, 4)))
+
+
+class TilePrewarmTests(TestCase):
+    """prewarm_tiles: area from recent check-ins, tiles fetched into the shared cache"""
+
+    def setUp(self):
+        tile_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tile_root, ignore_errors=True)
+        override = override_settings(TILE_CACHE_ROOT=tile_root, CACHES=LOCMEM_CACHES)
+        override.enable()
+        self.addCleanup(override.disable)
+        tile_cache.reset_stats()
+
+        self.company = Company.objects.create(name='Arnatech', code='ARN')
+        today = timezone.localdate()
+        for n in range(20):
+            user = User.objects.create(sso_id=f'emp{n}', email=f'emp{n}@example.com')
+            Employee.objects.create(
+                user=user, employee_id=f'E{n}', full_name=f'Emp {n}', company=self.company,
+                position='Engineer', hire_date=date(2025, 1, 1),
+            )
+            # One check-in from Bali; the rest around the Jakarta office
+            location = '-8.65,115.2' if n == 0 else f'{-6.2 + n * 0.0001},{106.8 + n * 0.0001}'
+            DailyActivity.objects.create(user=user, date=today, checkin_location=location)
+
+    def test_area_ignores_outlying_check_ins(self):
+        west, south, east, north = company_bboxes(margin_degrees=0)[self.company]
+
+        self.assertAlmostEqual(south, -6.1999, places=4)
+        self.assertLess(north - south, 0.01)
+        self.assertLess(east, 107)
+
+    def test_only_missing_tiles_are_fetched(self):
+        tiles = list(tiles_for_bbox(company_bboxes()[self.company], 14, 15))
+        tile_cache.store_tile(*tiles[0], b'PNG:cached', record_stats=False)
+        response = mock.Mock(status_code=200, content=b'PNG:new', headers={'ETag': '"v1"'})
+
+        with mock.patch('dashboard.tile_upstream.get_session') as session:
+            session.return_value.get.return_value = response
+            outcomes = warm_tiles(tiles, 'https://clockin.example.com', rate=0)
+
+        self.assertEqual(outcomes, {'fresh': 1, 'stored': len(tiles) - 1})
+        self.assertEqual(session.return_value.get.call_count, len(tiles) - 1)
+        self.assertEqual(tile_cache.get_tile(*tiles[-1]).data, b'PNG:new')
+        # Shares the proxy's fetch path but not its live-traffic counters
+        stats = tile_cache.tile_cache_stats()
+        self.assertEqual((stats['misses'], stats['stored']), (0, 0))
+
+    def test_empty_referer_fails_before_any_work(self):
+        with override_settings(OSM_TILE_REFERER=''), mock.patch('dashboard.tile_upstream.get_session') as session:
+            with self.assertRaisesMessage(CommandError, 'OSM_TILE_REFERER is empty'):
+                call_command('prewarm_tiles', stdout=io.StringIO())
+            with self.assertRaises(ValueError):
+                warm_tiles([(14, 1, 1)], '')
+        session.assert_not_called()
@@ -0,0 +1,190 @@
+"""
+On-disk OSM tile store shared by every worker process.
+
+Tiles live at TILE_CACHE_ROOT/<z>/<x>/<y>.png with a <y>.json metadata file holding the
+upstream ETag, content type and fetch time. Both are written to a temp file and renamed
+into place, so readers never see a partial tile. The .png mtime is the fetch time; the
+.json mtime is bumped on every hit and serves as the last-used time for eviction.
+
+A tile fetched more than TILE_CACHE_MAX_AGE_SECONDS ago is returned as stale (the caller
+revalidates it upstream with its ETag). Eviction drops tiles unused for longer than that
+age, then the least recently used ones until the store fits in TILE_CACHE_MAX_BYTES. It
+walks the whole store, so it never runs in a request: the export worker runs it every
+TILE_CACHE_EVICT_SECONDS, and `manage.py evict_tiles` runs it on demand.
+
+Hit/miss counters are kept per process and added in batches to TileCacheCounter rows
+with atomic UPDATE ... SET value = value + n statements, so a hit stays a couple of
+local file reads.
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import Counter, namedtuple
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import TileCacheCounter
+
+logger = logging.getLogger(__name__)
+
+CachedTile = namedtuple('CachedTile', ['data', 'content_type', 'etag', 'fetched_at', 'stale'])
+
+STAT_KEYS = ('hits', 'misses', 'stale', 'coalesced', 'revalidated', 'stored', 'evicted', 'upstream_errors')
+# Local events recorded before they are added to the shared counters
+STATS_FLUSH_EVERY = 50
+
+_lock = threading.Lock()
+_pending_stats = Counter()
+
+
+def _tile_paths(z, x, y):
+    directory = os.path.join(settings.TILE_CACHE_ROOT, str(z), str(x))
+    return directory, os.path.join(directory, f'{y}.png'), os.path.join(directory, f'{y}.json')
+
+
+def _write_atomic(directory, path, data):
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            fh.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def get_tile(z, x, y):
+    """CachedTile for z/x/y (marked stale past TILE_CACHE_MAX_AGE_SECONDS), or None on a miss"""
+    _directory, tile_path, meta_path = _tile_paths(z, x, y)
+    try:
+        with open(meta_path, 'rb') as fh:
+            meta = json.load(fh)
+        with open(tile_path, 'rb') as fh:
+            data = fh.read()
+        os.utime(meta_path)  # last used, for LRU eviction
+    except (OSError, ValueError):
+        return None
+    fetched_at = meta.get('fetched_at', 0)
+    return CachedTile(
+        data=data,
+        content_type=meta.get('content_type', 'image/png'),
+        etag=meta.get('etag', ''),
+        fetched_at=fetched_at,
+        stale=time.time() - fetched_at > settings.TILE_CACHE_MAX_AGE_SECONDS,
+    )
+
+
+def store_tile(z, x, y, data, content_type='image/png', etag='', record_stats=True):
+    """Write a tile and its metadata; record_stats=False leaves it out of the 'stored' counter"""
+    directory, tile_path, meta_path = _tile_paths(z, x, y)
+    os.makedirs(directory, exist_ok=True)
+    meta = {'etag': etag or '', 'content_type': content_type, 'fetched_at': time.time()}
+    # Tile first: metadata present means the tile next to it is complete
+    _write_atomic(directory, tile_path, data)
+    _write_atomic(directory, meta_path, json.dumps(meta).encode('utf-8'))
+    if record_stats:
+        record('stored')
+
+
+def mark_fresh(z, x, y, etag=''):
+    """Restart a cached tile's age after upstream confirmed it unchanged (304)"""
+    directory, _tile_path, meta_path = _tile_paths(z, x, y)
+    try:
+        with open(meta_path, 'rb') as fh:
+            meta = json.load(fh)
+    except (OSError, ValueError):
+        return False
+    meta['fetched_at'] = time.time()
+    if etag:
+        meta['etag'] = etag
+    _write_atomic(directory, meta_path, json.dumps(meta).encode('utf-8'))
+    return True
+
+
+def evict_tiles(max_bytes=None, max_age=None):
+    """Drop tiles unused for longer than max_age, then LRU tiles beyond max_bytes; returns tiles removed"""
+    max_bytes = settings.TILE_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    max_age = settings.TILE_CACHE_MAX_AGE_SECONDS if max_age is None else max_age
+    cutoff = time.time() - max_age
+
+    tiles = []
+    total = 0
+    for directory, _dirs, files in os.walk(settings.TILE_CACHE_ROOT):
+        for name in files:
+            if not name.endswith('.json'):
+                continue
+            meta_path = os.path.join(directory, name)
+            tile_path = meta_path[:-len('.json')] + '.png'
+            try:
+                last_used = os.stat(meta_path).st_mtime
+                size = os.stat(tile_path).st_size
+            except FileNotFoundError:
+                continue
+            tiles.append((last_used, size, tile_path, meta_path))
+            total += size
+
+    removed = 0
+    for last_used, size, tile_path, meta_path in sorted(tiles):
+        if last_used >= cutoff and total <= max_bytes:
+            break
+        for path in (meta_path, tile_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        total -= size
+        removed += 1
+    if removed:
+        record('evicted', removed)
+        logger.info('Evicted %d cached tile(s)', removed)
+    return removed
+
+
+def record(event, count=1):
+    """Count a tile cache event; flushed to the shared counters in batches"""
+    with _lock:
+        _pending_stats[event] += count
+        if sum(_pending_stats.values()) < STATS_FLUSH_EVERY:
+            return
+        pending = dict(_pending_stats)
+        _pending_stats.clear()
+    _add_to_shared(pending)
+
+
+def _add_to_shared(pending):
+    for event, count in pending.items():
+        counters = TileCacheCounter.objects.filter(event=event)
+        if counters.update(value=F('value') + count):
+            continue
+        try:
+            with transaction.atomic():
+                TileCacheCounter.objects.create(event=event, value=count)
+        except IntegrityError:
+            # Created concurrently
+            counters.update(value=F('value') + count)
+
+
+def tile_cache_stats():
+    """Shared hit/miss/store/eviction counters (including this process's unflushed events)"""
+    with _lock:
+        pending = dict(_pending_stats)
+        _pending_stats.clear()
+    _add_to_shared(pending)
+    stored = dict(TileCacheCounter.objects.values_list('event', 'value'))
+    stats = {event: stored.get(event, 0) for event in STAT_KEYS}
+    lookups = stats['hits'] + stats['misses'] + stats['stale']
+    stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else None
+    return stats
+
+
+def reset_stats():
+    """Zero the shared counters and this process's unflushed events"""
+    with _lock:
+        _pending_stats.clear()
+    TileCacheCounter.objects.all().delete()
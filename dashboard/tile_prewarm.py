@@ -0,0 +1,135 @@
+"""
+Pre-warming of the shared OSM tile cache around each company's usual check-in area.
+
+The area is the box around the company's recent check-in coordinates with the outer
+trim_percent of latitudes and longitudes dropped on each side (one check-in from an
+airport should not pull in half the country), padded by a margin. Tiles covering that
+box are fetched over a zoom range through tile_upstream.fetch_through_cache(), the same
+path as osm_tile_proxy, so a warm run and live map traffic never fetch a tile twice.
+"""
+import logging
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.utils import timezone
+
+from activities.models import DailyActivity
+from employees.models import Company
+
+from . import tile_upstream
+
+logger = logging.getLogger(__name__)
+
+# Web Mercator cannot show the poles; tile rows are clamped to this latitude
+MAX_MERCATOR_LATITUDE = 85.0511
+
+
+def company_bboxes(days=90, trim_percent=5.0, margin_degrees=0.01, company_ids=None):
+    """
+    {company: (west, south, east, north)} around each company's check-ins in the last days,
+    skipping companies without located check-ins.
+    """
+    since = timezone.localdate() - timedelta(days=days)
+    companies = Company.objects.order_by('name')
+    if company_ids:
+        companies = companies.filter(id__in=company_ids)
+
+    bboxes = {}
+    for company in companies:
+        rows = DailyActivity.objects.filter(
+            user__employee_profile__company=company,
+            date__gte=since,
+            checkin_latitude__isnull=False,
+            checkin_longitude__isnull=False,
+        ).values_list('checkin_latitude', 'checkin_longitude')
+        lats, lngs = [], []
+        for lat, lng in rows.iterator():
+            lats.append(lat)
+            lngs.append(lng)
+        if not lats:
+            continue
+        south, north = _trimmed_range(lats, trim_percent)
+        west, east = _trimmed_range(lngs, trim_percent)
+        bboxes[company] = (
+            max(-180.0, west - margin_degrees),
+            max(-MAX_MERCATOR_LATITUDE, south - margin_degrees),
+            min(180.0, east + margin_degrees),
+            min(MAX_MERCATOR_LATITUDE, north + margin_degrees),
+        )
+    return bboxes
+
+
+def _trimmed_range(values, trim_percent):
+    values = sorted(values)
+    cut = int(len(values) * trim_percent / 100)
+    if cut * 2 >= len(values):
+        cut = 0
+    return values[cut], values[len(values) - 1 - cut]
+
+
+def _tile_xy(lat, lng, zoom):
+    n = 1 << zoom
+    lat = max(-MAX_MERCATOR_LATITUDE, min(MAX_MERCATOR_LATITUDE, lat))
+    x = int((lng + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tiles_for_bbox(bbox, min_zoom, max_zoom):
+    """(z, x, y) of every tile covering bbox for each zoom in min_zoom..max_zoom"""
+    west, south, east, north = bbox
+    for zoom in range(min_zoom, max_zoom + 1):
+        min_x, min_y = _tile_xy(north, west, zoom)
+        max_x, max_y = _tile_xy(south, east, zoom)
+        for x in range(min_x, max_x + 1):
+            for y in range(min_y, max_y + 1):
+                yield zoom, x, y
+
+
+class RateLimiter:
+    """Spaces calls at least 1/rate seconds apart across threads"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+def warm_tile(z, x, y, referer, limiter=None):
+    """
+    Make sure z/x/y is fresh in the tile cache. Returns 'fresh' (nothing fetched),
+    'stored', 'revalidated' or 'failed'.
+    """
+    result = tile_upstream.fetch_through_cache(
+        z, x, y, referer, before_fetch=limiter.wait if limiter else None, record_stats=False,
+    )
+    if result.outcome in ('fresh', 'coalesced'):
+        return 'fresh'
+    if result.outcome == 'not_found':
+        logger.warning('Tile %s/%s/%s pre-warm got HTTP 404', z, x, y)
+        return 'failed'
+    return result.outcome
+
+
+def warm_tiles(tiles, referer, concurrency=2, rate=2.0):
+    """Warm tiles with at most concurrency fetches in flight and rate upstream requests per second"""
+    if not (referer or '').strip():
+        raise ValueError('A Referer is required for OSM tile requests (set OSM_TILE_REFERER)')
+    limiter = RateLimiter(rate)
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        results = pool.map(lambda tile: warm_tile(*tile, referer, limiter=limiter), tiles)
+        outcomes = {}
+        for outcome in results:
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    return outcomes
@@ -0,0 +1,179 @@
+"""
+Upstream side of the OSM tile proxy: one pooled keep-alive session per process, a
+single-flight lock so concurrent misses for the same tile wait on one fetch, and
+fetch_through_cache(), the miss/revalidate path shared by osm_tile_proxy and the
+prewarm_tiles command.
+
+The lock is a per-tile in-process lock plus, where fcntl is available, an flock on a
+lock file of that tile, which also coalesces fetches across the uWSGI worker processes
+without making unrelated tiles wait on each other. The holder removes the file before
+releasing it; a waiter that then finds its file gone locks the new one. Whoever gets the
+lock second re-reads the disk cache before fetching.
+"""
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from . import tile_cache
+
+try:
+    import fcntl
+except ImportError:  # Windows: in-process coalescing only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# outcome: 'fresh', 'coalesced', 'revalidated', 'stored', 'not_found' or 'failed'; tile is
+# the CachedTile to serve (a stale one when upstream failed), or None
+TileFetch = namedtuple('TileFetch', ['outcome', 'tile', 'status'])
+
+_session = None
+_session_lock = threading.Lock()
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def get_session():
+    """Process-wide requests.Session with a bounded keep-alive pool to the tile upstream"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=2,
+                    pool_maxsize=settings.OSM_TILE_UPSTREAM_POOL_SIZE,
+                    pool_block=True,
+                )
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                session.headers['User-Agent'] = settings.OSM_TILE_USER_AGENT
+                _session = session
+    return _session
+
+
+def fetch_tile(z, x, y, referer, etag=''):
+    """GET one tile from OSM_TILE_UPSTREAM, conditional on etag when given; raises RequestException"""
+    headers = {
+        'Accept': 'image/png,image/webp,*/*;q=0.8',
+        'Referer': referer if referer.endswith('/') else referer + '/',
+    }
+    if etag:
+        headers['If-None-Match'] = etag
+    return get_session().get(
+        f'{settings.OSM_TILE_UPSTREAM}/{z}/{x}/{y}.png',
+        headers=headers,
+        timeout=settings.OSM_TILE_UPSTREAM_TIMEOUT,
+    )
+
+
+@contextmanager
+def _tile_file_lock(z, x, y):
+    if fcntl is None:
+        yield
+        return
+    lock_dir = os.path.join(settings.TILE_CACHE_ROOT, '.locks')
+    os.makedirs(lock_dir, exist_ok=True)
+    path = os.path.join(lock_dir, f'{z}-{x}-{y}.lock')
+    while True:
+        fh = open(path, 'a')
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            current = os.stat(path).st_ino == os.fstat(fh.fileno()).st_ino
+        except FileNotFoundError:
+            current = False
+        if current:
+            break
+        # The previous holder removed this file after we opened it
+        fh.close()
+    try:
+        yield
+    finally:
+        # Removed while still locked, so waiters on this file move to a fresh one
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        fh.close()
+
+
+@contextmanager
+def single_flight(z, x, y):
+    """Hold while fetching z/x/y; concurrent callers for the same tile wait here"""
+    key = (z, x, y)
+    with _flights_lock:
+        flight = _flights.setdefault(key, [threading.Lock(), 0])
+        flight[1] += 1
+    try:
+        with flight[0], _tile_file_lock(z, x, y):
+            yield
+    finally:
+        with _flights_lock:
+            flight[1] -= 1
+            if not flight[1]:
+                del _flights[key]
+
+
+def fetch_through_cache(z, x, y, referer, before_fetch=None, record_stats=True):
+    """
+    TileFetch for z/x/y from the tile cache, going upstream only when the tile is missing
+    or stale (revalidated with its ETag) under the single-flight lock. before_fetch runs
+    right before the upstream request; record_stats=False keeps the hit/miss counters to
+    live map traffic.
+    """
+    record = tile_cache.record if record_stats else (lambda event: None)
+    cached = tile_cache.get_tile(z, x, y)
+    if cached and not cached.stale:
+        record('hits')
+        return TileFetch('fresh', cached, None)
+
+    with single_flight(z, x, y):
+        # Another request may have fetched the tile while this one waited
+        cached = tile_cache.get_tile(z, x, y)
+        if cached and not cached.stale:
+            record('coalesced')
+            return TileFetch('coalesced', cached, None)
+        record('stale' if cached else 'misses')
+
+        if before_fetch:
+            before_fetch()
+        try:
+            response = fetch_tile(z, x, y, referer, etag=cached.etag if cached else '')
+        except requests.RequestException as exc:
+            logger.warning('Tile %s/%s/%s fetch failed: %s', z, x, y, exc)
+            record('upstream_errors')
+            # A stale tile beats a broken map
+            return TileFetch('failed', cached, None)
+
+        if cached and response.status_code == 304:
+            tile_cache.mark_fresh(z, x, y, response.headers.get('ETag', ''))
+            record('revalidated')
+            return TileFetch('revalidated', cached, 304)
+        if response.status_code == 404:
+            return TileFetch('not_found', None, 404)
+        if response.status_code != 200:
+            logger.warning('Tile %s/%s/%s upstream HTTP %s', z, x, y, response.status_code)
+            record('upstream_errors')
+            return TileFetch('failed', cached, response.status_code)
+
+        tile = tile_cache.CachedTile(
+            data=response.content,
+            content_type=response.headers.get('Content-Type', 'image/png'),
+            etag=response.headers.get('ETag', ''),
+            fetched_at=time.time(),
+            stale=False,
+        )
+        try:
+            tile_cache.store_tile(z, x, y, tile.data, tile.content_type, tile.etag, record_stats=record_stats)
+        except OSError:
+            logger.exception('Could not cache tile %s/%s/%s', z, x, y)
+            return TileFetch('failed', tile, 200)
+    return TileFetch('stored', tile, 200)
@@ -1,4 +1,4 @@
-from django.urls import path
+from django.urls import path, re_path
 from . import views
 
 app_name = 'dashboard'
@@ -6,10 +6,15 @@ app_name = 'dashboard'
 urlpatterns = [
     path('', views.index_view, name='index'),
     path('admin/', views.admin_dashboard_view, name='admin'),
+    path('admin/map-points/', views.admin_map_points_api, name='admin_map_points'),
     path('export/', views.export_admin_dashboard, name='export_admin_dashboard'),
+    path('export/jobs/<uuid:job_id>/', views.export_job_status, name='export_job_status'),
+    path('export/jobs/<uuid:job_id>/download/', views.export_job_download, name='export_job_download'),
+    re_path(r'^export/cache/(?P<cache_key>[0-9a-f]{40})/$', views.export_cached_download, name='export_cached_download'),
     path(
         'tiles/<int:z>/<int:x>/<int:y>.png',
         views.osm_tile_proxy,
         name='osm_tile',
     ),
+    path('tiles/stats/', views.osm_tile_cache_stats, name='osm_tile_cache_stats'),
 ] 
\ No newline at end of file
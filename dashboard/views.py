@@ -1,24 +1,34 @@
-from django.shortcuts import render, redirect
+import logging
+import os
+
+from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
-from django.db.models import Count, Q, Avg
+from django.db.models import Count, Exists, OuterRef, Q, Avg, Sum
 from django.utils import timezone
-from django.http import JsonResponse, HttpResponse, HttpResponseBadRequest
+from django.http import (
+    JsonResponse, HttpResponse, HttpResponseBadRequest, HttpResponseNotAllowed, HttpResponseNotModified,
+    FileResponse, Http404, StreamingHttpResponse,
+)
 from datetime import date, datetime, timedelta
-from activities.models import DailyActivity
+from activities.models import DailyActivity, DailyAttendanceRollup
 from employees.models import Employee, Company
 from django.contrib.auth import get_user_model
-from django.views.decorators.http import require_GET
-import requests
+from django.views.decorators.http import require_GET, require_http_methods
 from django.conf import settings as django_settings
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Border, Side, Alignment
-from openpyxl.utils import get_column_letter
 from django.urls import reverse
+from django.utils.http import parse_etags, quote_etag
 # import datetime
-import pytz
+from .cache import cached_dashboard_data
+from .export_cache import cached_export, etag_matches, export_cache_key, tee_into_cache
+from .export_jobs import create_export_job
+from .exports import EXPORT_CONTENT_TYPE, STREAM_FORMATS, export_filename, export_queryset, export_rows
+from . import tile_cache, tile_upstream
+from .map_points import cluster_points, in_bbox, parse_bbox, points_bounds
+from .models import ExportJob
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
 
 
 def is_admin_or_hr(user):
@@ -26,6 +36,37 @@ def is_admin_or_hr(user):
     return user.is_staff or user.is_superuser
 
 
+# attendance_stats key -> DailyAttendanceRollup field
+ROLLUP_STAT_FIELDS = {
+    'total_activities': 'total_activities',
+    'completed': 'status_completed',
+    'on_time': 'attendance_on_time',
+    'late': 'attendance_late',
+    'absent': 'attendance_absent',
+}
+
+
+def _attendance_stats(activities_qs, start_date, end_date, company_filter='', employee_filter=''):
+    """
+    Attendance counts for a date range. Reads the per-company daily rollup, so the cost
+    is O(days x companies); a single-employee filter is answered from its own rows.
+    """
+    if employee_filter:
+        return activities_qs.aggregate(
+            total_activities=Count('id'),
+            completed=Count('id', filter=Q(status='completed')),
+            on_time=Count('id', filter=Q(attendance_status='on_time')),
+            late=Count('id', filter=Q(attendance_status='late')),
+            absent=Count('id', filter=Q(attendance_status='absent')),
+        )
+
+    rollups = DailyAttendanceRollup.objects.filter(date__gte=start_date, date__lte=end_date)
+    if company_filter:
+        rollups = rollups.filter(company_id=company_filter)
+    totals = rollups.aggregate(**{key: Sum(field) for key, field in ROLLUP_STAT_FIELDS.items()})
+    return {key: value or 0 for key, value in totals.items()}
+
+
 @login_required
 def index_view(request):
     """Main dashboard view - works with or without employee profile"""
@@ -76,26 +117,24 @@ def index_view(request):
         return render(request, 'dashboard/simple_dashboard.html', context)
 
 
-@login_required
-@user_passes_test(is_admin_or_hr)
-def admin_dashboard_view(request):
-    """Admin dashboard with analytics"""
-    
-    today = date.today()
-    start_of_week = today - timedelta(days=today.weekday())
-    end_of_week = start_of_week + timedelta(days=6)
-    
-    # Get filter parameters
-    company_filter = request.GET.get('company', '')
-    employee_filter = request.GET.get('employee', '')
-    raw_date_range = request.GET.get('date_range', '')
+def _parse_date(s):
+    try:
+        return datetime.strptime(s.strip(), '%Y-%m-%d').date()
+    except (ValueError, AttributeError):
+        return None
 
-    # Validate date range — reject anything that is not YYYY-MM-DD_YYYY-MM-DD
-    def _parse_date(s):
-        try:
-            return datetime.strptime(s.strip(), '%Y-%m-%d').date()
-        except (ValueError, AttributeError):
-            return None
+
+def _dashboard_filters(params):
+    """
+    Read the admin dashboard filters (company, employee, date_range) from request.GET or request.POST.
+    The date range falls back to the current ISO week when missing or not YYYY-MM-DD_YYYY-MM-DD.
+    """
+    # Ids are normalised so equivalent filters share cache entries; non-numeric ids are ignored
+    company_filter = params.get('company', '').strip()
+    employee_filter = params.get('employee', '').strip()
+    company_filter = company_filter if company_filter.isdigit() else ''
+    employee_filter = employee_filter if employee_filter.isdigit() else ''
+    raw_date_range = params.get('date_range', '')
 
     start_date_range = None
     end_date_range = None
@@ -109,79 +148,84 @@ def admin_dashboard_view(request):
 
     # Fall back to current ISO week if invalid / missing
     if not start_date_range or not end_date_range:
-        start_date_range = start_of_week
-        end_date_range = end_of_week
+        today = date.today()
+        start_date_range = today - timedelta(days=today.weekday())
+        end_date_range = start_date_range + timedelta(days=6)
 
-    date_filter = f'{start_date_range}_{end_date_range}'
+    return company_filter, employee_filter, start_date_range, end_date_range
+
+
+def _filtered_activities(company_filter, employee_filter, start_date_range, end_date_range):
+    """DailyActivity queryset for the admin dashboard filters"""
+    activities_qs = DailyActivity.objects.filter(date__gte=start_date_range, date__lte=end_date_range)
+    if company_filter:
+        activities_qs = activities_qs.filter(user__employee_profile__company_id=company_filter)
+    if employee_filter:
+        activities_qs = activities_qs.filter(user__employee_profile__id=employee_filter)
+    return activities_qs
 
-    # Base queryset
-    activities_qs = DailyActivity.objects.all()
+
+def _admin_dashboard_data(company_filter, employee_filter, start_date_range, end_date_range, today):
+    """
+    Computed admin dashboard context for one set of filters. Querysets are evaluated
+    into lists so the result can be cached.
+    """
+    # Base querysets (date filter always has valid dates at this point)
+    activities_qs = _filtered_activities(company_filter, employee_filter, start_date_range, end_date_range)
     employees_qs = Employee.objects.filter(employment_status='active')
 
     # Apply company filter
     if company_filter:
-        activities_qs = activities_qs.filter(user__employee_profile__company_id=company_filter)
         employees_qs = employees_qs.filter(company_id=company_filter)
 
     # Apply employee filter
     if employee_filter:
-        activities_qs = activities_qs.filter(user__employee_profile__id=employee_filter)
         employees_qs = employees_qs.filter(id=employee_filter)
-
-    # Apply date filter (always has valid dates at this point)
-    activities_qs = activities_qs.filter(date__gte=start_date_range, date__lte=end_date_range)
     
-    # Calculate statistics — only employees with active employment status
-    total_employees = employees_qs.count()
-    total_active_users = total_employees
+    # Today's activities for the same company/employee filters
+    today_activities = _filtered_activities(company_filter, employee_filter, today, today)
 
-    today_activities_filters = Q(date=today)
-    if company_filter:
-        today_activities_filters &= Q(user__employee_profile__company_id=company_filter)
-    if employee_filter:
-        today_activities_filters &= Q(user__employee_profile__id=employee_filter)
-
-    # Today's attendance — denominators scoped to employment_status=active employees only
-    today_activities = DailyActivity.objects.filter(today_activities_filters)
-    active_employee_user_ids = set(employees_qs.values_list('user_id', flat=True))
-    checked_in_user_ids = set(
-        today_activities.filter(
-            checkin_time__isnull=False,
-            user_id__in=active_employee_user_ids,
-        ).values_list('user_id', flat=True)
+    # Today's attendance — denominators scoped to employment_status=active employees only.
+    # One conditional aggregation over the employees; check-in/out are correlated EXISTS.
+    checked_in_today = DailyActivity.objects.filter(date=today, checkin_time__isnull=False)
+    checked_out_today = DailyActivity.objects.filter(date=today, checkout_time__isnull=False)
+    employee_counts = employees_qs.aggregate(
+        total=Count('id'),
+        checked_in=Count('id', filter=Exists(checked_in_today.filter(user_id=OuterRef('user_id')))),
+        checked_out=Count('id', filter=Exists(checked_out_today.filter(user_id=OuterRef('user_id')))),
     )
-    checked_in_today_count = len(checked_in_user_ids)
+    total_employees = employee_counts['total']
+    total_active_users = total_employees
+    today_attendance = _attendance_stats(today_activities, today, today, company_filter, employee_filter)
 
     today_stats = {
         'total_expected': total_active_users,
-        'checked_in': checked_in_today_count,
-        'checked_out': today_activities.filter(
-            checkout_time__isnull=False,
-            user_id__in=active_employee_user_ids,
-        ).values('user_id').distinct().count(),
-        'on_time': today_activities.filter(attendance_status='on_time').count(),
-        'late': today_activities.filter(attendance_status='late').count(),
-        'absent': total_active_users - checked_in_today_count,
+        'checked_in': employee_counts['checked_in'],
+        'checked_out': employee_counts['checked_out'],
+        'on_time': today_attendance['on_time'],
+        'late': today_attendance['late'],
+        'absent': total_active_users - employee_counts['checked_in'],
     }
     
     # Attendance trends
-    attendance_stats = activities_qs.aggregate(
-        total_activities=Count('id'),
-        completed=Count('id', filter=Q(status='completed')),
-        on_time=Count('id', filter=Q(attendance_status='on_time')),
-        late=Count('id', filter=Q(attendance_status='late')),
-        absent=Count('id', filter=Q(attendance_status='absent')),
+    attendance_stats = _attendance_stats(
+        activities_qs, start_date_range, end_date_range, company_filter, employee_filter,
     )
     
     # Recent activities
-    recent_activities = activities_qs.order_by('-date', '-checkin_time')[:20]
+    recent_activities = (
+        activities_qs.select_related('user__employee_profile')
+        .order_by('-date', '-checkin_time')[:20]
+    )
     
     # Late arrivals today
-    late_today = today_activities.filter(attendance_status='late').select_related('user')
+    late_today = today_activities.filter(attendance_status='late').select_related('user__employee_profile')
     
-    absent_user_ids = active_employee_user_ids - checked_in_user_ids
+    # Active employees with no check-in today (anti-join, no id list round trip)
     absent_today = (
-        User.objects.filter(id__in=absent_user_ids, is_active=True)
+        User.objects.filter(is_active=True)
+        .filter(Exists(employees_qs.filter(user_id=OuterRef('pk'))))
+        .exclude(Exists(checked_in_today.filter(user_id=OuterRef('pk'))))
         .select_related('employee_profile', 'employee_profile__company')
         .order_by('first_name', 'last_name', 'email')
     )
@@ -189,263 +233,284 @@ def admin_dashboard_view(request):
     # Companies for filter
     companies = Company.objects.filter(is_active=True)
 
-    activities_data = []
-    for activity in activities_qs:
-        try:
-            checkin_lat_str, checkin_lng_str = activity.checkin_location.split(",")
-        except:
-            checkin_lat_str, checkin_lng_str = None, None
-        try:
-            checkout_lat_str, checkout_lng_str = activity.checkout_location.split(",")
-        except:
-            checkout_lat_str, checkout_lng_str = None, None
-
-        activities_data.append({
-            "id":activity.id,
-            "employee": activity.user.get_full_name() or activity.user.username,
-            "lat": float(checkin_lat_str.strip()) if checkin_lat_str else None,
-            "lng": float(checkin_lng_str.strip()) if checkin_lng_str else None,
-            "checkout_lng": float(checkout_lng_str.strip()) if checkout_lng_str else None,
-            "checkout_lat": float(checkout_lat_str.strip()) if checkout_lat_str else None,
-            "time": timezone.localtime(activity.checkin_time).strftime("%Y-%m-%d %H:%M"),
-            "checkout_time": timezone.localtime(activity.checkout_time).strftime("%Y-%m-%d %H:%M"),
-            "status": activity.status,
-            "attendance_status": activity.attendance_status,
-            "detail_url": f"/employees/activities/{activity.id}/"
-        })
-    
-    # Prepare context
-    context = {
-        'activities' :activities_data,
+    return {
         'today_stats': today_stats,
         'attendance_stats': attendance_stats,
-        'recent_activities': recent_activities,
-        'late_today': late_today,
-        'absent_today': absent_today,
-        'companies': companies,
-        'employees': employees_qs,  # For employee filter dropdown
-        'selected_company': company_filter,
-        'selected_employee': employee_filter,  # To keep selected employee in filter
-        'selected_date_range': date_filter, # To keep selected date range in filter
+        'recent_activities': list(recent_activities),
+        'late_today': list(late_today),
+        'absent_today': list(absent_today),
+        'companies': list(companies),
+        'employees': list(employees_qs.select_related('user')),  # For employee filter dropdown
         'total_employees': total_employees,
         'total_active_users': total_active_users,
     }
-    
-    return render(request, 'dashboard/admin_dashboard.html', context)
 
 
 @login_required
 @user_passes_test(is_admin_or_hr)
-def export_admin_dashboard(request):
-    """Export filtered activity details to Excel"""
+def admin_dashboard_view(request):
+    """Admin dashboard with analytics"""
     
     today = date.today()
-    start_of_week = today - timedelta(days=today.weekday())
-    end_of_week = start_of_week + timedelta(days=6)
     
     # Get filter parameters
-    company_filter = request.GET.get('company', '')
-    employee_filter = request.GET.get('employee', '')
-    date_filter = request.GET.get('date_range', f'{start_of_week}_{end_of_week}')
+    company_filter, employee_filter, start_date_range, end_date_range = _dashboard_filters(request.GET)
+    date_filter = f'{start_date_range}_{end_date_range}'
 
-    start_date_range = date_filter.split('_')[0] if date_filter else ""
-    end_date_range = date_filter.split('_')[1] if date_filter else ""
-    
-    # Timezone for GMT+7
-    tz = pytz.timezone('Asia/Jakarta')  # GMT+7
-    
-    # Base queryset
-    activities_qs = DailyActivity.objects.all()
-    
-    # Apply company filter
-    if company_filter:
-        activities_qs = activities_qs.filter(user__employee_profile__company_id=company_filter)
-    
-    # Apply employee filter
-    if employee_filter:
-        activities_qs = activities_qs.filter(user__employee_profile__id=employee_filter)
-    
-    # Apply date filter    
-    if date_filter:
-        activities_qs = activities_qs.filter(date__gte=start_date_range, date__lte=end_date_range)
-    
-    # Prefetch related data for efficiency
-    activities_qs = activities_qs.prefetch_related(
-        'planned_activities',
-        'daily_goals',
-        'additional_activities',
-        'user__employee_profile'
-    ).order_by('-date', '-checkin_time')
-    
-    # Create workbook
-    wb = Workbook()
-    
-    # Remove default sheet and create Activity Details sheet
-    wb.remove(wb.active)
-    ws_activities = wb.create_sheet("Activity Details")
-    
-    # Define headers
-    headers = [
-        "Employee", "Position", "Company", "Date",
-        "Check In (GMT+7)", "Check Out (GMT+7)", 
-        "Status", "Attendance Status", "Work Duration",
-        "Morning Problems", "Afternoon Problems", "Notes",
-        "Planned Activities", "Activity Status", "Activity Priority", "Activity Reasons",
-        "Daily Goals", "Goal Status", "Goal Priority", "Target", "Achieved", "Completion %", "Goal Reasons",
-        "Additional Activities", "Add. Category", "Add. Status", "Add. Duration", "Add. Impact"
-    ]
-    ws_activities.append(headers)
-    
-    # Iterate through each activity and write to sheet
-    for activity in activities_qs:
-        # Handle check-in time
-        checkin_str = ""
-        if activity.checkin_time:
-            if isinstance(activity.checkin_time, datetime):
-                localized_in = activity.checkin_time.astimezone(tz)
-                checkin_str = localized_in.strftime('%Y-%m-%d %H:%M:%S')
-            else:
-                naive_in = datetime.combine(activity.date, activity.checkin_time)
-                localized_in = tz.localize(naive_in)
-                checkin_str = localized_in.strftime('%Y-%m-%d %H:%M:%S')
-        else:
-            checkin_str = "N/A"
-        
-        # Handle check-out time
-        checkout_str = ""
-        if activity.checkout_time:
-            if isinstance(activity.checkout_time, datetime):
-                localized_out = activity.checkout_time.astimezone(tz)
-                checkout_str = localized_out.strftime('%Y-%m-%d %H:%M:%S')
-            else:
-                naive_out = datetime.combine(activity.date, activity.checkout_time)
-                localized_out = tz.localize(naive_out)
-                checkout_str = localized_out.strftime('%Y-%m-%d %H:%M:%S')
-        else:
-            checkout_str = "N/A"
-        
-        # Calculate work duration
-        work_duration = "N/A"
-        if activity.work_duration:
-            total_seconds = activity.work_duration.total_seconds()
-            hours = int(total_seconds // 3600)
-            minutes = int((total_seconds % 3600) // 60)
-            work_duration = f"{hours}h {minutes}m"
-        
-        # Get employee profile
-        employee = activity.user.employee_profile
-        
-        # Prepare lists for related activities
-        planned_activities = list(activity.planned_activities.all())
-        daily_goals = list(activity.daily_goals.all())
-        additional_activities = list(activity.additional_activities.all())
-        
-        # Determine max rows needed for this activity
-        max_rows = max(1, len(planned_activities), len(daily_goals), len(additional_activities))
-        
-        for i in range(max_rows):
-            pa = planned_activities[i] if i < len(planned_activities) else None
-            dg = daily_goals[i] if i < len(daily_goals) else None
-            aa = additional_activities[i] if i < len(additional_activities) else None
-            
-            # Only include main activity details in first row
-            if i == 0:
-                row = [
-                    activity.user.get_full_name() or activity.user.username,
-                    employee.position if employee else "N/A",
-                    employee.company.name if (employee and employee.company) else "N/A",
-                    activity.date.strftime("%Y-%m-%d"),
-                    checkin_str,
-                    checkout_str,
-                    activity.get_status_display(),
-                    activity.get_attendance_status_display(),
-                    work_duration,
-                    activity.morning_problems or "",
-                    activity.afternoon_problems or "",
-                    activity.notes or ""
-                ]
-            else:
-                # For additional rows, leave main activity details empty
-                row = ["", "", "", "", "", "", "", "", "", "", "", ""]
-            
-            # Add planned activity details
-            row.extend([
-                pa.title if pa else "",
-                pa.get_status_display() if pa else "",
-                pa.get_priority_display() if pa else "",
-                pa.reasons if pa else ""
-            ])
-            
-            # Add daily goal details
-            row.extend([
-                dg.title if dg else "",
-                dg.get_status_display() if dg else "",
-                dg.get_priority_display() if dg else "",
-                dg.target_value if dg else "",
-                dg.achieved_value if dg else "",
-                f"{dg.completion_percentage}%" if dg and dg.completion_percentage is not None else "",
-                dg.reasons if dg else ""
-            ])
-            
-            # Add additional activity details
-            row.extend([
-                aa.title if aa else "",
-                aa.get_category_display() if aa else "",
-                aa.get_status_display() if aa else "",
-                str(aa.duration) if aa and aa.duration else "",
-                aa.impact_on_planned_work if aa else ""
-            ])
-            
-            ws_activities.append(row)
-    
-    # Apply styling to the sheet
-    header_fill = PatternFill(start_color="2D6099", end_color="2D6099", fill_type="solid")
-    header_font = Font(bold=True, color="FFFFFF")
-    thin_border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
+    # Computed stats are shared by every admin viewing the same filters
+    data = cached_dashboard_data(
+        'admin',
+        (company_filter, employee_filter, start_date_range, end_date_range, today),
+        lambda: _admin_dashboard_data(company_filter, employee_filter, start_date_range, end_date_range, today),
     )
+
+    # Prepare context
+    context = {
+        **data,
+        'selected_company': company_filter,
+        'selected_employee': employee_filter,  # To keep selected employee in filter
+        'selected_date_range': date_filter, # To keep selected date range in filter
+    }
     
-    # Apply header styling to the first row
-    for cell in ws_activities[1]:
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = Alignment(horizontal='center')
-    
-    # Apply borders to all cells
-    for row in ws_activities.iter_rows(min_row=1, max_row=ws_activities.max_row, min_col=1, max_col=len(headers)):
-        for cell in row:
-            cell.border = thin_border
-    
-    # Auto adjust column widths
-    for col in ws_activities.columns:
-        max_length = 0
-        column_letter = get_column_letter(col[0].column)
-        
-        for cell in col:
-            try:
-                value = str(cell.value) if cell.value else ""
-                if len(value) > max_length:
-                    max_length = len(value)
-            except:
-                pass
-        
-        adjusted_width = (max_length + 2) * 1.2
-        ws_activities.column_dimensions[column_letter].width = adjusted_width
-    
-    # Create response
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    return render(request, 'dashboard/admin_dashboard.html', context)
+
+
+def _format_local(value):
+    return timezone.localtime(value).strftime("%Y-%m-%d %H:%M") if value else None
+
+
+def _map_points_payload(company_filter, employee_filter, start_date_range, end_date_range, bbox, zoom):
+    """Clustered map points for the dashboard filters inside bbox (None = everywhere)"""
+    activities_qs = _filtered_activities(company_filter, employee_filter, start_date_range, end_date_range)
+    if bbox is not None:
+        # Indexed range scans on the numeric coordinate columns
+        activities_qs = (
+            activities_qs.within_bbox(*bbox, kind='checkin')
+            | activities_qs.within_bbox(*bbox, kind='checkout')
+        )
+    # Newest activities first, capped so a long range over everywhere stays one bounded query;
+    # the extra row only tells whether the cap was hit
+    limit = django_settings.MAP_POINTS_MAX_ACTIVITIES
+    rows = list(activities_qs.order_by('-date', '-id').values_list(
+        'id', 'checkin_latitude', 'checkin_longitude', 'checkout_latitude', 'checkout_longitude',
+        'checkin_time', 'checkout_time', 'status', 'attendance_status',
+        'user__first_name', 'user__last_name', 'user__username',
+    )[:limit + 1])
+    truncated = len(rows) > limit
+    rows = rows[:limit]
+
+    points = []
+    for (activity_id, checkin_lat, checkin_lng, checkout_lat, checkout_lng, checkin_time, checkout_time,
+         status, attendance_status, first_name, last_name, username) in rows:
+        employee = f'{first_name} {last_name}'.strip() or username
+        for kind, lat, lng, at in (
+            ('checkin', checkin_lat, checkin_lng, checkin_time),
+            ('checkout', checkout_lat, checkout_lng, checkout_time),
+        ):
+            if lat is None or lng is None or not in_bbox(lat, lng, bbox):
+                continue
+            points.append({
+                'id': activity_id,
+                'kind': kind,
+                'employee': employee,
+                'lat': lat,
+                'lng': lng,
+                'time': _format_local(at),
+                'status': status,
+                'attendance_status': attendance_status,
+                'detail_url': f"/employees/activities/{activity_id}/",
+            })
+
+    clusters, singles = cluster_points(points, zoom)
+    return {
+        'zoom': zoom,
+        'clusters': clusters,
+        'points': singles,
+        'bounds': points_bounds(points) if bbox is None else None,
+        'truncated': truncated,
+    }
+
+
+@login_required
+@user_passes_test(is_admin_or_hr)
+@require_GET
+def admin_map_points_api(request):
+    """
+    Clustered check-in/check-out points for the admin dashboard map.
+
+    Query params: the dashboard filters (company, employee, date_range) plus
+    bbox=west,south,east,north and zoom. Cells with several points come back as
+    clusters with a count; individual points are only sent for lone points or at
+    high zoom. Without bbox the whole range is used and its bounds are returned so
+    the map can fit them before fetching by viewport. At most MAP_POINTS_MAX_ACTIVITIES
+    activities (newest first) are read; truncated tells when more matched.
+    """
+    company_filter, employee_filter, start_date_range, end_date_range = _dashboard_filters(request.GET)
+    raw_bbox = request.GET.get('bbox', '')
+    bbox = parse_bbox(raw_bbox)
+    if raw_bbox and bbox is None:
+        return HttpResponseBadRequest('Invalid bbox')
+    try:
+        zoom = min(max(int(request.GET.get('zoom', 5)), 0), django_settings.OSM_TILE_MAX_ZOOM)
+    except ValueError:
+        return HttpResponseBadRequest('Invalid zoom')
+
+    def compute():
+        return _map_points_payload(company_filter, employee_filter, start_date_range, end_date_range, bbox, zoom)
+
+    # Only the first, unbounded request is the same for everyone opening a given view;
+    # per-viewport payloads are almost never asked for twice, so they skip the cache
+    if bbox is not None:
+        return JsonResponse(compute())
+    payload = cached_dashboard_data(
+        'map', (company_filter, employee_filter, start_date_range, end_date_range, zoom), compute,
     )
-    filename = f"activity_details_export_{datetime.now(tz).strftime('%Y%m%d_%H%M%S')}.xlsx"
-    response['Content-Disposition'] = f'attachment; filename={filename}'
-    
-    wb.save(response)
+    return JsonResponse(payload)
+
+
+@login_required
+@user_passes_test(is_admin_or_hr)
+@require_http_methods(['GET', 'POST'])
+def export_admin_dashboard(request):
+    """
+    Export the filtered activity details.
+
+    format=xlsx (default, POST only) queues an Excel export and returns 202 with the job
+    id and its status URL; the workbook is built by the export worker (run_export_worker).
+    format=csv and format=ndjson.gz are streamed straight from the database as the rows
+    are read, with the same columns as the workbook.
+    """
+    params = request.POST if request.method == 'POST' else request.GET
+    export_format = params.get('format', 'xlsx').strip().lower() or 'xlsx'
+    if export_format != 'xlsx' and export_format not in STREAM_FORMATS:
+        return HttpResponseBadRequest('Invalid format')
+    if export_format == 'xlsx' and request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+
+    company_filter, employee_filter, start_date_range, end_date_range = _dashboard_filters(params)
+    if start_date_range > end_date_range:
+        return HttpResponseBadRequest('Invalid date range')
+    if (end_date_range - start_date_range).days + 1 > django_settings.EXPORT_MAX_RANGE_DAYS:
+        return HttpResponseBadRequest(
+            f'Date range too long (max {django_settings.EXPORT_MAX_RANGE_DAYS} days)'
+        )
+
+    # Identical filters over unchanged data share one cached file (the key is also the ETag)
+    cache_key = export_cache_key(export_format, company_filter, employee_filter, start_date_range, end_date_range)
+    if etag_matches(request, cache_key):
+        return _not_modified(cache_key)
+    cached = cached_export(cache_key)
+
+    if export_format in STREAM_FORMATS:
+        if cached:
+            return _export_file_response(cached[0], cache_key, export_format)
+        chunks, content_type, extension = STREAM_FORMATS[export_format]
+        rows = export_rows(export_queryset(company_filter, employee_filter, start_date_range, end_date_range))
+        response = StreamingHttpResponse(
+            tee_into_cache(chunks(rows), cache_key, extension), content_type=content_type,
+        )
+        response['Content-Disposition'] = f'attachment; filename={export_filename(extension=extension)}'
+        response['ETag'] = quote_etag(cache_key)
+        return response
+
+    if cached:
+        return JsonResponse({
+            'status': 'completed',
+            'download_url': reverse('dashboard:export_cached_download', args=[cache_key]),
+        })
+    job = create_export_job(
+        request.user, company_filter, employee_filter, start_date_range, end_date_range, cache_key=cache_key,
+    )
+    return JsonResponse({
+        'job_id': str(job.id),
+        'status': job.status,
+        'status_url': reverse('dashboard:export_job_status', args=[job.id]),
+    }, status=202)
+
+
+def _own_export_job(request, job_id):
+    """The export job if it belongs to the requesting user (superusers see every job)"""
+    jobs = ExportJob.objects.all()
+    if not request.user.is_superuser:
+        jobs = jobs.filter(requested_by=request.user)
+    return get_object_or_404(jobs, pk=job_id)
+
+
+@login_required
+@user_passes_test(is_admin_or_hr)
+@require_GET
+def export_job_status(request, job_id):
+    """Progress of a queued export; download_url is set once the workbook is ready"""
+    job = _own_export_job(request, job_id)
+    chunks = job.chunks.aggregate(
+        total=Count('id'),
+        done=Count('id', filter=Q(status='completed')),
+    )
+    return JsonResponse({
+        'job_id': str(job.id),
+        'status': job.status,
+        'rows_processed': job.rows_processed,
+        'chunks_total': chunks['total'],
+        'chunks_done': chunks['done'],
+        'error': job.error,
+        'download_url': (
+            reverse('dashboard:export_job_download', args=[job.id]) if job.status == 'completed' else None
+        ),
+    })
+
+
+def _not_modified(cache_key):
+    response = HttpResponseNotModified()
+    response['ETag'] = quote_etag(cache_key)
     return response
 
 
+def _export_file_response(path, cache_key, export_format, filename=None):
+    """Attachment response for an export file on disk, tagged with its content key"""
+    content_type = EXPORT_CONTENT_TYPE if export_format == 'xlsx' else STREAM_FORMATS[export_format][1]
+    response = FileResponse(
+        open(path, 'rb'),
+        as_attachment=True,
+        filename=filename or export_filename(extension=export_format),
+        content_type=content_type,
+    )
+    if cache_key:
+        response['ETag'] = quote_etag(cache_key)
+    return response
+
+
+@login_required
+@user_passes_test(is_admin_or_hr)
+@require_GET
+def export_job_download(request, job_id):
+    """Serve a finished export workbook (or report bundle ZIP) from disk"""
+    job = _own_export_job(request, job_id)
+    if job.status != 'completed' or not os.path.exists(job.file_abspath):
+        raise Http404('Export is not available')
+    if job.kind == 'report_bundle':
+        return FileResponse(
+            open(job.file_abspath, 'rb'), as_attachment=True,
+            filename=os.path.basename(job.file_path), content_type='application/zip',
+        )
+    if job.cache_key and etag_matches(request, job.cache_key):
+        return _not_modified(job.cache_key)
+    return _export_file_response(job.file_abspath, job.cache_key, 'xlsx', filename=os.path.basename(job.file_path))
+
+
+@login_required
+@user_passes_test(is_admin_or_hr)
+@require_GET
+def export_cached_download(request, cache_key):
+    """Serve a cached export file by its content key"""
+    if etag_matches(request, cache_key):
+        return _not_modified(cache_key)
+    cached = cached_export(cache_key)
+    if cached is None:
+        raise Http404('Export is not available')
+    path, extension = cached
+    return _export_file_response(path, cache_key, extension)
+
+
 def _osm_tile_coords_valid(z, x, y):
     if not (isinstance(z, int) and isinstance(x, int) and isinstance(y, int)):
         return False
@@ -462,30 +527,40 @@ def osm_tile_proxy(request, z, x, y):
     """
     Proxy OSM raster tiles with a compliant User-Agent and Referer (server-side),
     and Cache-Control so browsers cache tiles for at least 7 days per OSM policy.
+    Tiles are kept in the shared on-disk tile cache (dashboard.tile_cache), so
+    upstream is only asked for tiles that are missing or stale: concurrent misses
+    for one tile share a single fetch over a pooled session, and stale tiles are
+    revalidated with If-None-Match. Clients sending a matching If-None-Match get 304.
     """
     if not _osm_tile_coords_valid(z, x, y):
         return HttpResponseBadRequest('Invalid tile coordinates')
 
-    upstream = f'{django_settings.OSM_TILE_UPSTREAM}/{z}/{x}/{y}.png'
     referer = (django_settings.OSM_TILE_REFERER or '').strip().rstrip('/') or request.build_absolute_uri('/')
-    headers = {
-        'User-Agent': django_settings.OSM_TILE_USER_AGENT,
-        'Accept': 'image/png,image/webp,*/*;q=0.8',
-        'Referer': referer if referer.endswith('/') else referer + '/',
-    }
-    try:
-        upstream_resp = requests.get(upstream, headers=headers, timeout=django_settings.OSM_TILE_UPSTREAM_TIMEOUT)
-    except requests.RequestException:
+    result = tile_upstream.fetch_through_cache(z, x, y, referer)
+    if result.tile:
+        return _tile_response(request, result.tile.data, result.tile.content_type, result.tile.etag)
+    if result.outcome == 'not_found':
+        return HttpResponse(status=404)
+    if result.status is None:
         return HttpResponse('Upstream tile fetch failed', status=502)
+    return HttpResponse(status=502)
 
-    if upstream_resp.status_code == 404:
-        return HttpResponse(status=404)
-    if upstream_resp.status_code != 200:
-        return HttpResponse(status=502)
 
-    content_type = upstream_resp.headers.get('Content-Type', 'image/png')
-    out = HttpResponse(upstream_resp.content, content_type=content_type)
+def _tile_response(request, data, content_type, etag):
+    client_etags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    if etag and (etag in client_etags or '*' in client_etags):
+        out = HttpResponseNotModified()
+    else:
+        out = HttpResponse(data, content_type=content_type)
     out['Cache-Control'] = f'public, max-age={django_settings.OSM_TILE_CLIENT_CACHE_SECONDS}'
-    if etag := upstream_resp.headers.get('ETag'):
+    if etag:
         out['ETag'] = etag
-    return out
\ No newline at end of file
+    return out
+
+
+@login_required
+@user_passes_test(is_admin_or_hr)
+@require_GET
+def osm_tile_cache_stats(request):
+    """Hit/miss/store/eviction counters of the shared tile cache"""
+    return JsonResponse(tile_cache.tile_cache_stats())
@@ -57,8 +57,8 @@ MIDDLEWARE = [
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'authentication.middleware.JWTAuthenticationMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'authentication.middleware.JWTAuthenticationMiddleware',  # needs request.user
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -110,6 +110,51 @@ else:
     }
 
 
+# Cache
+# File-based by default so the uWSGI worker processes on one host share entries (and the
+# dashboard data version). Set CACHE_BACKEND to e.g. django.core.cache.backends.redis.RedisCache
+# with CACHE_LOCATION for multi-host deployments.
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache')
+CACHE_LOCATION = os.getenv('CACHE_LOCATION', str(BASE_DIR / 'var' / 'cache'))
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': CACHE_LOCATION,
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', '5000')),
+        },
+    }
+}
+
+# How long computed admin dashboard data stays cached (seconds). Entries are also
+# invalidated whenever a DailyActivity, Employee or Company is saved.
+DASHBOARD_CACHE_SECONDS = int(os.getenv('DASHBOARD_CACHE_SECONDS', '300'))
+
+# Admin dashboard Excel exports run in the background (manage.py run_export_worker).
+# Chunk files and finished workbooks live under EXPORT_ROOT; a running job whose worker
+# has not reported progress for EXPORT_JOB_STALE_SECONDS is picked up again from its
+# last completed chunk. Finished jobs and their files are removed after EXPORT_RETENTION_HOURS.
+EXPORT_ROOT = os.getenv('EXPORT_ROOT', str(BASE_DIR / 'var' / 'exports'))
+EXPORT_MAX_RANGE_DAYS = int(os.getenv('EXPORT_MAX_RANGE_DAYS', '366'))
+EXPORT_JOB_STALE_SECONDS = int(os.getenv('EXPORT_JOB_STALE_SECONDS', '300'))
+EXPORT_RETENTION_HOURS = int(os.getenv('EXPORT_RETENTION_HOURS', '24'))
+EXPORT_WORKER_POLL_SECONDS = float(os.getenv('EXPORT_WORKER_POLL_SECONDS', '2'))
+
+# Produced export files are cached under EXPORT_CACHE_ROOT, keyed by filters plus a
+# fingerprint of the exported data; least recently used files go beyond EXPORT_CACHE_MAX_BYTES.
+EXPORT_CACHE_ROOT = os.getenv('EXPORT_CACHE_ROOT', str(BASE_DIR / 'var' / 'export-cache'))
+EXPORT_CACHE_MAX_BYTES = int(os.getenv('EXPORT_CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
+
+# Multi-employee report ZIPs (export worker for the admin action / manage.py generate_report_bundle) render the
+# workbooks in a process pool: REPORT_BUNDLE_WORKERS processes (0 = one per CPU), each
+# taking REPORT_BUNDLE_BATCH_SIZE employees at a time. REPORT_BUNDLE_START_METHOD picks
+# the multiprocessing start method (fork/spawn/forkserver; empty = platform default).
+REPORT_BUNDLE_WORKERS = int(os.getenv('REPORT_BUNDLE_WORKERS', '0'))
+REPORT_BUNDLE_BATCH_SIZE = int(os.getenv('REPORT_BUNDLE_BATCH_SIZE', '10'))
+REPORT_BUNDLE_START_METHOD = os.getenv('REPORT_BUNDLE_START_METHOD', '').strip()
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -181,6 +226,31 @@ JWT_ISSUER = os.getenv('JWT_ISSUER', 'sso.arnatech.id')
 # Load public key for JWT verification
 SSO_PUBLIC_KEY = load_sso_public_key()
 
+# Shared SSO HTTP client (authentication.sso_client): keep-alive pool per worker process,
+# connect/read timeouts, and retries (connection failures; idempotent methods also on 502/503/504)
+SSO_HTTP_POOL_SIZE = int(os.getenv('SSO_HTTP_POOL_SIZE', '10'))
+SSO_HTTP_CONNECT_TIMEOUT = float(os.getenv('SSO_HTTP_CONNECT_TIMEOUT', '3.05'))
+SSO_HTTP_READ_TIMEOUT = float(os.getenv('SSO_HTTP_READ_TIMEOUT', '15'))
+SSO_HTTP_RETRIES = int(os.getenv('SSO_HTTP_RETRIES', '2'))
+SSO_HTTP_RETRY_BACKOFF = float(os.getenv('SSO_HTTP_RETRY_BACKOFF', '0.2'))
+# Async views (sso_client.arequest): connections open at once per process, across all requests
+SSO_HTTP_ASYNC_MAX_CONNECTIONS = int(os.getenv('SSO_HTTP_ASYNC_MAX_CONNECTIONS', '200'))
+# Circuit breaker (shared by all worker processes through the database): after this many
+# consecutive SSO failures, SSO calls fail fast for SSO_BREAKER_OPEN_SECONDS, then one
+# probe call decides whether to close it
+SSO_BREAKER_FAILURE_THRESHOLD = int(os.getenv('SSO_BREAKER_FAILURE_THRESHOLD', '5'))
+SSO_BREAKER_OPEN_SECONDS = int(os.getenv('SSO_BREAKER_OPEN_SECONDS', '30'))
+# Verified access tokens remembered per process (skips RSA verification until the token's exp)
+JWT_VERIFIED_CACHE_SIZE = int(os.getenv('JWT_VERIFIED_CACHE_SIZE', '4096'))
+JWT_VERIFIED_CACHE_SECONDS = int(os.getenv('JWT_VERIFIED_CACHE_SECONDS', '300'))
+
+# SSO token refresh: one refresh per refresh token across workers (claim row in the database);
+# parallel requests reuse its encrypted result. The lock must outlast the 10s refresh request.
+SSO_REFRESH_LOCK_SECONDS = int(os.getenv('SSO_REFRESH_LOCK_SECONDS', '15'))
+SSO_REFRESH_RESULT_SECONDS = int(os.getenv('SSO_REFRESH_RESULT_SECONDS', '10'))
+# Refresh signed-in sessions whose access token expires within this many seconds (0 = off)
+SSO_PROACTIVE_REFRESH_SECONDS = int(os.getenv('SSO_PROACTIVE_REFRESH_SECONDS', '0'))
+
 # Public JWT cookies shared across subdomains (names/behavior aligned with Account portal).
 # Production example: PUBLIC_AUTH_COOKIE_DOMAIN=.arnatech.id
 # Empty: host-only (local dev); no Domain= on Set-Cookie.
@@ -194,22 +264,50 @@ SSO_PUBLIC_COOKIE_SAMESITE = os.getenv('SSO_PUBLIC_COOKIE_SAMESITE', 'Lax')
 SSO_PUBLIC_COOKIE_HTTPONLY = os.getenv('SSO_PUBLIC_COOKIE_HTTPONLY', 'False').lower() == 'true'
 
 # Session Configuration
-SESSION_ENGINE = 'django.contrib.sessions.backends.signed_cookies'
+# Server-side sessions in the database: the cookie carries only the session id, while the SSO
+# tokens stay on the server. Expired rows are removed by `manage.py clearsessions`.
+# With SESSION_CACHE_BACKEND (a memory cache shared by all workers, e.g.
+# django.core.cache.backends.redis.RedisCache with SESSION_CACHE_LOCATION) sessions are read
+# through that cache (cached_db). The default file cache is never used for sessions: it culls
+# by globbing its directory on every set, and a per-process cache would serve stale sessions.
+# SESSION_ENGINE=django.contrib.sessions.backends.signed_cookies keeps the whole session in the cookie.
+SESSION_CACHE_BACKEND = os.getenv('SESSION_CACHE_BACKEND', '').strip()
+if SESSION_CACHE_BACKEND:
+    CACHES['sessions'] = {
+        'BACKEND': SESSION_CACHE_BACKEND,
+        'LOCATION': os.getenv('SESSION_CACHE_LOCATION', ''),
+    }
+    SESSION_CACHE_ALIAS = 'sessions'
+SESSION_ENGINE = os.getenv(
+    'SESSION_ENGINE',
+    'django.contrib.sessions.backends.cached_db' if SESSION_CACHE_BACKEND else 'django.contrib.sessions.backends.db',
+)
 SESSION_COOKIE_AGE = 86400  # 24 hours
 SESSION_COOKIE_SECURE = os.getenv('SESSION_COOKIE_SECURE', 'False').lower() == 'true'
 # Optional: match PUBLIC_AUTH_COOKIE_DOMAIN for cross-subdomain Django session cookies
 SESSION_COOKIE_DOMAIN = os.getenv('SESSION_COOKIE_DOMAIN', '').strip() or None
 
+# Activity list keyset pagination (?page_size= is clamped to the max)
+ACTIVITY_LIST_PAGE_SIZE = int(os.getenv('ACTIVITY_LIST_PAGE_SIZE', '20'))
+ACTIVITY_LIST_MAX_PAGE_SIZE = int(os.getenv('ACTIVITY_LIST_MAX_PAGE_SIZE', '100'))
+
 # Account portal — user edits profile (name, photo, etc.) on SSO; Clock-In is read-only.
 ACCOUNT_PORTAL_PROFILE_URL = os.getenv(
     'ACCOUNT_PORTAL_PROFILE_URL',
     'https://account.arnatech.id/en/profile',
 )
 
-# How long to cache SSO profile completeness check in session (seconds).
+# SSO profile completeness check (reminder modal), cached per sso_id in the shared cache.
+# After CACHE_SECONDS the value is refreshed in the background; it is still served until
+# STALE_SECONDS (e.g. while SSO is unreachable).
 PROFILE_COMPLETION_REMINDER_CACHE_SECONDS = int(
     os.getenv('PROFILE_COMPLETION_REMINDER_CACHE_SECONDS', '300'),
 )
+PROFILE_COMPLETION_REMINDER_STALE_SECONDS = int(
+    os.getenv('PROFILE_COMPLETION_REMINDER_STALE_SECONDS', '86400'),
+)
+# MFA + passkey status per user (/auth/api/security-status/); dropped when either changes
+SECURITY_STATUS_CACHE_SECONDS = int(os.getenv('SECURITY_STATUS_CACHE_SECONDS', '60'))
 
 # OpenStreetMap tile proxy — https://operations.osmfoundation.org/policies/tiles/
 # Browser requests cannot set a custom User-Agent; we fetch tiles server-side with
@@ -226,8 +324,25 @@ OSM_TILE_REFERER = os.getenv(
 ).strip().rstrip('/')
 OSM_TILE_MAX_ZOOM = int(os.getenv('OSM_TILE_MAX_ZOOM', '19'))
 OSM_TILE_UPSTREAM_TIMEOUT = float(os.getenv('OSM_TILE_UPSTREAM_TIMEOUT', '15'))
+# Keep-alive connections per worker process to the tile upstream (requests block when all are busy)
+OSM_TILE_UPSTREAM_POOL_SIZE = int(os.getenv('OSM_TILE_UPSTREAM_POOL_SIZE', '8'))
 OSM_TILE_CLIENT_CACHE_SECONDS = int(os.getenv('OSM_TILE_CLIENT_CACHE_SECONDS', str(7 * 24 * 3600)))
 
+# Shared on-disk tile cache (z/x/y.png + metadata). Tiles older than TILE_CACHE_MAX_AGE_SECONDS
+# are refetched; unused or least recently used tiles are evicted beyond TILE_CACHE_MAX_BYTES
+# by the export worker every TILE_CACHE_EVICT_SECONDS (or manage.py evict_tiles).
+TILE_CACHE_ROOT = os.getenv('TILE_CACHE_ROOT', str(BASE_DIR / 'var' / 'tiles'))
+TILE_CACHE_MAX_BYTES = int(os.getenv('TILE_CACHE_MAX_BYTES', str(1024 * 1024 * 1024)))
+TILE_CACHE_MAX_AGE_SECONDS = int(os.getenv('TILE_CACHE_MAX_AGE_SECONDS', str(7 * 24 * 3600)))
+TILE_CACHE_EVICT_SECONDS = int(os.getenv('TILE_CACHE_EVICT_SECONDS', '3600'))
+
+# Admin dashboard map: points are grid-clustered below this zoom; a 256px tile is split
+# into MAP_POINTS_GRID_CELLS_PER_TILE cells per side.
+MAP_POINTS_CLUSTER_MAX_ZOOM = int(os.getenv('MAP_POINTS_CLUSTER_MAX_ZOOM', '16'))
+MAP_POINTS_GRID_CELLS_PER_TILE = int(os.getenv('MAP_POINTS_GRID_CELLS_PER_TILE', '4'))
+# Activities read per map-points request (newest first); the response says when more matched
+MAP_POINTS_MAX_ACTIVITIES = int(os.getenv('MAP_POINTS_MAX_ACTIVITIES', '5000'))
+
 # Send Referrer-Policy so cross-origin requests can include origin (tile compliance when not proxied).
 SECURE_REFERRER_POLICY = os.getenv(
     'SECURE_REFERRER_POLICY',
@@ -1,9 +1,12 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
 from django.urls import path, reverse
 from django.http import HttpResponse
 from django.shortcuts import render
+from django.utils.html import format_html
+from dashboard.export_jobs import create_report_bundle_job
 from .models import Company, Employee
-import openpyxl
+from .reports import employee_report_filename, write_employee_report
 from datetime import datetime
 
 
@@ -36,6 +39,7 @@ class EmployeeAdmin(admin.ModelAdmin):
     search_fields = ('full_name', 'employee_id', 'user__email', 'user__sso_id', 'position')
     ordering = ('full_name',)
     readonly_fields = ('created_at', 'updated_at')
+    actions = ['download_report_bundle']
     
     fieldsets = (
         (None, {
@@ -80,10 +84,6 @@ class EmployeeAdmin(admin.ModelAdmin):
 
     def generate_report_view(self, request, employee_id):
         employee = self.get_object(request, employee_id)
-        from activities.models import DailyActivity
-        import pytz
-        from django.utils import timezone
-        jakarta_tz = pytz.timezone('Asia/Jakarta')
         if request.method == 'POST':
             start_date = request.POST.get('start_date')
             end_date = request.POST.get('end_date')
@@ -94,85 +94,50 @@ class EmployeeAdmin(admin.ModelAdmin):
             except Exception:
                 return render(request, 'admin/employee_generate_report.html', {'employee': employee, 'error': 'Invalid date format.'})
 
-            # Query all daily activities for this employee in the date range
-            activities = DailyActivity.objects.filter(
-                user=employee.user,
-                date__gte=start_date_obj,
-                date__lte=end_date_obj
-            ).prefetch_related('planned_activities', 'daily_goals', 'additional_activities').order_by('date')
-
             response = HttpResponse(
                 content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
             )
-            response['Content-Disposition'] = f'attachment; filename=activity_report_{employee.full_name}_{start_date}_to_{end_date}.xlsx'
-
-            wb = openpyxl.Workbook()
-            ws = wb.active
-            ws.title = 'Daily Activities'
-
-            # Header
-            ws.append([
-                'Date', 'Status', 'Attendance', 'Check-in', 'Check-out', 'Work Duration',
-                'Morning Problems', 'Afternoon Problems', 'Notes',
-                'Planned Activities', 'Activity Status', 'Activity Priority', 'Activity Reasons',
-                'Daily Goals', 'Goal Status', 'Goal Priority', 'Target', 'Achieved', 'Completion %', 'Goal Reasons',
-                'Additional Activities', 'Add. Category', 'Add. Status', 'Add. Duration', 'Add. Impact'
-            ])
-
-            for activity in activities:
-                planned_activities = list(activity.planned_activities.all())
-                daily_goals = list(activity.daily_goals.all())
-                additional_activities = list(activity.additional_activities.all())
-
-                # Convert check-in/out to Asia/Jakarta
-                if activity.checkin_time:
-                    checkin_local = timezone.localtime(activity.checkin_time, jakarta_tz)
-                    checkin_str = checkin_local.strftime('%H:%M')
-                else:
-                    checkin_str = ''
-                if activity.checkout_time:
-                    checkout_local = timezone.localtime(activity.checkout_time, jakarta_tz)
-                    checkout_str = checkout_local.strftime('%H:%M')
-                else:
-                    checkout_str = ''
-
-                max_rows = max(1, len(planned_activities), len(daily_goals), len(additional_activities))
-                for i in range(max_rows):
-                    pa = planned_activities[i] if i < len(planned_activities) else None
-                    dg = daily_goals[i] if i < len(daily_goals) else None
-                    aa = additional_activities[i] if i < len(additional_activities) else None
-                    ws.append([
-                        activity.date.strftime('%Y-%m-%d') if i == 0 else '',
-                        activity.get_status_display() if i == 0 else '',
-                        activity.get_attendance_status_display() if i == 0 else '',
-                        checkin_str if i == 0 else '',
-                        checkout_str if i == 0 else '',
-                        str(activity.work_duration) if i == 0 and activity.work_duration else '',
-                        activity.morning_problems if i == 0 else '',
-                        activity.afternoon_problems if i == 0 else '',
-                        activity.notes if i == 0 else '',
-                        pa.title if pa else '',
-                        pa.get_status_display() if pa else '',
-                        pa.get_priority_display() if pa else '',
-                        pa.reasons if pa else '',
-                        dg.title if dg else '',
-                        dg.get_status_display() if dg else '',
-                        dg.get_priority_display() if dg else '',
-                        dg.target_value if dg else '',
-                        dg.achieved_value if dg else '',
-                        dg.completion_percentage if dg else '',
-                        dg.reasons if dg else '',
-                        aa.title if aa else '',
-                        aa.get_category_display() if aa else '',
-                        aa.get_status_display() if aa else '',
-                        str(aa.duration) if aa and aa.duration else '',
-                        aa.impact_on_planned_work if aa else '',
-                    ])
-
-            wb.save(response)
+            response['Content-Disposition'] = f'attachment; filename={employee_report_filename(employee, start_date, end_date)}'
+            write_employee_report(employee, start_date_obj, end_date_obj, response)
             return response
         return render(request, 'admin/employee_generate_report.html', {'employee': employee})
 
+    @admin.action(description='Download activity reports (ZIP)')
+    def download_report_bundle(self, request, queryset):
+        """
+        Ask for a date range, then queue a ZIP with one workbook per selected employee.
+        The export worker builds it; the message links to its download.
+        """
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Download activity reports',
+            'employees': queryset,
+            'action_checkbox_name': ACTION_CHECKBOX_NAME,
+            'opts': self.model._meta,
+        }
+        if 'apply' in request.POST:
+            try:
+                start_date = datetime.strptime(request.POST.get('start_date', ''), '%Y-%m-%d').date()
+                end_date = datetime.strptime(request.POST.get('end_date', ''), '%Y-%m-%d').date()
+            except ValueError:
+                context['error'] = 'Invalid date format.'
+                return render(request, 'admin/employee_report_bundle.html', context)
+            if start_date > end_date:
+                context['error'] = 'Start date must not be after end date.'
+                return render(request, 'admin/employee_report_bundle.html', context)
+
+            employee_ids = list(queryset.values_list('id', flat=True))
+            job = create_report_bundle_job(request.user, employee_ids, start_date, end_date)
+            self.message_user(request, format_html(
+                'Report bundle for {} employee(s) queued. <a href="{}">Download it</a> once '
+                '<a href="{}">its status</a> shows completed.',
+                len(employee_ids),
+                reverse('dashboard:export_job_download', args=[job.id]),
+                reverse('dashboard:export_job_status', args=[job.id]),
+            ), messages.SUCCESS)
+            return None
+        return render(request, 'admin/employee_report_bundle.html', context)
+
     def change_view(self, request, object_id, form_url='', extra_context=None):
         if extra_context is None:
             extra_context = {}
@@ -0,0 +1,51 @@
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from employees.models import Employee
+from employees.reports import iter_report_bundle, report_bundle_filename
+
+
+class Command(BaseCommand):
+    help = 'Write a ZIP of per-employee activity report workbooks for a company or a set of employees'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, help='Company id: report every employee of the company')
+        parser.add_argument('--employee', type=int, action='append', default=[], help='Employee id (repeatable)')
+        parser.add_argument('--start-date', required=True, help='First date (YYYY-MM-DD)')
+        parser.add_argument('--end-date', required=True, help='Last date (YYYY-MM-DD)')
+        parser.add_argument('--output', help='ZIP path (default: activity_reports_<start>_to_<end>.zip)')
+        parser.add_argument('--workers', type=int, help='Worker processes (default: REPORT_BUNDLE_WORKERS)')
+
+    def handle(self, *args, **options):
+        start_date = self._parse_date(options['start_date'])
+        end_date = self._parse_date(options['end_date'])
+        if start_date > end_date:
+            raise CommandError('--start-date must not be after --end-date')
+        if not options['company'] and not options['employee']:
+            raise CommandError('Pass --company and/or --employee')
+
+        employees = Employee.objects.none()
+        if options['company']:
+            employees |= Employee.objects.filter(company_id=options['company'])
+        if options['employee']:
+            employees |= Employee.objects.filter(id__in=options['employee'])
+        employee_ids = list(employees.values_list('id', flat=True).distinct())
+        if not employee_ids:
+            raise CommandError('No matching employees')
+
+        output = options['output'] or report_bundle_filename(start_date, end_date)
+        started = time.monotonic()
+        with open(output, 'wb') as fh:
+            for chunk in iter_report_bundle(employee_ids, start_date, end_date, options['workers']):
+                fh.write(chunk)
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {len(employee_ids)} reports to {output} in {time.monotonic() - started:.1f}s.'
+        ))
+
+    def _parse_date(self, value):
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f'Invalid date: {value} (expected YYYY-MM-DD)')
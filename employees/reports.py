@@ -0,0 +1,192 @@
+"""
+Per-employee activity report workbooks, singly or bundled into a ZIP.
+
+A bundle renders its workbooks in a ProcessPoolExecutor: employee ids are split into
+batches, each worker process renders its batches over its own database connection,
+and finished workbooks are added to the ZIP (streamed to the caller) as they arrive.
+
+The pool forks and closes this process's database connections, so bundles are only
+built in single-threaded processes: the export worker (admin action) and
+`manage.py generate_report_bundle`, never in a web server thread.
+"""
+import multiprocessing
+import os
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+import openpyxl
+import pytz
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+
+from activities.models import DailyActivity
+from dashboard.exports import EXPORT_QUERY_CHUNK_SIZE
+
+from .models import Employee
+
+REPORT_HEADERS = [
+    'Date', 'Status', 'Attendance', 'Check-in', 'Check-out', 'Work Duration',
+    'Morning Problems', 'Afternoon Problems', 'Notes',
+    'Planned Activities', 'Activity Status', 'Activity Priority', 'Activity Reasons',
+    'Daily Goals', 'Goal Status', 'Goal Priority', 'Target', 'Achieved', 'Completion %', 'Goal Reasons',
+    'Additional Activities', 'Add. Category', 'Add. Status', 'Add. Duration', 'Add. Impact'
+]
+
+JAKARTA_TZ = pytz.timezone('Asia/Jakarta')
+
+
+def employee_report_filename(employee, start_date, end_date):
+    return f'activity_report_{employee.full_name}_{start_date}_to_{end_date}.xlsx'
+
+
+def write_employee_report(employee, start_date, end_date, target):
+    """Write one employee's daily activities in the date range to an xlsx saved to target"""
+    # Query all daily activities for this employee in the date range
+    activities = DailyActivity.objects.filter(
+        user=employee.user,
+        date__gte=start_date,
+        date__lte=end_date
+    ).prefetch_related('planned_activities', 'daily_goals', 'additional_activities').order_by('date')
+
+    # Write-only: rows are streamed to disk instead of kept in memory
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet('Daily Activities')
+    ws.append(REPORT_HEADERS)
+
+    for activity in activities.iterator(chunk_size=EXPORT_QUERY_CHUNK_SIZE):
+        planned_activities = list(activity.planned_activities.all())
+        daily_goals = list(activity.daily_goals.all())
+        additional_activities = list(activity.additional_activities.all())
+
+        # Convert check-in/out to Asia/Jakarta
+        if activity.checkin_time:
+            checkin_local = timezone.localtime(activity.checkin_time, JAKARTA_TZ)
+            checkin_str = checkin_local.strftime('%H:%M')
+        else:
+            checkin_str = ''
+        if activity.checkout_time:
+            checkout_local = timezone.localtime(activity.checkout_time, JAKARTA_TZ)
+            checkout_str = checkout_local.strftime('%H:%M')
+        else:
+            checkout_str = ''
+
+        max_rows = max(1, len(planned_activities), len(daily_goals), len(additional_activities))
+        for i in range(max_rows):
+            pa = planned_activities[i] if i < len(planned_activities) else None
+            dg = daily_goals[i] if i < len(daily_goals) else None
+            aa = additional_activities[i] if i < len(additional_activities) else None
+            ws.append([
+                activity.date.strftime('%Y-%m-%d') if i == 0 else '',
+                activity.get_status_display() if i == 0 else '',
+                activity.get_attendance_status_display() if i == 0 else '',
+                checkin_str if i == 0 else '',
+                checkout_str if i == 0 else '',
+                str(activity.work_duration) if i == 0 and activity.work_duration else '',
+                activity.morning_problems if i == 0 else '',
+                activity.afternoon_problems if i == 0 else '',
+                activity.notes if i == 0 else '',
+                pa.title if pa else '',
+                pa.get_status_display() if pa else '',
+                pa.get_priority_display() if pa else '',
+                pa.reasons if pa else '',
+                dg.title if dg else '',
+                dg.get_status_display() if dg else '',
+                dg.get_priority_display() if dg else '',
+                dg.target_value if dg else '',
+                dg.achieved_value if dg else '',
+                dg.completion_percentage if dg else '',
+                dg.reasons if dg else '',
+                aa.title if aa else '',
+                aa.get_category_display() if aa else '',
+                aa.get_status_display() if aa else '',
+                str(aa.duration) if aa and aa.duration else '',
+                aa.impact_on_planned_work if aa else '',
+            ])
+
+    wb.save(target)
+
+
+def _render_batch(employee_ids, start_date, end_date, out_dir):
+    """Render a batch of employee workbooks into out_dir; returns [(zip name, path)]"""
+    rendered = []
+    for employee in Employee.objects.select_related('user').filter(id__in=employee_ids).order_by('id'):
+        # employee_id keeps names unique inside the ZIP
+        name = get_valid_filename(f'{employee.employee_id}_{employee_report_filename(employee, start_date, end_date)}')
+        path = os.path.join(out_dir, name)
+        write_employee_report(employee, start_date, end_date, path)
+        rendered.append((name, path))
+    return rendered
+
+
+def render_employee_reports(employee_ids, start_date, end_date, out_dir, workers=None):
+    """
+    Yield (zip name, path) for each employee's workbook as it is written to out_dir.
+    workers defaults to REPORT_BUNDLE_WORKERS (0 = one per CPU); with 1 the reports are
+    rendered in this process.
+    """
+    workers = settings.REPORT_BUNDLE_WORKERS if workers is None else workers
+    workers = workers or os.cpu_count() or 1
+    batch_size = settings.REPORT_BUNDLE_BATCH_SIZE
+    employee_ids = sorted(employee_ids)
+    batches = [employee_ids[i:i + batch_size] for i in range(0, len(employee_ids), batch_size)]
+
+    if workers <= 1 or len(batches) <= 1:
+        for batch in batches:
+            yield from _render_batch(batch, start_date, end_date, out_dir)
+        return
+
+    # Forked workers must not share this process's connections; they open their own
+    connections.close_all()
+    pool = ProcessPoolExecutor(
+        max_workers=min(workers, len(batches)),
+        mp_context=multiprocessing.get_context(settings.REPORT_BUNDLE_START_METHOD or None),
+        # Loads the app registry in spawn/forkserver workers before any task (and this
+        # module's model imports) is unpickled; harmless after fork
+        initializer=django.setup,
+    )
+    try:
+        futures = [pool.submit(_render_batch, batch, start_date, end_date, out_dir) for batch in batches]
+        for future in as_completed(futures):
+            yield from future.result()
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+
+class _ZipStream:
+    """Unseekable file-like sink for zipfile; drain() returns what was written since the last call"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_report_bundle(employee_ids, start_date, end_date, workers=None):
+    """ZIP of per-employee report workbooks, yielded in pieces as each workbook is added"""
+    stream = _ZipStream()
+    with tempfile.TemporaryDirectory(prefix='report-bundle-') as out_dir:
+        # xlsx files are already deflated, so they are stored as-is
+        with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_STORED) as bundle:
+            for name, path in render_employee_reports(employee_ids, start_date, end_date, out_dir, workers):
+                bundle.write(path, name)
+                os.remove(path)
+                yield stream.drain()
+    yield stream.drain()
+
+
+def report_bundle_filename(start_date, end_date):
+    return f'activity_reports_{start_date}_to_{end_date}.zip'
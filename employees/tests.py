@@ -1,3 +1,130 @@
-from django.test import TestCase
+import io
+import os
+import shutil
+import tempfile
+import zipfile
+from concurrent.futures import Future
+from datetime import date
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+import openpyxl
+
+from activities.models import DailyActivity
+from dashboard.export_jobs import claim_next_job, run_export_job
+from dashboard.models import ExportJob
+
+from .models import Company, Employee
+from .reports import iter_report_bundle
+
+User = get_user_model()
+
+
+class _InlineProcessPool:
+    """ProcessPoolExecutor stand-in running each batch in this process (the test database is not shared)"""
+
+    instances = []
+
+    def __init__(self, max_workers, mp_context, initializer):
+        self.max_workers = max_workers
+        self.batches = []
+        self.shut_down = False
+        self.instances.append(self)
+
+    def submit(self, fn, *args):
+        self.batches.append(args[0])
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+    def shutdown(self, cancel_futures=False):
+        self.shut_down = True
+
+
+class ReportBundleTests(TestCase):
+    """Multi-employee report ZIP"""
+
+    def setUp(self):
+        company = Company.objects.create(name='Arnatech', code='ARN')
+        self.employees = []
+        for n in range(3):
+            user = User.objects.create(sso_id=f'emp{n}', email=f'emp{n}@example.com')
+            self.employees.append(Employee.objects.create(
+                user=user, employee_id=f'E{n}', full_name=f'Emp {n}', company=company,
+                position='Engineer', hire_date=date(2025, 1, 1),
+            ))
+            for day in range(1, n + 2):
+                DailyActivity.objects.create(user=user, date=date(2025, 3, day), checkin_location='-6.2,106.8')
+
+    def test_one_workbook_per_employee(self):
+        data = b''.join(iter_report_bundle(
+            [e.id for e in self.employees], date(2025, 3, 1), date(2025, 3, 31), workers=1,
+        ))
+
+        bundle = zipfile.ZipFile(io.BytesIO(data))
+        self.assertEqual(len(bundle.namelist()), 3)
+        name = next(n for n in bundle.namelist() if n.startswith('E2_'))
+        sheet = openpyxl.load_workbook(io.BytesIO(bundle.read(name)))['Daily Activities']
+        self.assertEqual(sheet.max_row, 4)  # header + 3 days
+
+    @override_settings(REPORT_BUNDLE_BATCH_SIZE=2)
+    def test_workers_render_batches_in_a_pool(self):
+        _InlineProcessPool.instances.clear()
+        with mock.patch('employees.reports.ProcessPoolExecutor', _InlineProcessPool), \
+                mock.patch('employees.reports.connections.close_all') as close_all:
+            data = b''.join(iter_report_bundle(
+                [e.id for e in self.employees], date(2025, 3, 1), date(2025, 3, 31), workers=4,
+            ))
+
+        pool, = _InlineProcessPool.instances
+        # Two batches of at most two employees, so two workers; connections are not inherited
+        self.assertEqual(pool.max_workers, 2)
+        self.assertEqual([len(batch) for batch in pool.batches], [2, 1])
+        self.assertTrue(pool.shut_down)
+        close_all.assert_called_once()
+        self.assertEqual(len(zipfile.ZipFile(io.BytesIO(data)).namelist()), 3)
+
+
+class ReportBundleActionTests(TestCase):
+    """The admin action queues the bundle for the export worker instead of rendering it in the request"""
+
+    def setUp(self):
+        self.export_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.export_root, ignore_errors=True)
+        settings_override = override_settings(EXPORT_ROOT=self.export_root, REPORT_BUNDLE_WORKERS=1)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.admin = User.objects.create(sso_id='admin', email='admin@example.com', is_staff=True, is_superuser=True)
+        self.client.force_login(self.admin)
+        company = Company.objects.create(name='Arnatech', code='ARN')
+        user = User.objects.create(sso_id='emp', email='emp@example.com')
+        self.employee = Employee.objects.create(
+            user=user, employee_id='E1', full_name='Emp', company=company,
+            position='Engineer', hire_date=date(2025, 1, 1),
+        )
+        DailyActivity.objects.create(user=user, date=date(2025, 3, 3), checkin_location='-6.2,106.8')
+
+    def test_action_queues_a_job_the_worker_builds(self):
+        response = self.client.post(reverse('admin:employees_employee_changelist'), {
+            'action': 'download_report_bundle',
+            '_selected_action': [self.employee.pk],
+            'start_date': '2025-03-01',
+            'end_date': '2025-03-31',
+            'apply': '1',
+        })
+        self.assertEqual(response.status_code, 302)
+        job = ExportJob.objects.get(kind='report_bundle')
+        self.assertEqual(job.employee_ids, [self.employee.pk])
+
+        self.assertTrue(run_export_job(claim_next_job()))
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.rows_processed), ('completed', 1))
+        response = self.client.get(reverse('dashboard:export_job_download', args=[job.id]))
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        bundle = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(len(bundle.namelist()), 1)
+        self.assertTrue(os.path.exists(job.file_abspath))